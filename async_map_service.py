@@ -0,0 +1,344 @@
+"""
+    Name: async_map_service.py
+    Author:
+    Created:
+    Purpose: asyncio version of MapService for async backends
+    Many lookups run concurrently on one shared HTTP client
+    15,000 requests per month
+"""
+import asyncio
+import json
+import time
+from collections import deque
+# pip install aiohttp
+import aiohttp
+from api_key import API_KEY, GEOCODE_ENDPOINT, MAP_ENDPOINT
+from map_cache import (
+    GeocodeCache, ImageCache, decode_image, normalize_query)
+from map_service import (
+    LocationNotFound, parse_location, map_params, rebase)
+from quota import QuotaTracker, TokenBucket
+from single_flight import AsyncSingleFlight
+
+# Responses that are worth retrying
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class AsyncMapService:
+    """
+    An asyncio counterpart to MapService.
+    geocode_location and get_static_map are coroutines sharing one
+    aiohttp session, a semaphore caps how many requests are in flight.
+    Use it as an async context manager so the session is closed:
+
+        async with AsyncMapService() as service:
+            results = await service.geocode_many(addresses)
+    """
+
+    def __init__(self, geocode_cache=None, image_cache=None,
+                 concurrency=10, connect_timeout=3.05, read_timeout=10,
+                 retries=3, backoff_factor=0.5, quota=None,
+                 rate_limiter=None, base_url=None, coalesce=True):
+        """
+        Initialize the AsyncMapService.
+
+        Args:
+            geocode_cache (GeocodeCache): Cache for geocode results,
+                None uses the default on-disk cache, False disables caching
+            image_cache (ImageCache): Cache for static map images,
+                None uses the default on-disk cache, False disables caching
+            concurrency (int): Maximum number of requests in flight
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait between response bytes
+            retries (int): Retries on connection errors and 429/5xx responses
+            backoff_factor (float): Base delay for exponential retry backoff
+            quota (QuotaTracker): Monthly usage counter, None uses the
+                default persisted counter, False disables quota tracking
+            rate_limiter (TokenBucket): Limits requests per second,
+                None uses a default bucket, False disables rate limiting
+            base_url (str): Send requests to another server with the
+                same API, such as a local stand-in for testing
+            coalesce (bool): Tasks asking for the same geocode or map
+                at the same time share one request
+        """
+        # Default dimensions for the map image
+        self.width = 800
+        self.height = 600
+
+        # API endpoints
+        self.geocode_endpoint = rebase(GEOCODE_ENDPOINT, base_url)
+        self.map_endpoint = rebase(MAP_ENDPOINT, base_url)
+
+        if geocode_cache is None:
+            geocode_cache = GeocodeCache()
+        elif geocode_cache is False:
+            geocode_cache = None
+        self.geocode_cache = geocode_cache
+
+        if image_cache is None:
+            image_cache = ImageCache()
+        elif image_cache is False:
+            image_cache = None
+        self.image_cache = image_cache
+
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+        # Created on first use, inside the running event loop
+        self._semaphore = None
+        self._session = None
+
+        # Timing of the most recent requests, newest last
+        self.timings = deque(maxlen=100)
+
+        if quota is None:
+            quota = QuotaTracker()
+        elif quota is False:
+            quota = None
+        self.quota = quota
+
+        if rate_limiter is None:
+            rate_limiter = TokenBucket()
+        elif rate_limiter is False:
+            rate_limiter = None
+        self.rate_limiter = rate_limiter
+
+        # Identical lookups in flight at once share one request
+        self.flights = AsyncSingleFlight() if coalesce else None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ------------------------------- GET -------------------------------- #
+    async def _get(self, url, params, kind):
+        """
+        Make a GET request on the shared session and record its timing.
+
+        Args:
+            url (str): Endpoint to call
+            params (dict): Query parameters, without the API key
+            kind (str): Label for the timing record (geocode, map, ...)
+
+        Returns:
+            bytes: The raw response body
+
+        Raises:
+            QuotaExceeded: If the monthly quota has been used up
+            aiohttp.ClientError: If the request fails after all retries,
+                at once for an error status that is not worth retrying
+        """
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.concurrency)
+            )
+
+        # aiohttp rejects non-string query values
+        query = {'key': API_KEY}
+        query.update({name: str(value) for name, value in params.items()})
+
+        async with self._semaphore:
+            # Check and count in one step, off the event loop
+            if self.quota is not None:
+                await asyncio.to_thread(self.quota.reserve, kind)
+
+            # Wait for a token without blocking the event loop
+            if self.rate_limiter is not None:
+                while True:
+                    wait = self.rate_limiter.try_acquire()
+                    if wait == 0:
+                        break
+                    await asyncio.sleep(wait)
+
+            start = time.perf_counter()
+            attempt = 0
+            # Every attempt the server answered is a transaction
+            answered = 0
+            try:
+                while True:
+                    try:
+                        async with self._session.get(url, params=query) \
+                                as response:
+                            body = await response.read()
+                    except (aiohttp.ClientConnectionError,
+                            aiohttp.ClientPayloadError,
+                            asyncio.TimeoutError):
+                        if attempt >= self.retries:
+                            raise
+                    else:
+                        answered += 1
+                        # Only overload and server errors are retried,
+                        # a bad request or key fails the same way again
+                        if response.status not in RETRY_STATUS \
+                                or attempt >= self.retries:
+                            response.raise_for_status()
+                            break
+
+                    # Exponential backoff between attempts
+                    await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+                    attempt += 1
+            finally:
+                # One attempt was reserved, a request that never got an
+                # answer gives it back
+                if self.quota is not None and answered != 1:
+                    await asyncio.to_thread(
+                        self.quota.record, kind, answered - 1)
+
+            self.timings.append({
+                'kind': kind,
+                'status': response.status,
+                'total': time.perf_counter() - start,
+                'bytes': len(body),
+                'retries': attempt
+            })
+            return body
+
+    # ----------------------- GEOCODE LOCATION --------------------------- #
+    async def geocode_location(self, location):
+        """
+        Convert a location string into geographical coordinates
+        and address details.
+
+        Args:
+            location (str): A location string (e.g., "New York, NY" or
+            "1600 Pennsylvania Ave")
+
+        Returns:
+            GeocodeResult: Coordinates and address components
+                 Returns None if location cannot be found
+
+        Raises:
+            Exception: If the API request fails or returns an error
+        """
+        if self.geocode_cache is not None:
+            # A miss reads SQLite, off the event loop
+            cached = await asyncio.to_thread(
+                self.geocode_cache.get, location)
+            if cached is not None:
+                return cached
+
+        return await self._coalesce(
+            ('geocode', normalize_query(location)),
+            self._fetch_geocode, location)
+
+    async def _fetch_geocode(self, location):
+        """Geocode a location with the API, the cache miss path."""
+        params = {
+            'location': location,
+            'maxResults': 1  # We only need the best match
+        }
+
+        try:
+            data = json.loads(
+                await self._get(self.geocode_endpoint, params, 'geocode'))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Geocoding failed: {str(e)}")
+
+        if data['results'] and data['results'][0]['locations']:
+            result = parse_location(data['results'][0]['locations'][0])
+            if self.geocode_cache is not None:
+                # SQLite insert and commit, off the event loop
+                await asyncio.to_thread(
+                    self.geocode_cache.put, location, result)
+            return result
+        return None
+
+    # ------------------------- GEOCODE MANY ----------------------------- #
+    async def geocode_many(self, locations):
+        """
+        Geocode many locations concurrently.
+
+        Args:
+            locations (list): Location strings
+
+        Returns:
+            list: Location data (or None) for each location, in input order.
+            A lookup that failed holds its Exception instead of raising,
+            so one bad address does not cancel the rest.
+        """
+        return await asyncio.gather(
+            *(self.geocode_location(location) for location in locations),
+            return_exceptions=True
+        )
+
+    # ------------------------- GET STATIC MAP --------------------------- #
+    async def get_static_map(self, location, zoom, map_type):
+        """
+        Retrieve a static map image for a given location.
+
+        Args:
+            location (str): Location string to map
+            zoom (str/int): Zoom level (1-20)
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+
+        Returns:
+            tuple: (PIL.Image, GeocodeResult) - The map image and the
+            location
+
+        Raises:
+            LocationNotFound: If the location cannot be found
+            Exception: If the map cannot be retrieved
+        """
+        location_data = await self.geocode_location(location)
+        if not location_data:
+            raise LocationNotFound()
+
+        params = map_params(
+            location_data, self.width, self.height, zoom, map_type)
+
+        cache_key = ImageCache.key(**params)
+        if self.image_cache is not None:
+            # SQLite read and PNG decode, off the event loop
+            image = await asyncio.to_thread(self.image_cache.get, cache_key)
+            if image is not None:
+                return image, location_data
+
+        image = await self._coalesce(
+            ('map', cache_key), self._fetch_map, params, cache_key)
+        return image, location_data
+
+    async def _fetch_map(self, params, cache_key):
+        """Download and decode a static map, the cache miss path."""
+        try:
+            body = await self._get(self.map_endpoint, params, 'map')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch map: {str(e)}")
+
+        # Decoding the PNG is CPU work, keep it off the event loop
+        if self.image_cache is not None:
+            image = await asyncio.to_thread(
+                self.image_cache.put, cache_key, body)
+        else:
+            image = await asyncio.to_thread(decode_image, body)
+        return image
+
+    # ----------------------------- COALESCE ----------------------------- #
+    async def _coalesce(self, key, func, *args):
+        """
+        Await a lookup, sharing it with tasks that want the same key.
+
+        Args:
+            key (tuple): Normalized request parameters
+            func (callable): Coroutine function that makes the request
+            *args: Arguments for func
+
+        Returns:
+            The result of func, possibly from another task's call
+        """
+        if self.flights is None:
+            return await func(*args)
+        result, _ = await self.flights.do(key, func, *args)
+        return result
@@ -0,0 +1,168 @@
+"""
+    Name: batch_geocode.py
+    Author:
+    Created:
+    Purpose: Geocode a CSV or JSONL file of addresses
+    Uses the MapQuest batch endpoint, up to 100 addresses per request
+    Results are written as they arrive so large files stream through
+
+    python batch_geocode.py addresses.csv results.csv --column address
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import deque
+from map_service import MapService, MAX_BATCH_SIZE
+
+# Columns added to every output row
+RESULT_FIELDS = [
+    'latitude', 'longitude', 'street', 'city', 'state', 'postal_code'
+]
+
+
+# ----------------------------- READ ROWS -------------------------------- #
+def read_rows(path):
+    """
+    Stream rows from a CSV or JSONL file.
+
+    Args:
+        path (str): Input file, .jsonl/.ndjson is read as JSON lines,
+            anything else as CSV with a header row
+
+    Yields:
+        dict: One row at a time
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+
+# ---------------------------- ROW WRITER -------------------------------- #
+class RowWriter:
+    """
+    Writes result rows to a CSV or JSONL file, one row at a time.
+    The CSV header is taken from the first row written.
+    """
+
+    def __init__(self, path):
+        """
+        Open the output file.
+
+        Args:
+            path (str): Output file, .jsonl/.ndjson is written as
+                JSON lines, anything else as CSV
+        """
+        self.jsonl = path.lower().endswith(('.jsonl', '.ndjson'))
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = None
+
+    def write(self, row):
+        """Write one row and flush it so progress is never lost."""
+        if self.jsonl:
+            self.file.write(json.dumps(row) + '\n')
+        else:
+            if self.writer is None:
+                self.writer = csv.DictWriter(
+                    self.file, fieldnames=list(row), extrasaction='ignore')
+                self.writer.writeheader()
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        """Close the output file."""
+        self.file.close()
+
+
+# ------------------------------ GEOCODE --------------------------------- #
+def geocode_file(service, input_path, output_path, column='address',
+                 batch_size=MAX_BATCH_SIZE, max_workers=4):
+    """
+    Geocode every row of input_path and write the rows to output_path.
+
+    Args:
+        service (MapService): Service used for the lookups
+        input_path (str): CSV or JSONL file of addresses
+        output_path (str): CSV or JSONL file for the results
+        column (str): Column or key that holds the address
+        batch_size (int): Addresses per batch request (1-100)
+        max_workers (int): Number of batch requests in flight
+
+    Returns:
+        tuple: (int, int) - Rows written and rows that were not found
+    """
+    # Rows waiting for their result, in input order
+    rows = deque()
+
+    def addresses():
+        """Yield each address, remembering its row for the output."""
+        for row in read_rows(input_path):
+            rows.append(row)
+            yield str(row.get(column) or '')
+
+    writer = RowWriter(output_path)
+    written = not_found = 0
+    try:
+        for _, result in service.geocode_many(
+                addresses(), batch_size=batch_size, max_workers=max_workers):
+            row = rows.popleft()
+            if result is None:
+                not_found += 1
+                result = {}
+            for field in RESULT_FIELDS:
+                row[field] = result.get(field)
+            writer.write(row)
+            written += 1
+    finally:
+        writer.close()
+
+    return written, not_found
+
+
+def main():
+    """Parse the command line and geocode the file."""
+    parser = argparse.ArgumentParser(
+        description="Geocode a CSV or JSONL file of addresses with MapQuest")
+    parser.add_argument("input", help="CSV or JSONL file of addresses")
+    parser.add_argument("output", help="CSV or JSONL file for the results")
+    parser.add_argument(
+        "--column", default="address",
+        help="column or key holding the address (default: address)")
+    parser.add_argument(
+        "--batch-size", type=int, default=MAX_BATCH_SIZE,
+        help="addresses per request, 1-100 (default: 100)")
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="batch requests in flight (default: 4)")
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="serve Prometheus metrics on this port while running")
+    args = parser.parse_args()
+
+    service = MapService()
+    if args.metrics_port:
+        service.instrumentation.serve_metrics(port=args.metrics_port)
+    try:
+        written, not_found = geocode_file(
+            service,
+            args.input,
+            args.output,
+            column=args.column,
+            batch_size=args.batch_size,
+            max_workers=args.workers
+        )
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        service.close()
+
+    print(f"Geocoded {written} rows, {not_found} not found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+    Name: benchmark.py
+    Author:
+    Created:
+    Purpose: Measure MapService latency and throughput against the
+    local fake MapQuest server, so no quota is spent
+    Reports p50/p95/p99 latency, failed calls, throughput and bytes
+    transferred for single, batched, concurrent, async and update_map
+    workloads, cache on and off
+
+    python benchmark.py --requests 200 --latency 0.05 --json results.json
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fake_mapquest import FakeMapQuest
+from map_cache import GeocodeCache, ImageCache, RouteCache
+from map_service import MapService
+from map_worker import MapFetcher
+
+
+# ----------------------------- SUMMARIZE -------------------------------- #
+def summarize(name, cache, latencies, elapsed, operations, stats):
+    """
+    Turn raw timings into one result row.
+
+    Args:
+        name (str): Workload name
+        cache (bool): True if the caches were on
+        latencies (list): (seconds, ok) per timed call, failed calls
+            count toward the latencies too
+        elapsed (float): Wall time of the whole workload in seconds
+        operations (int): Number of addresses handled
+        stats (dict): Fake server counters for the workload
+
+    Returns:
+        dict: The result row
+    """
+    failed = sum(not ok for _, ok in latencies)
+    latencies = [seconds for seconds, _ in latencies]
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+
+    return {
+        "workload": name,
+        "cache": cache,
+        "operations": operations,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "failed": failed,
+        "throughput": operations / elapsed if elapsed else 0.0,
+        "requests": stats["requests"],
+        "errors": stats["errors"],
+        "bytes": stats["bytes"],
+    }
+
+
+def make_service(server, cache, cls=MapService, **kwargs):
+    """
+    Create a service pointed at the fake server.
+    Quota tracking and rate limiting are off so they do not skew
+    the numbers or touch the real monthly counter. Caches are in
+    memory only, and with cache off request coalescing is off too,
+    so every call reaches the server.
+    """
+    if cls is MapService:
+        # The route cache and offline pack default to files under HOME
+        kwargs.setdefault(
+            "route_cache", RouteCache(path=None) if cache else False)
+        kwargs.setdefault("offline_pack", False)
+        kwargs.setdefault(
+            "reverse_cache", GeocodeCache(path=None) if cache else False)
+    return cls(
+        base_url=server.url,
+        geocode_cache=GeocodeCache(path=None) if cache else False,
+        image_cache=ImageCache(path=None) if cache else False,
+        quota=False,
+        rate_limiter=False,
+        coalesce=cache,
+        **kwargs
+    )
+
+
+# ----------------------------- WORKLOADS -------------------------------- #
+def timed(func, *args):
+    """
+    Call func and time it, a failed call is counted, not raised.
+
+    Returns:
+        tuple: (float, bool) - Seconds and False if the call failed
+    """
+    start = time.perf_counter()
+    try:
+        func(*args)
+    except Exception:
+        return time.perf_counter() - start, False
+    return time.perf_counter() - start, True
+
+
+def run_single(service, addresses):
+    """One get_static_map at a time, like MapViewer.update_map."""
+    return [
+        timed(service.get_static_map, address, 14, "map")
+        for address in addresses
+    ]
+
+
+def run_batched(service, addresses, batch_size=100):
+    """Sequential batch geocoding, one timing per batch request."""
+    return [
+        timed(lambda batch: list(service.geocode_many(
+            batch, batch_size=batch_size, max_workers=1)),
+            addresses[start:start + batch_size])
+        for start in range(0, len(addresses), batch_size)
+    ]
+
+
+def run_concurrent(service, addresses, workers):
+    """get_static_map from a thread pool."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            lambda address: timed(
+                service.get_static_map, address, 14, "map"),
+            addresses))
+
+
+def run_async(server, cache, addresses, workers):
+    """AsyncMapService.geocode_location fanned out on one event loop."""
+    from async_map_service import AsyncMapService
+
+    async def workload():
+        async with make_service(
+                server, cache, AsyncMapService,
+                concurrency=workers) as service:
+            async def one(address):
+                start = time.perf_counter()
+                try:
+                    await service.geocode_location(address)
+                except Exception:
+                    return time.perf_counter() - start, False
+                return time.perf_counter() - start, True
+            return await asyncio.gather(*(one(a) for a in addresses))
+
+    return asyncio.run(workload())
+
+
+class HeadlessRoot:
+    """
+    Stand-in for the Tk root with only after and after_cancel, so the
+    viewer's fetch and poll loop runs without a display.
+    """
+
+    def __init__(self):
+        """Initialize an empty timer queue."""
+        self._timers = []
+        self._next_id = 0
+        self._cancelled = set()
+
+    def after(self, ms, func, *args):
+        """Schedule func(*args) in ms milliseconds."""
+        self._next_id += 1
+        heapq.heappush(self._timers, (
+            time.perf_counter() + ms / 1000, self._next_id, func, args))
+        return self._next_id
+
+    def after_cancel(self, after_id):
+        """Drop a scheduled call."""
+        self._cancelled.add(after_id)
+
+    def run_until(self, done):
+        """Run timers, sleeping between them, until done() is true."""
+        while not done() and self._timers:
+            due, after_id, func, args = heapq.heappop(self._timers)
+            if after_id in self._cancelled:
+                self._cancelled.discard(after_id)
+                continue
+            time.sleep(max(0.0, due - time.perf_counter()))
+            func(*args)
+
+
+def run_update_map(service, addresses):
+    """
+    MapViewer.update_map to the map on screen: get_static_map on the
+    MapFetcher worker, delivered by the 50 ms result poll, then the
+    image decoded as show_map does.
+    """
+    root = HeadlessRoot()
+    fetcher = MapFetcher(root)
+    latencies = []
+    try:
+        for address in addresses:
+            outcome = []
+            start = time.perf_counter()
+
+            def show_map(result):
+                # image.photo() needs a display, decode does the same work
+                result[0].decode()
+                outcome.append(True)
+
+            fetcher.submit(
+                service.get_static_map, address, 14, "map",
+                decode=False,
+                on_success=show_map,
+                on_error=lambda error: outcome.append(False)
+            )
+            root.run_until(lambda: outcome)
+            latencies.append((time.perf_counter() - start, outcome[0]))
+    finally:
+        fetcher.shutdown()
+    return latencies
+
+
+# ------------------------------- RUN ------------------------------------ #
+def run(server, addresses, workers, workloads):
+    """
+    Run every workload with the caches on and off.
+
+    Returns:
+        list: One result row per workload and cache setting
+    """
+    results = []
+    for name in workloads:
+        for cache in (False, True):
+            server.reset_stats()
+            start = time.perf_counter()
+            if name == "async":
+                latencies = run_async(server, cache, addresses, workers)
+            else:
+                service = make_service(server, cache)
+                try:
+                    if name == "single":
+                        latencies = run_single(service, addresses)
+                    elif name == "batched":
+                        latencies = run_batched(service, addresses)
+                    elif name == "update_map":
+                        latencies = run_update_map(service, addresses)
+                    else:
+                        latencies = run_concurrent(
+                            service, addresses, workers)
+                finally:
+                    service.close()
+            elapsed = time.perf_counter() - start
+            results.append(summarize(
+                name, cache, latencies, elapsed, len(addresses),
+                dict(server.stats)))
+    return results
+
+
+def print_table(results):
+    """Print the result rows as a table."""
+    print(f"{'workload':<12}{'cache':<7}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'failed':>8}{'ops/s':>10}{'requests':>10}"
+          f"{'KiB':>10}")
+    for row in results:
+        print(f"{row['workload']:<12}{'on' if row['cache'] else 'off':<7}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['failed']:>8}"
+              f"{row['throughput']:>10.1f}{row['requests']:>10}"
+              f"{row['bytes'] / 1024:>10.1f}")
+
+
+def main():
+    """Parse the command line and run the benchmarks."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark MapService against a fake MapQuest server")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="addresses per workload (default: 200)")
+    parser.add_argument("--unique", type=int, default=50,
+                        help="distinct addresses among them (default: 50)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="threads or tasks for concurrent workloads")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="fake server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02,
+                        help="extra random fake server latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of fake server 503 responses")
+    parser.add_argument("--workloads",
+                        default="single,batched,concurrent,async,update_map",
+                        help="comma separated workloads to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Repeated addresses, the way real traffic repeats locations
+    rng = random.Random(args.seed)
+    pool = [f"{n} Main St Scottsbluff NE" for n in range(args.unique)]
+    addresses = [rng.choice(pool) for _ in range(args.requests)]
+
+    with FakeMapQuest(latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, seed=args.seed) as server:
+        results = run(
+            server, addresses, args.workers, args.workloads.split(","))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
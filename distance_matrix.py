@@ -0,0 +1,149 @@
+"""
+    Name: distance_matrix.py
+    Author:
+    Created:
+    Purpose: Origin x destination road distances for dispatch
+    Great circle distances are computed locally with NumPy, pairs
+    beyond a threshold are never sent, and the rest go to the route
+    matrix endpoint in full batches and are cached per pair
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# pip install numpy
+import numpy as np
+from map_cache import MatrixCache
+from map_service import MAX_MATRIX_SIZE, ROUTE_TYPES, waypoint
+from spatial_arrays import coordinates, haversine_matrix
+
+# On-disk cache shared by every call that does not pass one
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    Return the default on-disk MatrixCache, opened by the first call.
+
+    Returns:
+        MatrixCache: The shared cache
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = MatrixCache()
+        return _default_cache
+
+
+# -------------------------- DISTANCE MATRIX ----------------------------- #
+def distance_matrix(service, origins, destinations, max_distance=None,
+                    route_type='fastest', cache=None, max_workers=4):
+    """
+    Road distance and travel time from every origin to every destination.
+    Only pairs within max_distance in a straight line are routed, only
+    pairs that are not cached are requested, and those are sent one
+    origin at a time with up to MAX_MATRIX_SIZE - 1 destinations each.
+
+    Args:
+        service (MapService): Service used for the route matrix requests
+        origins (list): GeocodeResults or (lat, lng) pairs
+        destinations (list): GeocodeResults or (lat, lng) pairs
+        max_distance (float): Straight line meters beyond which a pair
+            is not routed, None routes every pair
+        route_type (str): fastest, shortest, pedestrian or bicycle
+        cache (MatrixCache): Cache for pair results, None uses the
+            default on-disk cache, opened once and shared by every call,
+            False disables caching
+        max_workers (int): Number of matrix requests in flight
+
+    Returns:
+        dict: straight (great circle meters), distance (road meters) and
+        time (seconds), each an origins x destinations NumPy array.
+        Road distance and time are NaN for pairs that were not routed.
+    """
+    if route_type not in ROUTE_TYPES:
+        raise ValueError(
+            f"route_type must be one of {', '.join(ROUTE_TYPES)}")
+
+    if cache is None:
+        cache = default_cache()
+    elif cache is False:
+        cache = None
+
+    instrumentation = service.instrumentation
+    origin_points = coordinates(origins)
+    destination_points = coordinates(destinations)
+
+    with instrumentation.span('matrix.haversine'):
+        straight = haversine_matrix(origin_points, destination_points)
+
+    distance = np.full(straight.shape, np.nan)
+    travel_time = np.full(straight.shape, np.nan)
+
+    # Pairs worth routing, a pair at the same point needs no request
+    wanted = np.ones(straight.shape, dtype=bool)
+    if max_distance is not None:
+        wanted &= straight <= max_distance
+    same = wanted & (straight == 0)
+    distance[same] = 0.0
+    travel_time[same] = 0.0
+    wanted &= ~same
+    instrumentation.count('matrix.pruned', int(straight.size - wanted.sum()))
+
+    # One "lat,lng" string per point, shared by the pair keys and requests
+    origin_keys = [waypoint(tuple(point)) for point in origin_points]
+    destination_keys = [
+        waypoint(tuple(point)) for point in destination_points]
+
+    def pair_key(i, j):
+        return f"{route_type}|{origin_keys[i]}|{destination_keys[j]}"
+
+    rows, columns = np.nonzero(wanted)
+    pairs = list(zip(rows.tolist(), columns.tolist()))
+
+    # Fill in every pair the cache already knows
+    cached = {}
+    if cache is not None:
+        with instrumentation.span('matrix.cache'):
+            cached = cache.get_many([pair_key(i, j) for i, j in pairs])
+    instrumentation.count('matrix.cache_hit', len(cached))
+
+    missing = {}
+    for i, j in pairs:
+        result = cached.get(pair_key(i, j))
+        if result is None:
+            missing.setdefault(i, []).append(j)
+        else:
+            distance[i, j], travel_time[i, j] = result
+
+    # Full batches of destinations per origin
+    batch_size = MAX_MATRIX_SIZE - 1
+    batches = [
+        (i, targets[start:start + batch_size])
+        for i, targets in missing.items()
+        for start in range(0, len(targets), batch_size)
+    ]
+
+    def fetch(batch):
+        i, targets = batch
+        return service.route_matrix(
+            origin_keys[i], [destination_keys[j] for j in targets],
+            route_type)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (i, targets), results in zip(batches,
+                                         executor.map(fetch, batches)):
+            for j, (meters, seconds) in zip(targets, results):
+                distance[i, j] = meters
+                travel_time[i, j] = seconds
+            # Cached per batch, so a failed batch keeps the earlier ones
+            if cache is not None:
+                cache.put_many({
+                    pair_key(i, j): result
+                    for j, result in zip(targets, results)
+                })
+
+    return {
+        'straight': straight,
+        'distance': distance,
+        'time': travel_time,
+    }
@@ -0,0 +1,396 @@
+"""
+    Name: fake_mapquest.py
+    Author:
+    Created:
+    Purpose: Local stand-in for the MapQuest API
+    Serves canned geocode JSON and generated PNG maps with configurable
+    latency and error rates, so MapService can be measured without
+    spending quota
+
+    python fake_mapquest.py --port 8000 --latency 0.05
+"""
+import argparse
+import copy
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlsplit, parse_qs
+from PIL import Image, ImageDraw
+from route_shape import decode_polyline, encode_polyline
+from spatial_index import haversine
+
+# Sample geocode response saved from the real API
+SAMPLE_JSON = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "mapquest_json.json")
+
+# Background color of the generated maps by map type
+MAP_COLORS = {
+    "map": (238, 234, 220),
+    "hyb": (70, 90, 60),
+    "sat": (60, 80, 50),
+    "light": (245, 245, 245),
+    "dark": (40, 40, 48),
+}
+
+
+# ---------------------------- LOAD SAMPLE ------------------------------- #
+def load_sample_location():
+    """
+    Load the first location of the saved geocode responses.
+
+    Returns:
+        dict: One entry of results[0]['locations']
+    """
+    with open(SAMPLE_JSON, encoding="utf-8") as file:
+        text = file.read()
+    # The sample was saved from Python, so booleans are capitalized
+    text = re.sub(r"\bFalse\b", "false", text)
+    text = re.sub(r"\bTrue\b", "true", text)
+    # The file holds several responses one after another, use the first
+    data, _ = json.JSONDecoder().raw_decode(text)
+    return data["results"][0]["locations"][0]
+
+
+class FakeMapQuest:
+    """
+    A threaded HTTP server that answers like the MapQuest geocoding
+    and static map APIs. Every address geocodes to a stable point
+    near the sample location, so repeated queries return the same
+    coordinates and different queries return different ones.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, seed=None):
+        """
+        Initialize the server, call start to begin serving.
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on, 0 picks a free port
+            latency (float): Seconds added to every response
+            jitter (float): Extra random seconds, up to this much
+            error_rate (float): Fraction of requests answered with a 503
+            seed (int): Seed for the jitter and errors, for repeatable runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.sample = load_sample_location()
+
+        # Request and byte counters, reset with reset_stats
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+        self._lock = threading.Lock()
+
+        # Generated PNGs by (width, height, map_type)
+        self._images = {}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Routes each request to the FakeMapQuest instance."""
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in one write when the request is
+            # done, two small writes on a keep-alive connection would
+            # wait on Nagle and delayed ACK for about 40 ms
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self, None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                server._handle(self, self.rfile.read(length))
+
+            def log_message(self, format, *args):
+                # Keep benchmark output clean
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        # Concurrent benchmarks open many connections at once
+        self.httpd.request_queue_size = 256
+        self._thread = None
+
+    @property
+    def url(self):
+        """str: Base URL to pass to MapService(base_url=...)."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name="fake-mapquest",
+            daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        """Zero the request and byte counters."""
+        with self._lock:
+            self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+
+    # ------------------------------ HANDLE ------------------------------ #
+    def _handle(self, handler, body):
+        """Answer one request."""
+        parts = urlsplit(handler.path)
+        query = parse_qs(parts.query)
+
+        delay = self.latency
+        with self._lock:
+            if self.jitter:
+                delay += self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            self._send(handler, 503, "text/plain", b"Service Unavailable")
+            return
+
+        path = parts.path
+        if path.endswith("/geocoding/v1/address"):
+            locations = query.get("location", [""])[:1]
+            self._send_json(handler, self._geocode(locations))
+        elif path.endswith("/geocoding/v1/batch"):
+            if body:
+                locations = json.loads(body).get("locations", [])
+            else:
+                locations = query.get("location", [])
+            self._send_json(handler, self._geocode(locations))
+        elif path.endswith("/geocoding/v1/reverse"):
+            lat, lng = (float(value) for value in
+                        query.get("location", ["0,0"])[0].split(","))
+            self._send_json(handler, self._reverse(lat, lng))
+        elif path.endswith("/directions/v2/routematrix"):
+            self._send_json(handler, self._route_matrix(
+                json.loads(body or b"{}").get("locations", [])))
+        elif path.endswith("/directions/v2/route"):
+            self._send_json(handler, self._route(
+                query.get("from", [""])[0], query.get("to", [""])[0]))
+        elif path.endswith("/staticmap/v5/map"):
+            try:
+                data = self._static_map(query)
+            except ValueError as e:
+                self._send(handler, 400, "text/plain", str(e).encode("utf-8"))
+                return
+            self._send(handler, 200, "image/png", data)
+        else:
+            self._send(handler, 404, "text/plain", b"Not Found")
+
+    def _send_json(self, handler, data):
+        """Send a JSON response."""
+        self._send(handler, 200, "application/json;charset=UTF-8",
+                   json.dumps(data).encode("utf-8"))
+
+    def _send(self, handler, status, content_type, data):
+        """Send a response and count it."""
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += len(data)
+            if status >= 400:
+                self.stats["errors"] += 1
+
+    # ------------------------------ GEOCODE ----------------------------- #
+    def _location(self, query):
+        """Build a location near the sample point, stable per query."""
+        digest = hashlib.md5(query.lower().encode("utf-8")).digest()
+        location = copy.deepcopy(self.sample)
+        location["latLng"] = {
+            "lat": round(self.sample["latLng"]["lat"]
+                         + (digest[0] - 128) / 2000, 6),
+            "lng": round(self.sample["latLng"]["lng"]
+                         + (digest[1] - 128) / 2000, 6),
+        }
+        location["displayLatLng"] = dict(location["latLng"])
+        return location
+
+    def _geocode(self, locations):
+        """Build a geocode or batch response for the given queries."""
+        results = []
+        for query in locations:
+            if isinstance(query, dict):
+                query = query.get("street", "")
+            results.append({
+                "providedLocation": {"location": query},
+                # Queries containing "nowhere" are not found
+                "locations": [] if "nowhere" in query.lower()
+                else [self._location(query)],
+            })
+        return {
+            "info": {"statuscode": 0, "messages": []},
+            "options": {"maxResults": 1},
+            "results": results,
+        }
+
+    def _reverse(self, lat, lng):
+        """Build a reverse geocode response at the given point."""
+        location = copy.deepcopy(self.sample)
+        location["latLng"] = {"lat": lat, "lng": lng}
+        return {
+            "info": {"statuscode": 0, "messages": []},
+            "results": [{
+                "providedLocation": {"latLng": {"lat": lat, "lng": lng}},
+                "locations": [location],
+            }],
+        }
+
+    # ------------------------------- ROUTE ------------------------------ #
+    def _point(self, query):
+        """Return (lat, lng) for a "lat,lng" string or an address."""
+        try:
+            lat, lng = (float(value) for value in query.split(","))
+            return lat, lng
+        except ValueError:
+            lat_lng = self._location(query)["latLng"]
+            return lat_lng["lat"], lat_lng["lng"]
+
+    def _route(self, origin, destination):
+        """Build a directions response along a winding road."""
+        if "nowhere" in (origin + destination).lower():
+            return {
+                "info": {"statuscode": 402,
+                         "messages": ["Unable to calculate route."]},
+                "route": {},
+            }
+
+        (lat1, lng1), (lat2, lng2) = self._point(origin), \
+            self._point(destination)
+        # A full shape has a point every few meters, like the real API
+        steps = 2000
+        points = []
+        for i in range(steps + 1):
+            t = i / steps
+            wiggle = 0.002 * math.sin(t * math.pi * 12)
+            points.append((lat1 + (lat2 - lat1) * t + wiggle,
+                           lng1 + (lng2 - lng1) * t))
+
+        miles = sum(
+            haversine(*points[i], *points[i + 1])
+            for i in range(steps)) / 1609.344
+        seconds = round(miles / 45 * 3600)
+        return {
+            "info": {"statuscode": 0, "messages": []},
+            "route": {
+                "distance": round(miles, 3),
+                "time": seconds,
+                "formattedTime": time.strftime(
+                    "%H:%M:%S", time.gmtime(seconds)),
+                "shape": {"shapePoints": encode_polyline(points)},
+            },
+        }
+
+    def _route_matrix(self, locations):
+        """Build a one to many route matrix response."""
+        points = [self._point(location) for location in locations]
+        # Roads are about a third longer than the straight line
+        kilometers = [
+            round(haversine(*points[0], *point) * 1.3 / 1000, 3)
+            for point in points
+        ]
+        return {
+            "info": {"statuscode": 0, "messages": []},
+            "allToAll": False,
+            "distance": kilometers,
+            "time": [round(km / 72 * 3600) for km in kilometers],
+            "locations": locations,
+        }
+
+    # ---------------------------- STATIC MAP ---------------------------- #
+    def _static_map(self, query):
+        """
+        Return a generated PNG of the requested size and type.
+
+        Raises:
+            ValueError: If a route shape is not a cmp|enc: or
+                cmp6|enc: encoded polyline, as the real API requires
+        """
+        for shape in query.get("shape", []):
+            kind, _, encoded = shape.partition("|enc:")
+            if kind not in ("cmp", "cmp6") or not encoded:
+                raise ValueError(f"Invalid shape: {shape[:40]}")
+            # A malformed polyline runs off its end while decoding
+            try:
+                decode_polyline(encoded, 6 if kind == "cmp6" else 5)
+            except IndexError:
+                raise ValueError("Invalid shape: bad polyline")
+
+        width, height = (
+            int(value) for value in query.get("size", ["800,600"])[0].split(","))
+        map_type = query.get("type", ["map"])[0]
+        key = (width, height, map_type)
+
+        data = self._images.get(key)
+        if data is None:
+            image = Image.new(
+                "RGB", (width, height), MAP_COLORS.get(map_type, (200,) * 3))
+            draw = ImageDraw.Draw(image)
+            # A street grid gives the PNG a realistic amount of detail
+            for x in range(0, width, 64):
+                draw.line((x, 0, x, height), fill=(255, 255, 255), width=3)
+            for y in range(0, height, 64):
+                draw.line((0, y, width, y), fill=(255, 255, 255), width=3)
+            draw.ellipse(
+                (width // 2 - 8, height // 2 - 8,
+                 width // 2 + 8, height // 2 + 8),
+                fill=(59, 89, 152))
+            output = BytesIO()
+            image.save(output, format="PNG")
+            data = output.getvalue()
+            self._images[key] = data
+        return data
+
+
+def main():
+    """Run the fake server until interrupted."""
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the MapQuest API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="extra random seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with a 503")
+    args = parser.parse_args()
+
+    server = FakeMapQuest(
+        args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake MapQuest API on {server.url}, Ctrl+C to stop")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
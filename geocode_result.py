@@ -0,0 +1,205 @@
+"""
+    Name: geocode_result.py
+    Author:
+    Created:
+    Purpose: Compact geocode result with every useful field from the
+    geocoding API
+    Results are __slots__ objects, missing values are None, and they
+    are stored as JSON lists, so hundreds of thousands of cached
+    results take a fraction of the memory and disk of location dicts
+"""
+import sys
+
+# Result fields in storage order, the ones most often empty last
+FIELDS = (
+    'latitude', 'longitude', 'street', 'city', 'state', 'postal_code',
+    'county', 'country', 'quality', 'quality_code', 'neighborhood',
+    'side_of_street', 'display_latitude', 'display_longitude',
+)
+
+# Result field -> key of a location in the geocoding response
+API_FIELDS = {
+    'street': 'street',
+    'city': 'adminArea5',
+    'state': 'adminArea3',
+    'postal_code': 'postalCode',
+    'county': 'adminArea4',
+    'country': 'adminArea1',
+    'quality': 'geocodeQuality',
+    'quality_code': 'geocodeQualityCode',
+    'neighborhood': 'adminArea6',
+    'side_of_street': 'sideOfStreet',
+}
+
+# Fields with few distinct values, one string is shared by every result
+INTERNED = frozenset((
+    'city', 'state', 'county', 'country', 'quality', 'quality_code',
+    'neighborhood', 'side_of_street',
+))
+
+# Placeholders that mean the API or an older cache entry had no value
+EMPTY = ('', 'N/A')
+
+
+class GeocodeResult:
+    """
+    One geocoded location.
+    Fields are attributes, result['city'] and result.get('city') still
+    work for code written against the location dicts used before.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, latitude, longitude, street=None, city=None,
+                 state=None, postal_code=None, county=None, country=None,
+                 quality=None, quality_code=None, neighborhood=None,
+                 side_of_street=None, display_latitude=None,
+                 display_longitude=None):
+        """
+        Initialize a result, empty strings and 'N/A' become None.
+
+        Args:
+            latitude (float): Latitude in degrees
+            longitude (float): Longitude in degrees
+            street (str): Street address
+            city (str): City (adminArea5)
+            state (str): State (adminArea3)
+            postal_code (str): Postal code
+            county (str): County (adminArea4)
+            country (str): Country code (adminArea1)
+            quality (str): Match granularity, such as ADDRESS or CITY
+            quality_code (str): Five character quality code, such as P1BAA
+            neighborhood (str): Neighborhood (adminArea6)
+            side_of_street (str): L, R, or N when not known
+            display_latitude (float): Latitude to draw the marker at
+            display_longitude (float): Longitude to draw the marker at
+        """
+        values = locals()
+        for field in FIELDS:
+            value = values[field]
+            if value in EMPTY:
+                value = None
+            elif value is not None and field in INTERNED:
+                value = sys.intern(value)
+            setattr(self, field, value)
+
+    # ------------------------------ API --------------------------------- #
+    @classmethod
+    def from_api(cls, location):
+        """
+        Build a result from one location of a geocoding response.
+
+        Args:
+            location (dict): An entry of results[n]['locations']
+
+        Returns:
+            GeocodeResult: The result
+        """
+        lat_lng = location['latLng']
+        display = location.get('displayLatLng') or {}
+        return cls(
+            lat_lng['lat'], lat_lng['lng'],
+            display_latitude=display.get('lat'),
+            display_longitude=display.get('lng'),
+            **{field: location.get(key)
+               for field, key in API_FIELDS.items()}
+        )
+
+    # ------------------------------ LIST -------------------------------- #
+    def to_list(self):
+        """
+        Return the fields in FIELDS order, for compact JSON storage.
+        Trailing None fields are left out.
+
+        Returns:
+            list: Field values
+        """
+        values = [getattr(self, field) for field in FIELDS]
+        while values and values[-1] is None:
+            values.pop()
+        return values
+
+    @classmethod
+    def from_list(cls, values):
+        """Build a result from to_list output."""
+        return cls(*values)
+
+    # ------------------------------ DICT -------------------------------- #
+    def to_dict(self):
+        """
+        Return every field as a dict, such as for a JSON response.
+
+        Returns:
+            dict: field -> value, None for missing values
+        """
+        return {field: getattr(self, field) for field in FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a result from to_dict output or an older location dict,
+        unknown keys are ignored.
+        """
+        return cls(**{
+            field: data[field] for field in FIELDS if field in data})
+
+    @classmethod
+    def convert(cls, value):
+        """
+        Turn a stored list, a location dict or a result into a result.
+
+        Args:
+            value: GeocodeResult, to_list output or a location dict
+
+        Returns:
+            GeocodeResult: The result
+        """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        return cls.from_list(value)
+
+    # ----------------------------- LEGACY ------------------------------- #
+    def __getitem__(self, field):
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        """Return a field like dict.get, default if it is unknown."""
+        return getattr(self, field) if field in FIELDS else default
+
+    def __eq__(self, other):
+        if not isinstance(other, GeocodeResult):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in FIELDS)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in FIELDS
+            if getattr(self, field) is not None)
+        return f"GeocodeResult({fields})"
+
+
+# ----------------------------- TO COLUMNS ------------------------------- #
+def to_columns(results):
+    """
+    Turn results into one list per field, for columnar export such as
+    a DataFrame or NumPy arrays.
+
+    Args:
+        results (iterable): GeocodeResults, None for locations that
+            were not found
+
+    Returns:
+        dict: field -> list of values, None where a value is missing
+    """
+    columns = {field: [] for field in FIELDS}
+    for result in results:
+        for field, column in columns.items():
+            column.append(None if result is None
+                          else getattr(result, field))
+    return columns
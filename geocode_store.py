@@ -0,0 +1,371 @@
+"""
+    Name: geocode_store.py
+    Author:
+    Created:
+    Purpose: Columnar store of geocode results for spatial queries
+    over large address lists
+    Coordinates are float64 NumPy arrays and every text field is
+    dictionary encoded as int32 codes, so bounding box, radius and
+    nearest queries and centroids run vectorized over hundreds of
+    thousands of results. Saved as .npz, or as a folder of .npy files
+    that is memory-mapped when loaded.
+"""
+import os
+import threading
+# pip install numpy
+import numpy as np
+from geocode_result import FIELDS, GeocodeResult
+from map_cache import normalize_query
+from spatial_arrays import haversine_matrix
+from spatial_index import METERS_PER_DEGREE
+
+# Numeric fields, NaN where a result has no value
+FLOAT_FIELDS = (
+    'latitude', 'longitude', 'display_latitude', 'display_longitude')
+
+# Dictionary encoded fields, the normalized query comes first.
+# Code -1 is a missing value.
+STRING_FIELDS = ('key',) + tuple(
+    field for field in FIELDS if field not in FLOAT_FIELDS)
+
+
+class GeocodeStore:
+    """
+    Append-only columns of geocode results, one row per normalized
+    query. Rows added since the last query are kept in lists and joined
+    onto the arrays by the next query, so adding stays cheap.
+    A query that is already in the store keeps its first result.
+    """
+
+    def __init__(self):
+        """Initialize an empty store."""
+        self._lock = threading.Lock()
+
+        # Column arrays, codes for the string fields
+        self._arrays = {field: np.empty(0) for field in FLOAT_FIELDS}
+        self._arrays.update({
+            field: np.empty(0, dtype=np.int32) for field in STRING_FIELDS})
+        # Rows added since the last query, per column
+        self._pending = {field: [] for field in self._arrays}
+
+        # Distinct values per string field, the code is the position
+        self._values = {field: [] for field in STRING_FIELDS}
+        # value -> code and key -> row, built when first needed
+        self._codes = dict.fromkeys(STRING_FIELDS)
+        self._rows = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    # -------------------------------- ADD ------------------------------- #
+    def add(self, location, result):
+        """
+        Add a result.
+
+        Args:
+            location (str): Location string, normalized like the cache
+            result (GeocodeResult): Its geocode result
+
+        Returns:
+            bool: False if the location was already in the store
+        """
+        with self._lock:
+            return self._add(normalize_query(location), result)
+
+    def add_many(self, items):
+        """
+        Add many results at once, such as from geocode_many.
+
+        Args:
+            items (iterable): (location, GeocodeResult) pairs, pairs
+                without a result are skipped
+
+        Returns:
+            int: Number of rows added
+        """
+        added = 0
+        with self._lock:
+            for location, result in items:
+                if result is not None:
+                    added += self._add(normalize_query(location), result)
+        return added
+
+    def _add(self, key, result):
+        """Append one row, the lock is held."""
+        rows = self._row_index()
+        if key in rows:
+            return False
+        rows[key] = self._size
+        self._size += 1
+
+        pending = self._pending
+        for field in FLOAT_FIELDS:
+            value = getattr(result, field)
+            pending[field].append(np.nan if value is None else value)
+        pending['key'].append(self._encode('key', key))
+        for field in STRING_FIELDS[1:]:
+            pending[field].append(
+                self._encode(field, getattr(result, field)))
+        return True
+
+    def _encode(self, field, value):
+        """Return the code of a string value, adding it if it is new."""
+        if value is None:
+            return -1
+        codes = self._codes[field]
+        if codes is None:
+            codes = self._codes[field] = {
+                known: code for code, known in enumerate(self._values[field])}
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._values[field])
+            self._values[field].append(value)
+        return code
+
+    def _row_index(self):
+        """Return the key -> row dict, built from the key column once."""
+        if self._rows is None:
+            self._flush()
+            keys = self._values['key']
+            self._rows = {
+                keys[code]: row
+                for row, code in enumerate(self._arrays['key'].tolist())}
+        return self._rows
+
+    def _flush(self):
+        """Join the pending rows onto the column arrays."""
+        if not self._pending['key']:
+            return
+        for field, values in self._pending.items():
+            array = self._arrays[field]
+            self._arrays[field] = np.concatenate(
+                (array, np.array(values, dtype=array.dtype)))
+            values.clear()
+
+    def _columns(self, *fields):
+        """Return up to date arrays for fields."""
+        with self._lock:
+            self._flush()
+            return tuple(self._arrays[field] for field in fields)
+
+    # ------------------------------ ROWS -------------------------------- #
+    def get(self, location):
+        """
+        Look up the result of a location string.
+
+        Returns:
+            GeocodeResult: The result, None if it is not in the store
+        """
+        with self._lock:
+            row = self._row_index().get(normalize_query(location))
+        if row is None:
+            return None
+        return self.results([row])[0]
+
+    def column(self, field, rows=None):
+        """
+        Decode one column.
+
+        Args:
+            field (str): A GeocodeResult field, or key for the
+                normalized queries
+            rows (numpy.ndarray): Row numbers, such as from a query,
+                None for every row
+
+        Returns:
+            numpy.ndarray: float64 with NaN for missing coordinates,
+            otherwise an object array of strings with None
+        """
+        (array,) = self._columns(field)
+        if rows is not None:
+            array = array[rows]
+        if field in FLOAT_FIELDS:
+            return np.asarray(array)
+        # Code -1 picks the None after the last value
+        values = np.array(self._values[field] + [None], dtype=object)
+        return values[array]
+
+    def results(self, rows=None):
+        """
+        Rebuild GeocodeResults for rows.
+
+        Args:
+            rows (numpy.ndarray): Row numbers, None for every row
+
+        Returns:
+            list: GeocodeResults in row order
+        """
+        columns = [self.column(field, rows).tolist() for field in FIELDS]
+        # NaN is the only value not equal to itself
+        return [
+            GeocodeResult(*(None if value != value else value
+                            for value in values))
+            for values in zip(*columns)
+        ]
+
+    # ----------------------------- QUERIES ------------------------------ #
+    def bbox(self, south, west, north, east):
+        """
+        Find the rows inside a bounding box.
+
+        Args:
+            south (float): Southern latitude in degrees
+            west (float): Western longitude, greater than east when the
+                box crosses the antimeridian
+            north (float): Northern latitude in degrees
+            east (float): Eastern longitude in degrees
+
+        Returns:
+            numpy.ndarray: Row numbers in row order
+        """
+        lat, lng = self._columns('latitude', 'longitude')
+        inside = (lat >= south) & (lat <= north)
+        if west <= east:
+            inside &= (lng >= west) & (lng <= east)
+        else:
+            inside &= (lng >= west) | (lng <= east)
+        return np.flatnonzero(inside)
+
+    def radius(self, lat, lng, meters):
+        """
+        Find the rows within a distance of a point.
+
+        Args:
+            lat (float): Latitude in degrees
+            lng (float): Longitude in degrees
+            meters (float): Search radius in meters
+
+        Returns:
+            tuple: (numpy.ndarray, numpy.ndarray) - Row numbers and
+            their distances in meters, nearest first
+        """
+        lats, lngs = self._columns('latitude', 'longitude')
+
+        # A box in degrees drops most rows before the exact distance
+        d_lat = meters / METERS_PER_DEGREE
+        candidate = np.abs(lats - lat) <= d_lat
+        cos_lat = np.cos(np.radians(min(90.0, abs(lat) + d_lat)))
+        if cos_lat > 1e-6:
+            d_lng = d_lat / cos_lat
+            candidate &= np.abs((lngs - lng + 180.0) % 360.0 - 180.0) <= d_lng
+        rows = np.flatnonzero(candidate)
+
+        distances = self._distances(lat, lng, rows)
+        within = distances <= meters
+        rows, distances = rows[within], distances[within]
+        order = np.argsort(distances, kind='stable')
+        return rows[order], distances[order]
+
+    def nearest(self, lat, lng, k=1, max_distance=None):
+        """
+        Find the k rows closest to a point.
+
+        Args:
+            lat (float): Latitude in degrees
+            lng (float): Longitude in degrees
+            k (int): Number of rows
+            max_distance (float): Meters beyond which rows are left out,
+                None for no limit
+
+        Returns:
+            tuple: (numpy.ndarray, numpy.ndarray) - Row numbers and
+            their distances in meters, nearest first
+        """
+        if max_distance is not None:
+            rows, distances = self.radius(lat, lng, max_distance)
+            return rows[:k], distances[:k]
+
+        distances = self._distances(lat, lng)
+        k = min(k, len(distances))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        rows = np.argpartition(distances, k - 1)[:k]
+        rows = rows[np.argsort(distances[rows], kind='stable')]
+        return rows, distances[rows]
+
+    def centroid(self, rows=None):
+        """
+        Geographic center of rows, the mean of their unit vectors.
+
+        Args:
+            rows (numpy.ndarray): Row numbers, None for every row
+
+        Returns:
+            tuple: (float, float) - Latitude and longitude in degrees,
+            None if there are no rows
+        """
+        lat, lng = self._columns('latitude', 'longitude')
+        if rows is not None:
+            lat, lng = lat[rows], lng[rows]
+        if not len(lat):
+            return None
+        lat = np.radians(lat)
+        lng = np.radians(lng)
+        x = np.mean(np.cos(lat) * np.cos(lng))
+        y = np.mean(np.cos(lat) * np.sin(lng))
+        z = np.mean(np.sin(lat))
+        return (float(np.degrees(np.arctan2(z, np.hypot(x, y)))),
+                float(np.degrees(np.arctan2(y, x))))
+
+    def _distances(self, lat, lng, rows=None):
+        """Great circle meters from a point to rows, None for all."""
+        lats, lngs = self._columns('latitude', 'longitude')
+        if rows is not None:
+            lats, lngs = lats[rows], lngs[rows]
+        return haversine_matrix(
+            np.array([[lat, lng]]), np.column_stack((lats, lngs)))[0]
+
+    # ---------------------------- SAVE / LOAD --------------------------- #
+    def save(self, path):
+        """
+        Save the store.
+
+        Args:
+            path (str): A .npz file, or a folder for one .npy file per
+                array, which load can memory-map
+        """
+        with self._lock:
+            self._flush()
+            arrays = dict(self._arrays)
+            for field in STRING_FIELDS:
+                arrays[f"{field}_values"] = np.array(
+                    self._values[field], dtype=str)
+
+        if path.endswith('.npz'):
+            np.savez(path, **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a saved store.
+
+        Args:
+            path (str): A .npz file or a folder written by save
+            mmap (bool): Memory-map the arrays of a folder instead of
+                reading them, an .npz file is always read
+
+        Returns:
+            GeocodeStore: The store, new rows can still be added
+        """
+        store = cls()
+        names = list(store._arrays) + [
+            f"{field}_values" for field in STRING_FIELDS]
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in names}
+        else:
+            arrays = {
+                name: np.load(os.path.join(path, name + '.npy'),
+                              mmap_mode='r' if mmap else None)
+                for name in names}
+
+        for field in STRING_FIELDS:
+            store._values[field] = arrays.pop(f"{field}_values").tolist()
+        store._arrays = arrays
+        store._size = len(arrays['key'])
+        return store
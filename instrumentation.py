@@ -0,0 +1,217 @@
+"""
+    Name: instrumentation.py
+    Author:
+    Created:
+    Purpose: Timing spans and counters for the map fetch hot path
+    Shows where a slow map spent its time: network wait, download,
+    decoding, Tk conversion, cache hits and quota use
+    Exports to a structured log, a stats panel and Prometheus text
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Structured span records are logged here at DEBUG level
+logger = logging.getLogger("mapquest")
+
+
+class Instrumentation:
+    """
+    Collects per-stage timing spans, counters and gauges.
+    Spans keep a count, total, maximum and last duration per name,
+    plus a short history of recent spans for the stats panel.
+    Thread-safe, MapService records from its worker threads.
+    """
+
+    def __init__(self, max_recent=200):
+        """
+        Initialize empty metrics.
+
+        Args:
+            max_recent (int): Number of recent spans kept for display
+        """
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._gauges = {}
+        self.recent = deque(maxlen=max_recent)
+
+    # ------------------------------- SPAN ------------------------------- #
+    @contextmanager
+    def span(self, name, **fields):
+        """
+        Time the enclosed block as one stage.
+
+            with instrumentation.span("decode"):
+                image = decode_image(data)
+
+        Args:
+            name (str): Stage name, such as http.map or decode
+            **fields: Extra values for the structured log record
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **fields)
+
+    def observe(self, name, seconds, **fields):
+        """
+        Record a duration measured elsewhere.
+
+        Args:
+            name (str): Stage name
+            seconds (float): Duration of the stage
+            **fields: Extra values for the structured log record
+        """
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["last"] = seconds
+            self.recent.append((time.time(), name, seconds))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({
+                "span": name, "ms": round(seconds * 1000, 3), **fields}))
+
+    # ----------------------------- COUNTERS ----------------------------- #
+    def count(self, name, value=1):
+        """
+        Add to a counter, such as image_cache.hit or bytes_received.
+
+        Args:
+            name (str): Counter name
+            value (int): Amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        """
+        Set a gauge, such as quota.remaining.
+
+        Args:
+            name (str): Gauge name
+            value (float): Current value
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    # ----------------------------- SNAPSHOT ----------------------------- #
+    def snapshot(self):
+        """
+        Return a copy of every metric.
+
+        Returns:
+            dict: spans (name -> count, total, avg, max, last in seconds),
+            counters and gauges
+        """
+        with self._lock:
+            spans = {
+                name: {**stats, "avg": stats["total"] / stats["count"]}
+                for name, stats in self._spans.items()
+            }
+            return {
+                "spans": spans,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def format_text(self):
+        """
+        Format the metrics as a readable report for the stats panel.
+
+        Returns:
+            str: One line per span, counter and gauge
+        """
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<24}{'count':>7}{'avg ms':>10}"
+                 f"{'max ms':>10}{'last ms':>10}"]
+        for name, stats in sorted(snapshot["spans"].items()):
+            lines.append(
+                f"{name:<24}{stats['count']:>7}{stats['avg'] * 1000:>10.1f}"
+                f"{stats['max'] * 1000:>10.1f}{stats['last'] * 1000:>10.1f}")
+        lines.append("")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<24}{value:>12}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"{name:<24}{value:>12}")
+        return "\n".join(lines)
+
+    # ---------------------------- PROMETHEUS ---------------------------- #
+    def prometheus(self, prefix="mapquest"):
+        """
+        Format the metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prefix for every metric name
+
+        Returns:
+            str: Metrics text for a /metrics endpoint
+        """
+        def metric_name(name):
+            return f"{prefix}_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for name, stats in sorted(snapshot["spans"].items()):
+            label = f'{{stage="{name}"}}'
+            lines.append(
+                f"{prefix}_span_seconds_count{label} {stats['count']}")
+            lines.append(
+                f"{prefix}_span_seconds_sum{label} {stats['total']:.6f}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {metric_name(name)}_total counter")
+            lines.append(f"{metric_name(name)}_total {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {metric_name(name)} gauge")
+            lines.append(f"{metric_name(name)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, host="127.0.0.1", port=9100):
+        """
+        Serve the Prometheus text on /metrics from a background thread.
+        For headless runs where there is no stats panel.
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on
+
+        Returns:
+            ThreadingHTTPServer: The running server, call shutdown to stop
+        """
+        instrumentation = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = instrumentation.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
@@ -0,0 +1,788 @@
+"""
+    Name: map_cache.py
+    Author:
+    Created:
+    Purpose: Local caches for MapQuest results
+    An in-memory LRU tier in front of an on-disk SQLite tier keeps
+    repeated lookups from using up the 15,000 requests per month
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image, ImageOps
+from geocode_result import GeocodeResult
+
+# Default folder for the on-disk cache files
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mapquest_cache")
+
+# First bytes of every PNG file
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+# ------------------------- NORMALIZE QUERY ------------------------------ #
+def normalize_query(query):
+    """
+    Normalize a location string so near-identical queries share a cache key.
+
+    Case, commas and extra whitespace are ignored, so
+    " 615 Mountain View Ave,  Scottsbluff NE" and
+    "615 mountain view ave scottsbluff ne" produce the same key.
+
+    Args:
+        query (str): Location string as typed by the user
+
+    Returns:
+        str: Normalized location string
+    """
+    return " ".join(str(query).lower().replace(",", " ").split())
+
+
+# --------------------------- DECODE IMAGE ------------------------------- #
+def decode_image(data):
+    """
+    Decode encoded image bytes into a fully loaded PIL image.
+
+    Args:
+        data (bytes): Encoded image, such as a PNG from the static map API
+
+    Returns:
+        PIL.Image: The decoded image
+    """
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image
+
+
+class EncodedImage:
+    """
+    A map image kept as the encoded bytes from the API.
+    Nothing is decoded until it is needed: photo hands PNG bytes
+    straight to Tk, decode builds a PIL image only when asked.
+    An optional target size is applied by center crop or downscale.
+    """
+    __slots__ = ("data", "target", "mode", "_image")
+
+    def __init__(self, data, target=None, mode="crop"):
+        """
+        Wrap encoded image bytes.
+
+        Args:
+            data (bytes): Encoded image as returned by the API
+            target (tuple): (width, height) to cut the image down to,
+                None keeps the full image
+            mode (str): 'crop' for a center crop, 'scale' to downscale
+        """
+        self.data = data
+        self.target = target
+        self.mode = mode
+        self._image = None
+
+    @property
+    def is_png(self):
+        """bool: True if the bytes are a PNG."""
+        return self.data[:8] == PNG_SIGNATURE
+
+    @property
+    def source_size(self):
+        """tuple: (width, height) of the encoded image."""
+        if self.is_png:
+            # Read the IHDR chunk instead of decoding the image
+            return struct.unpack(">II", self.data[16:24])
+        return Image.open(BytesIO(self.data)).size
+
+    @property
+    def size(self):
+        """tuple: (width, height) of the image after cropping."""
+        return self.target or self.source_size
+
+    @property
+    def box(self):
+        """tuple: Center crop (left, top, right, bottom), None if none."""
+        if self.target is None:
+            return None
+        source_width, source_height = self.source_size
+        width, height = self.target
+        if (width, height) == (source_width, source_height):
+            return None
+        left = (source_width - width) // 2
+        top = (source_height - height) // 2
+        return left, top, left + width, top + height
+
+    # ------------------------------ DECODE ------------------------------ #
+    def decode(self):
+        """
+        Decode into a PIL image, cut down to the target size.
+
+        Returns:
+            PIL.Image: The decoded image, cached after the first call
+        """
+        if self._image is None:
+            image = decode_image(self.data)
+            if self.target is not None and image.size != self.target:
+                if self.mode == "scale":
+                    image = ImageOps.fit(
+                        image, self.target, Image.Resampling.LANCZOS)
+                else:
+                    image = image.crop(self.box)
+            self._image = image
+        return self._image
+
+    # ------------------------------- PHOTO ------------------------------ #
+    def photo(self):
+        """
+        Create a Tk photo image, call on the Tk thread.
+        PNG bytes go straight to tk.PhotoImage and a crop is done by
+        Tk, so no PIL image is ever built. Other formats and scaling
+        go through PIL.
+
+        Returns:
+            tk.PhotoImage: Image ready for a label or canvas
+        """
+        import tkinter as tk
+
+        box = self.box
+        if self.is_png and (box is None or self.mode == "crop"):
+            photo = tk.PhotoImage(data=self.data)
+            if box is None:
+                return photo
+            cropped = tk.PhotoImage(width=self.target[0],
+                                    height=self.target[1])
+            cropped.tk.call(cropped, "copy", photo, "-from", *box)
+            return cropped
+
+        from PIL import ImageTk
+        return ImageTk.PhotoImage(self.decode())
+
+
+class GeocodeCache:
+    """
+    Two tier cache of geocode results keyed by the normalized query.
+    The memory tier is a small LRU, the disk tier is a SQLite table
+    that survives restarts. Both tiers expire entries after ttl seconds.
+    """
+    # Values are GeocodeResults, stored on disk as compact JSON lists.
+    # Caches of other values set this to None to store plain JSON.
+    result_type = GeocodeResult
+
+    # SQLite table of the disk tier, each cache has its own
+    table = "geocode"
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "geocode.db"),
+                 ttl=30 * 24 * 60 * 60, max_memory_entries=256,
+                 max_disk_entries=50000):
+        """
+        Initialize the cache.
+
+        Args:
+            path (str): SQLite file for the disk tier,
+                None keeps the cache in memory only
+            ttl (float): Seconds before an entry expires,
+                None keeps entries forever
+            max_memory_entries (int): Size of the in-memory LRU tier
+            max_disk_entries (int): Number of rows kept on disk before
+                the least recently used rows are evicted, a tenth of
+                them at a time
+        """
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        # Memory tier: key -> (stored time, value), oldest first
+        self._memory = OrderedDict()
+
+        # The viewers call into the cache from a worker thread
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "stored REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_accessed "
+                f"ON {self.table} (accessed)"
+            )
+            self._db.commit()
+
+        # Rows on disk, counted again after each eviction. Replaced
+        # and expired rows make it an overcount, which only evicts early
+        self._disk_rows = 0
+        if self._db is not None:
+            self._disk_rows = self._db.execute(
+                f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def __len__(self):
+        """Number of unexpired entries, on disk if there is a disk tier."""
+        with self._lock:
+            if self._db is None:
+                now = time.time()
+                return sum(not self._expired(stored, now)
+                           for stored, _ in self._memory.values())
+            if self.ttl is None:
+                query, args = f"SELECT COUNT(*) FROM {self.table}", ()
+            else:
+                query = f"SELECT COUNT(*) FROM {self.table} WHERE stored >= ?"
+                args = (time.time() - self.ttl,)
+            return self._db.execute(query, args).fetchone()[0]
+
+    # ---------------------------- SERIALIZE ----------------------------- #
+    def _dump(self, value):
+        """Serialize a value for the disk tier."""
+        if self.result_type is not None:
+            value = self.result_type.convert(value).to_list()
+        return json.dumps(value)
+
+    def _load(self, text):
+        """Deserialize a value from the disk tier."""
+        value = json.loads(text)
+        if self.result_type is not None:
+            # Entries from before GeocodeResult are dicts
+            value = self.result_type.convert(value)
+        return value
+
+    # ----------------------------- EXPIRED ------------------------------ #
+    def _expired(self, stored, now):
+        """Return True if an entry stored at stored is past its ttl."""
+        return self.ttl is not None and now - stored > self.ttl
+
+    # ------------------------------- GET -------------------------------- #
+    def get(self, query):
+        """
+        Look up a cached geocode result.
+
+        Args:
+            query (str): Location string, normalized before lookup
+
+        Returns:
+            GeocodeResult: The cached result, None on a miss
+        """
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            # Memory tier first
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored, value = entry
+                if not self._expired(stored, now):
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+
+            # Then the disk tier
+            row = self._db.execute(
+                f"SELECT value, stored FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, stored = self._load(row[0]), row[1]
+            if self._expired(stored, now):
+                self._db.execute(
+                    f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+
+            self._db.execute(
+                f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                (now, key)
+            )
+            self._db.commit()
+
+            # Promote to the memory tier
+            self._remember(key, stored, value)
+            return value
+
+    # ------------------------------- PUT -------------------------------- #
+    def put(self, query, value):
+        """
+        Store a geocode result in both tiers.
+
+        Args:
+            query (str): Location string, normalized before storing
+            value (GeocodeResult): Result returned by the geocoder
+        """
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, value)
+
+            if self._db is None:
+                return
+
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} "
+                "(key, value, stored, accessed) VALUES (?, ?, ?, ?)",
+                (key, self._dump(value), now, now)
+            )
+            self._evict(1)
+            self._db.commit()
+
+    # ----------------------------- GET MANY ----------------------------- #
+    def get_many(self, queries):
+        """
+        Look up many entries with one query per 500 keys and one commit.
+        Hits are not promoted to the memory tier, so a large batch does
+        not flush the entries the viewers are using.
+
+        Args:
+            queries (list): Keys, normalized before lookup
+
+        Returns:
+            dict: query -> cached value, for the hits only
+        """
+        # Spellings that normalize to the same key share one lookup
+        keys = {}
+        for query in queries:
+            keys.setdefault(normalize_query(query), []).append(query)
+        now = time.time()
+        found = {}
+
+        with self._lock:
+            missing = []
+            for key, spellings in keys.items():
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[0], now):
+                    found.update(dict.fromkeys(spellings, entry[1]))
+                else:
+                    missing.append(key)
+
+            if self._db is None:
+                return found
+
+            hits = []
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, value, stored FROM {self.table} "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, value, stored in rows:
+                    if not self._expired(stored, now):
+                        found.update(
+                            dict.fromkeys(keys[key], self._load(value)))
+                        hits.append((now, key))
+
+            if hits:
+                self._db.executemany(
+                    f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                    hits)
+                self._db.commit()
+        return found
+
+    # ----------------------------- PUT MANY ----------------------------- #
+    def put_many(self, items):
+        """
+        Store many entries in one transaction.
+        With a disk tier they skip the memory tier, like get_many.
+
+        Args:
+            items (dict): query -> value
+        """
+        now = time.time()
+        with self._lock:
+            if self._db is None:
+                for query, value in items.items():
+                    self._remember(normalize_query(query), now, value)
+                return
+
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} "
+                "(key, value, stored, accessed) VALUES (?, ?, ?, ?)",
+                [(normalize_query(query), self._dump(value), now, now)
+                 for query, value in items.items()]
+            )
+            self._evict(len(items))
+            self._db.commit()
+
+    # ------------------------------- EVICT ------------------------------ #
+    def _evict(self, added):
+        """
+        Delete the least recently used rows once over max_disk_entries,
+        caller holds the lock and commits.
+        The DELETE sorts the whole table, so it trims a tenth below the
+        limit and the next few thousand puts skip it.
+
+        Args:
+            added (int): Rows just written
+        """
+        self._disk_rows += added
+        if self._disk_rows <= self.max_disk_entries:
+            return
+
+        keep = self.max_disk_entries - self.max_disk_entries // 10
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+            f"{self.table} ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (keep,)
+        )
+        self._disk_rows = self._db.execute(
+            f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    # ----------------------------- REMEMBER ----------------------------- #
+    def _remember(self, key, stored, value):
+        """Add an entry to the memory tier, evicting the oldest entries."""
+        self._memory[key] = (stored, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # ------------------------------ ITEMS ------------------------------- #
+    def items(self):
+        """
+        Return every unexpired entry.
+
+        Returns:
+            list: (normalized query, value) tuples
+        """
+        now = time.time()
+        with self._lock:
+            if self._db is None:
+                return [
+                    (key, value)
+                    for key, (stored, value) in self._memory.items()
+                    if not self._expired(stored, now)
+                ]
+            rows = self._db.execute(
+                f"SELECT key, value, stored FROM {self.table}").fetchall()
+        return [
+            (key, self._load(value))
+            for key, value, stored in rows
+            if not self._expired(stored, now)
+        ]
+
+    # ------------------------------ CLEAR ------------------------------- #
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+                self._disk_rows = 0
+
+    def close(self):
+        """Close the SQLite connection."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class RouteCache(GeocodeCache):
+    """
+    Route geometry keyed by origin, destination and route options.
+    The same two tiers as GeocodeCache, in a file of its own.
+    """
+    result_type = None
+    table = "routes"
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "routes.db"),
+                 ttl=7 * 24 * 60 * 60, max_memory_entries=64,
+                 max_disk_entries=5000):
+        """
+        Initialize the cache.
+
+        Args:
+            path (str): SQLite file for the disk tier,
+                None keeps the cache in memory only
+            ttl (float): Seconds before a route expires, roads change
+                more often than addresses do
+            max_memory_entries (int): Size of the in-memory LRU tier
+            max_disk_entries (int): Number of routes kept on disk
+        """
+        super().__init__(path, ttl, max_memory_entries, max_disk_entries)
+
+
+class MatrixCache(GeocodeCache):
+    """
+    Road distance and travel time per origin and destination pair.
+    The same two tiers as GeocodeCache, sized for large matrices.
+    """
+    result_type = None
+    table = "matrix"
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "matrix.db"),
+                 ttl=7 * 24 * 60 * 60, max_memory_entries=4096,
+                 max_disk_entries=500000):
+        """
+        Initialize the cache.
+
+        Args:
+            path (str): SQLite file for the disk tier,
+                None keeps the cache in memory only
+            ttl (float): Seconds before a pair expires
+            max_memory_entries (int): Size of the in-memory LRU tier
+            max_disk_entries (int): Number of pairs kept on disk
+        """
+        super().__init__(path, ttl, max_memory_entries, max_disk_entries)
+
+
+class ImageCache:
+    """
+    Content-addressed cache of static map images.
+    Raw response bytes are kept on disk under a total size cap with LRU
+    eviction. A few decoded PIL images are kept in memory so flipping
+    back to a recent view does not even need to decode the PNG again.
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "images"),
+                 max_disk_bytes=200 * 1024 * 1024, max_memory_images=16):
+        """
+        Initialize the cache.
+
+        Args:
+            path (str): Folder for the image files and their index,
+                None keeps the raw bytes in memory only
+            max_disk_bytes (int): Total size of stored images before the
+                least recently used images are evicted
+            max_memory_images (int): Number of decoded images kept in memory
+        """
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_images = max_memory_images
+
+        # Decoded images: key -> PIL.Image, oldest first
+        self._images = OrderedDict()
+
+        # Raw bytes when there is no disk tier: key -> bytes, oldest first
+        self._blobs = OrderedDict()
+
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._db = sqlite3.connect(
+                os.path.join(path, "index.db"), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS images_accessed "
+                "ON images (accessed)"
+            )
+            self._db.commit()
+
+    # ------------------------------- KEY -------------------------------- #
+    @staticmethod
+    def key(**params):
+        """
+        Build the content address for a static map request.
+
+        Args:
+            **params: Every parameter that changes the image, such as
+                center, zoom, type, size and marker
+
+        Returns:
+            str: Hex SHA-256 digest of the canonical parameters
+        """
+        canonical = json.dumps(
+            {name: str(value) for name, value in params.items()},
+            sort_keys=True
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    # ----------------------------- FILE PATH ---------------------------- #
+    def _file_path(self, key):
+        """Return the on-disk location of the image stored under key."""
+        return os.path.join(self.path, key[:2], key + ".img")
+
+    # ----------------------------- GET BYTES ---------------------------- #
+    def get_bytes(self, key):
+        """
+        Look up the raw encoded image bytes.
+
+        Args:
+            key (str): Content address from ImageCache.key
+
+        Returns:
+            bytes: The encoded image, None on a miss
+        """
+        with self._lock:
+            return self._read(key)
+
+    def _read(self, key):
+        """Read raw bytes from the byte tier, caller holds the lock."""
+        if self._db is None:
+            data = self._blobs.get(key)
+            if data is not None:
+                self._blobs.move_to_end(key)
+            return data
+
+        try:
+            with open(self._file_path(key), "rb") as file:
+                data = file.read()
+        except OSError:
+            # File missing, drop any stale index row
+            self._db.execute("DELETE FROM images WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+
+        self._db.execute(
+            "UPDATE images SET accessed = ? WHERE key = ?",
+            (time.time(), key)
+        )
+        self._db.commit()
+        return data
+
+    # -------------------------------- GET ------------------------------- #
+    def get(self, key):
+        """
+        Look up a decoded image.
+
+        Args:
+            key (str): Content address from ImageCache.key
+
+        Returns:
+            PIL.Image: The cached map image, None on a miss
+        """
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+
+            data = self._read(key)
+            if data is None:
+                return None
+
+            image = decode_image(data)
+            self._remember(key, image)
+            return image
+
+    # ----------------------------- PUT BYTES ---------------------------- #
+    def put_bytes(self, key, data):
+        """
+        Store raw image bytes without decoding them.
+
+        Args:
+            key (str): Content address from ImageCache.key
+            data (bytes): Encoded image as returned by the API
+        """
+        with self._lock:
+            self._write(key, data)
+
+    # -------------------------------- PUT ------------------------------- #
+    def put(self, key, data):
+        """
+        Store raw image bytes and return the decoded image.
+
+        Args:
+            key (str): Content address from ImageCache.key
+            data (bytes): Encoded image as returned by the API
+
+        Returns:
+            PIL.Image: The decoded image
+        """
+        image = decode_image(data)
+
+        with self._lock:
+            self._remember(key, image)
+            self._write(key, data)
+
+        return image
+
+    def _write(self, key, data):
+        """Write raw bytes to the byte tier, caller holds the lock."""
+        if self._db is None:
+            self._blobs[key] = data
+            self._blobs.move_to_end(key)
+            total = sum(len(blob) for blob in self._blobs.values())
+            while total > self.max_disk_bytes and len(self._blobs) > 1:
+                total -= len(self._blobs.popitem(last=False)[1])
+            return
+
+        file_path = self._file_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial file
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, file_path)
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO images (key, size, accessed) "
+            "VALUES (?, ?, ?)",
+            (key, len(data), time.time())
+        )
+        self._evict()
+        self._db.commit()
+
+    # ------------------------------- EVICT ------------------------------ #
+    def _evict(self):
+        """Delete least recently used files until under max_disk_bytes."""
+        total, count = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM images").fetchone()
+        if total <= self.max_disk_bytes:
+            return
+
+        # Walk the accessed index from the oldest image only as far as
+        # needed, always keeping the most recent image even if it is
+        # over the cap
+        keys = []
+        cursor = self._db.execute(
+            "SELECT key, size FROM images ORDER BY accessed LIMIT ?",
+            (count - 1,))
+        for key, size in cursor:
+            if total <= self.max_disk_bytes:
+                break
+            keys.append(key)
+            total -= size
+        cursor.close()
+
+        # By key, rows with the same accessed time sort in any order
+        self._db.executemany(
+            "DELETE FROM images WHERE key = ?", [(key,) for key in keys])
+        for key in keys:
+            try:
+                os.remove(self._file_path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key, image):
+        """Add a decoded image to the memory tier, evicting the oldest."""
+        self._images[key] = image
+        self._images.move_to_end(key)
+        while len(self._images) > self.max_memory_images:
+            self._images.popitem(last=False)
+
+    # ------------------------------ CLEAR ------------------------------- #
+    def clear(self):
+        """Remove every image from both tiers."""
+        with self._lock:
+            self._images.clear()
+            self._blobs.clear()
+            if self._db is not None:
+                for (key,) in self._db.execute(
+                        "SELECT key FROM images").fetchall():
+                    try:
+                        os.remove(self._file_path(key))
+                    except OSError:
+                        pass
+                self._db.execute("DELETE FROM images")
+                self._db.commit()
+
+    def close(self):
+        """Close the SQLite index."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
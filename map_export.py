@@ -0,0 +1,425 @@
+"""
+    Name: map_export.py
+    Author:
+    Created:
+    Purpose: Export static maps for a CSV or JSONL file of addresses
+    or coordinates, such as thumbnails for reports
+    Maps are fetched on a thread pool and re-encoded on a process pool,
+    so PIL's CPU work runs outside the GIL. Output goes to a folder,
+    a ZIP or tar file, or a tar stream, and a manifest next to it lets
+    an interrupted or quota-limited export carry on where it stopped.
+
+    python map_export.py addresses.csv maps.zip --size 400x300 --format webp
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from batch_geocode import read_rows
+from map_cache import EncodedImage
+from map_service import MAP_TYPES, MapService
+from quota import QuotaExceeded
+
+# File extension -> PIL format
+FORMATS = {'png': 'PNG', 'webp': 'WEBP', 'jpg': 'JPEG'}
+
+
+# --------------------------- READ LOCATIONS ----------------------------- #
+def read_locations(path, column='address'):
+    """
+    Stream the locations to map from a CSV or JSONL file.
+
+    Args:
+        path (str): Input file, see batch_geocode.read_rows
+        column (str): Column or key that holds the address, rows with
+            latitude and longitude values are mapped at those instead
+
+    Yields:
+        str or tuple: An address, or (lat, lng) coordinates
+    """
+    for row in read_rows(path):
+        if row.get('latitude') not in (None, '') \
+                and row.get('longitude') not in (None, ''):
+            yield float(row['latitude']), float(row['longitude'])
+        else:
+            yield str(row.get(column) or '')
+
+
+# ---------------------------- ENCODE IMAGE ------------------------------ #
+def encode_image(data, extension='png', size=None, mode='crop', quality=80,
+                 optimize=False):
+    """
+    Cut a map down to size and encode it, runs in a worker process.
+
+    Args:
+        data (bytes): Encoded image from the API
+        extension (str): png, webp or jpg
+        size (tuple): (width, height), None keeps the size
+        mode (str): 'crop' for a center crop, 'scale' to downscale
+        quality (int): WebP and JPEG quality (1-100)
+        optimize (bool): Spend more time for a smaller PNG
+
+    Returns:
+        bytes: The encoded image
+    """
+    image = EncodedImage(data, size, mode).decode()
+    if extension == 'jpg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, format=FORMATS[extension], quality=quality,
+               optimize=optimize)
+    return output.getvalue()
+
+
+# ------------------------------- SINKS ---------------------------------- #
+class DirectorySink:
+    """Writes each map as a file in a folder."""
+    resumable = True
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        """Write a file, renamed into place so it is never half written."""
+        path = os.path.join(self.path, name)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        pass
+
+
+class ZipSink:
+    """
+    Writes the maps into a ZIP file, appending when resuming.
+    PNG, WebP and JPEG are compressed already, so entries are stored.
+    """
+    resumable = True
+
+    def __init__(self, path, resume=False):
+        mode = 'a' if resume and os.path.exists(path) else 'w'
+        self.zip = zipfile.ZipFile(path, mode, zipfile.ZIP_STORED)
+        self.names = set(self.zip.namelist())
+
+    def write(self, name, data):
+        """Add an entry, one written before an interruption is kept."""
+        if name not in self.names:
+            self.zip.writestr(name, data)
+            self.names.add(name)
+
+    def close(self):
+        self.zip.close()
+
+
+class TarSink:
+    """
+    Writes the maps into a tar file or stream, "-" streams to stdout.
+    Only an uncompressed tar file can be appended to when resuming.
+    """
+
+    def __init__(self, path, resume=False):
+        compression = 'gz' if path.endswith(('.gz', '.tgz')) else ''
+        self.resumable = path != '-' and not compression
+        if path == '-':
+            self.tar = tarfile.open(
+                fileobj=sys.stdout.buffer, mode='w|')
+        elif resume and self.resumable and os.path.exists(path):
+            self.tar = tarfile.open(path, 'a')
+        else:
+            self.tar = tarfile.open(path, f'w:{compression}')
+
+    def write(self, name, data):
+        """Add one file to the archive."""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+def open_sink(path, resume=False):
+    """
+    Open the output for path: "-" is a tar stream on stdout, .zip a ZIP
+    file, .tar, .tar.gz and .tgz a tar file, anything else a folder.
+    """
+    lower = path.lower()
+    if path == '-' or lower.endswith(('.tar', '.tar.gz', '.tgz')):
+        return TarSink(path, resume)
+    if lower.endswith('.zip'):
+        return ZipSink(path, resume)
+    return DirectorySink(path)
+
+
+# ------------------------------ MANIFEST -------------------------------- #
+class Manifest:
+    """
+    JSON lines record of every exported map, one line per input row.
+    Rows recorded as ok or not_found are skipped when resuming, rows
+    that failed are tried again.
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        Open the manifest.
+
+        Args:
+            path (str): JSON lines file, None keeps nothing
+            resume (bool): Keep the rows of an earlier run
+        """
+        self.done = set()
+        self.file = None
+        if path is None:
+            return
+
+        if resume and os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry['status'] in ('ok', 'not_found'):
+                            self.done.add(entry['index'])
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def record(self, entry):
+        """Append a row and flush it so progress is never lost."""
+        if entry['status'] in ('ok', 'not_found'):
+            self.done.add(entry['index'])
+        if self.file is not None:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+# ---------------------------- EXPORT MAPS ------------------------------- #
+def export_maps(service, locations, output, zoom=15, map_type='map',
+                extension='png', quality=80, optimize=False, max_workers=8,
+                processes=None, resume=True, stop_at_soft_limit=True):
+    """
+    Fetch a static map for every location and write it to output.
+    Maps are named by their input row, 000000.png and so on, and the
+    manifest output.manifest.jsonl lists each row's location and file.
+
+    A map is only requested while the quota can pay for it: the export
+    stops at the quota's soft limit, or when the quota runs out, and
+    can be resumed later with the same arguments.
+
+    Args:
+        service (MapService): Service used for the lookups, its width
+            and height are the size of the exported maps
+        locations (iterable): Addresses or (lat, lng) coordinates
+        output (str): Folder, .zip, .tar, .tar.gz, or "-" for stdout
+        zoom (int): Zoom level (1-20)
+        map_type (str): Type of map (map, sat, hyb, light, dark)
+        extension (str): png, webp or jpg
+        quality (int): WebP and JPEG quality (1-100)
+        optimize (bool): Re-encode PNGs smaller
+        max_workers (int): Number of maps fetched at once
+        processes (int): Re-encoding processes, None for one per CPU,
+            0 re-encodes in the fetch threads
+        resume (bool): Skip rows the manifest already has
+        stop_at_soft_limit (bool): Leave the quota above the soft limit
+            for interactive use
+
+    Returns:
+        dict: Number of maps ok, not_found, error and skipped, and
+        stopped, 'quota' if the export stopped early, else None
+    """
+    if extension not in FORMATS:
+        raise ValueError(f"extension must be one of {', '.join(FORMATS)}")
+
+    size = (service.width, service.height)
+    mode = 'scale' if service.resize_mode == 'scale' else 'crop'
+
+    sink = open_sink(output, resume)
+    resume = resume and sink.resumable
+    manifest = Manifest(
+        None if output == '-' else output.rstrip('/\\') + '.manifest.jsonl',
+        resume)
+
+    # CPU heavy encoding goes to processes, a plain PNG copy needs none.
+    # Spawned so the pool does not fork a process that has threads.
+    encoder = None
+    if (extension != 'png' or optimize) and processes != 0:
+        encoder = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def quota_allows(cost):
+        """True if the quota can pay for cost more transactions."""
+        quota = service.quota
+        if quota is None:
+            return True
+        if stop_at_soft_limit and quota.soft_limit_reached:
+            return False
+        return quota.remaining >= cost
+
+    def export_one(location):
+        """Fetch and encode one map, runs in a fetch thread."""
+        if isinstance(location, tuple):
+            location_data = {
+                'latitude': location[0], 'longitude': location[1]}
+        else:
+            location_data = service.geocode_location(location)
+            if location_data is None:
+                return None, None
+
+        image, _ = service.get_static_map(
+            (location_data['latitude'], location_data['longitude']),
+            zoom, map_type, decode=False)
+
+        data = image.data
+        if extension != 'png' or optimize or not image.is_png \
+                or image.source_size != size:
+            args = (data, extension, size, mode, quality, optimize)
+            if encoder is not None:
+                data = encoder.submit(encode_image, *args).result()
+            else:
+                data = encode_image(*args)
+        return data, location_data
+
+    counts = {'ok': 0, 'not_found': 0, 'error': 0, 'skipped': 0,
+              'stopped': None}
+    locations = enumerate(locations)
+    # (index, location, future), in input order
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                # Keep a window of requests in flight, each one only
+                # if the quota can still pay for a geocode and a map
+                while counts['stopped'] is None \
+                        and len(pending) < 2 * max_workers:
+                    index, location = next(locations, (None, None))
+                    if index is None:
+                        break
+                    if index in manifest.done:
+                        counts['skipped'] += 1
+                        continue
+                    if not quota_allows(
+                            1 if isinstance(location, tuple) else 2):
+                        counts['stopped'] = 'quota'
+                        break
+                    pending.append((index, location, executor.submit(
+                        export_one, location)))
+
+                if not pending:
+                    break
+
+                index, location, future = pending.popleft()
+                entry = {
+                    'index': index,
+                    'location': location if isinstance(location, str)
+                    else list(location),
+                }
+                try:
+                    data, location_data = future.result()
+                except QuotaExceeded as e:
+                    counts['stopped'] = 'quota'
+                    entry.update(status='error', error=str(e))
+                except Exception as e:
+                    entry.update(status='error', error=str(e))
+                else:
+                    if data is None:
+                        entry['status'] = 'not_found'
+                    else:
+                        name = f"{index:06d}.{extension}"
+                        sink.write(name, data)
+                        entry.update(
+                            status='ok', file=name, bytes=len(data),
+                            latitude=location_data['latitude'],
+                            longitude=location_data['longitude'])
+                counts[entry['status']] += 1
+                manifest.record(entry)
+    finally:
+        if encoder is not None:
+            encoder.shutdown()
+        sink.close()
+        manifest.close()
+
+    return counts
+
+
+def main():
+    """Parse the command line and export the maps."""
+    parser = argparse.ArgumentParser(
+        description="Export MapQuest static maps for a file of locations")
+    parser.add_argument(
+        "input", help="CSV or JSONL file of addresses or coordinates")
+    parser.add_argument(
+        "output", help="folder, .zip, .tar or .tar.gz file, - for stdout")
+    parser.add_argument(
+        "--column", default="address",
+        help="column or key holding the address (default: address)")
+    parser.add_argument("--zoom", type=int, default=15)
+    parser.add_argument("--type", default="map", choices=MAP_TYPES)
+    parser.add_argument(
+        "--size", default="400x300", help="width x height (default: 400x300)")
+    parser.add_argument("--format", default="png", choices=list(FORMATS))
+    parser.add_argument(
+        "--quality", type=int, default=80, help="WebP and JPEG quality")
+    parser.add_argument(
+        "--optimize", action="store_true", help="re-encode PNGs smaller")
+    parser.add_argument(
+        "--workers", type=int, default=8, help="maps fetched at once")
+    parser.add_argument(
+        "--processes", type=int,
+        help="re-encoding processes, 0 for none (default: one per CPU)")
+    parser.add_argument(
+        "--restart", action="store_true",
+        help="ignore the manifest of an earlier run")
+    parser.add_argument(
+        "--past-soft-limit", action="store_true",
+        help="keep going past the quota's soft limit")
+    parser.add_argument(
+        "--base-url", help="send requests to another server with the same API")
+    args = parser.parse_args()
+
+    service = MapService(pool_size=args.workers, base_url=args.base_url)
+    service.width, service.height = (
+        int(value) for value in args.size.lower().split("x"))
+    try:
+        counts = export_maps(
+            service,
+            read_locations(args.input, args.column),
+            args.output,
+            zoom=args.zoom,
+            map_type=args.type,
+            extension=args.format,
+            quality=args.quality,
+            optimize=args.optimize,
+            max_workers=args.workers,
+            processes=args.processes,
+            resume=not args.restart,
+            stop_at_soft_limit=not args.past_soft_limit
+        )
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        service.close()
+
+    # stdout may be the tar stream
+    print(f"Exported {counts['ok']} maps, {counts['not_found']} not found, "
+          f"{counts['error']} failed, {counts['skipped']} done before",
+          file=sys.stderr)
+    if counts['stopped'] == 'quota':
+        print("Stopped to stay within the quota, run again to continue",
+              file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+    Name: map_server.py
+    Author:
+    Created:
+    Purpose: Headless HTTP/JSON service around MapService
+    Every client shares one MapService, so one quota and one warm cache
+    Identical requests in flight share one API call through the
+    MapService request coalescing
+    A bounded worker pool answers 503 instead of queueing without limit
+
+    python map_server.py --port 8080 --workers 8
+    GET /geocode?location=Scottsbluff NE
+    GET /staticmap?location=Scottsbluff NE&zoom=14&type=map
+    GET /health
+    GET /metrics
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlsplit, parse_qs
+from map_service import LocationNotFound, MapService, MAP_TYPES
+from quota import QuotaExceeded
+
+logger = logging.getLogger("mapquest")
+
+
+class MapServer:
+    """
+    A threaded HTTP server that answers geocode and static map
+    requests from one shared MapService.
+    Lookups run on a bounded worker pool, identical lookups in flight
+    are merged by the MapService.
+    """
+
+    def __init__(self, map_service=None, host="127.0.0.1", port=8080,
+                 workers=8, max_pending=64, timeout=30):
+        """
+        Initialize the server, call start or serve_forever to begin.
+
+        Args:
+            map_service (MapService): Service shared by every client,
+                None creates one with the default caches and quota
+            host (str): Interface to listen on
+            port (int): Port to listen on, 0 picks a free port
+            workers (int): Lookups run at the same time
+            max_pending (int): Lookups waiting for a worker before new
+                ones are answered with 503
+            timeout (float): Seconds a client waits for its lookup
+                before it is answered with 504
+        """
+        if map_service is None:
+            map_service = MapService()
+        self.map_service = map_service
+        self.timeout = timeout
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="map-server")
+
+        # One slot per running or queued lookup
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Routes each request to the MapServer instance."""
+            protocol_version = "HTTP/1.1"
+
+            # Headers and body go out in one write when the request is
+            # done, two small writes on a keep-alive connection would
+            # wait on Nagle and delayed ACK for about 40 ms
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                # Requests are counted in the instrumentation instead
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 256
+        self._thread = None
+
+    @property
+    def url(self):
+        """str: Base URL of the running server."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name="map-server",
+            daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve requests on this thread until shutdown is called."""
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """Stop the background thread and close the server."""
+        self.httpd.shutdown()
+        self.close()
+
+    def close(self):
+        """Close the socket and drop lookups still queued."""
+        self.httpd.server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ------------------------------ SUBMIT ------------------------------ #
+    def submit(self, func, *args):
+        """
+        Run func on the worker pool if a slot is free.
+
+        Args:
+            func (callable): Lookup to run
+            *args: Arguments for func
+
+        Returns:
+            Future: Result of the lookup, None if the pool is full
+        """
+        if not self._slots.acquire(blocking=False):
+            self.map_service.instrumentation.count('server.rejected')
+            return None
+
+        with self._lock:
+            self._in_flight += 1
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        """Free the slot of a finished lookup."""
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    # ------------------------------ HANDLE ------------------------------ #
+    def _handle(self, handler):
+        """Answer one request."""
+        start = time.perf_counter()
+        parts = urlsplit(handler.path)
+        query = {name: values[0]
+                 for name, values in parse_qs(parts.query).items()}
+        path = parts.path.rstrip("/")
+
+        if path == "/geocode":
+            self._geocode(handler, query)
+        elif path == "/staticmap":
+            self._static_map(handler, query)
+        elif path == "/health":
+            self._health(handler)
+        elif path == "/metrics":
+            self._send(handler, 200, "text/plain; version=0.0.4",
+                       self.map_service.instrumentation.prometheus()
+                       .encode("utf-8"))
+            return
+        else:
+            self._send_error(handler, 404, "Not found")
+            return
+
+        self.map_service.instrumentation.observe(
+            f"server{path.replace('/', '.')}", time.perf_counter() - start)
+
+    def _geocode(self, handler, query):
+        """GET /geocode?location=..., answer the location data."""
+        location = query.get("location", "").strip()
+        if not location:
+            self._send_error(handler, 400, "location is required")
+            return
+
+        future = self.submit(self.map_service.geocode_location, location)
+        done, location_data = self._wait(handler, future)
+        if not done:
+            return
+        if not location_data:
+            self._send_error(handler, 404, "Location not found")
+            return
+        self._send_json(handler, 200, location_data.to_dict())
+
+    def _static_map(self, handler, query):
+        """GET /staticmap?location=...&zoom=...&type=..., answer a PNG."""
+        location = query.get("location", "").strip()
+        map_type = query.get("type", "map")
+        try:
+            zoom = int(query.get("zoom", 14))
+        except ValueError:
+            zoom = 0
+
+        if not location:
+            self._send_error(handler, 400, "location is required")
+            return
+        if not 1 <= zoom <= 20:
+            self._send_error(handler, 400, "zoom must be 1-20")
+            return
+        if map_type not in MAP_TYPES:
+            self._send_error(
+                handler, 400, f"type must be one of {', '.join(MAP_TYPES)}")
+            return
+
+        future = self.submit(self._render, location, zoom, map_type)
+        done, result = self._wait(handler, future)
+        if not done:
+            return
+        if result is None:
+            self._send_error(handler, 404, "Location not found")
+            return
+
+        data, location_data = result
+        self._send(handler, 200, "image/png", data, {
+            "X-Latitude": location_data["latitude"],
+            "X-Longitude": location_data["longitude"],
+        })
+
+    def _render(self, location, zoom, map_type):
+        """
+        Fetch a static map as PNG bytes, run on the worker pool.
+
+        Returns:
+            tuple: (bytes, GeocodeResult) - PNG data and the location,
+            None if the location cannot be found
+        """
+        try:
+            image, location_data = self.map_service.get_static_map(
+                location, zoom, map_type, decode=False)
+        except LocationNotFound:
+            return None
+        if image.is_png and image.box is None:
+            # Served exactly as fetched, no decode and no re-encode
+            return image.data, location_data
+
+        output = BytesIO()
+        image.decode().save(output, format="PNG")
+        return output.getvalue(), location_data
+
+    def _health(self, handler):
+        """GET /health, answer load and quota use."""
+        quota = self.map_service.quota
+        self._send_json(handler, 200, {
+            "status": "ok",
+            "in_flight": self._in_flight,
+            "quota_used": quota.used if quota is not None else None,
+            "quota_remaining": quota.remaining if quota is not None else None,
+        })
+
+    # ------------------------------- WAIT ------------------------------- #
+    def _wait(self, handler, future):
+        """
+        Wait for a lookup and answer the client if it failed.
+
+        Returns:
+            tuple: (bool, object) - True and the result, or False
+            once an error response has been sent
+        """
+        if future is None:
+            self._send_error(handler, 503, "Server busy, try again",
+                             {"Retry-After": "1"})
+            return False, None
+
+        try:
+            return True, future.result(timeout=self.timeout)
+        except TimeoutError:
+            self._send_error(handler, 504, "Lookup timed out")
+        except QuotaExceeded:
+            self._send_error(handler, 429, "Monthly quota used up")
+        except Exception:
+            # Upstream errors carry the request URL and with it the
+            # API key, clients only get a fixed message
+            logger.exception("Lookup failed: %s", handler.path)
+            self._send_error(handler, 502, "Upstream lookup failed")
+        return False, None
+
+    # ------------------------------- SEND ------------------------------- #
+    def _send_json(self, handler, status, data, headers=None):
+        """Send a JSON response."""
+        self._send(handler, status, "application/json;charset=UTF-8",
+                   json.dumps(data).encode("utf-8"), headers)
+
+    def _send_error(self, handler, status, message, headers=None):
+        """Send a JSON error response."""
+        self._send_json(handler, status, {"error": message}, headers)
+
+    def _send(self, handler, status, content_type, data, headers=None):
+        """Send a response."""
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, str(value))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def main():
+    """Parse the command line and serve until interrupted."""
+    parser = argparse.ArgumentParser(
+        description="Headless HTTP/JSON service for MapQuest maps")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=8,
+                        help="lookups run at the same time (default: 8)")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="queued lookups before answering 503")
+    parser.add_argument("--timeout", type=float, default=30,
+                        help="seconds before a lookup answers 504")
+    parser.add_argument("--size", default="800x600",
+                        help="static map size, WIDTHxHEIGHT")
+    parser.add_argument("--base-url",
+                        help="API host to use instead of MapQuest")
+    args = parser.parse_args()
+
+    service = MapService(base_url=args.base_url, pool_size=args.workers)
+    service.width, service.height = (
+        int(value) for value in args.size.lower().split("x"))
+
+    server = MapServer(
+        service, args.host, args.port, args.workers, args.max_pending,
+        args.timeout)
+    print(f"Map server on {server.url}, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,186 @@
     Purpose: MapQuest service class to retrieve maps of location
     15,000 requests per month
 """
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import requests
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+from PIL import Image, ImageOps
 from io import BytesIO
+from urllib.parse import quote_plus, urlsplit
 from api_key import API_KEY, GEOCODE_ENDPOINT, MAP_ENDPOINT
+from map_cache import (
+    CACHE_DIR, EncodedImage, GeocodeCache, ImageCache, RouteCache,
+    decode_image, normalize_query)
+from quota import QuotaTracker, TokenBucket
+from mercator import TILE_SIZE, fit_bounds, grid_clusters, tile_center
+from spatial_index import GeohashIndex
+from instrumentation import Instrumentation
+from single_flight import SingleFlight
+from route_shape import decode_polyline, encode_polyline, simplify
+from offline_pack import OfflinePack, PACK_PATH
+from geocode_result import GeocodeResult
+
+# Batch geocoding accepts up to 100 locations per call
+BATCH_ENDPOINT = GEOCODE_ENDPOINT.rsplit('/', 1)[0] + '/batch'
+MAX_BATCH_SIZE = 100
+
+# Reverse geocoding turns a coordinate into an address
+REVERSE_ENDPOINT = GEOCODE_ENDPOINT.rsplit('/', 1)[0] + '/reverse'
+REVERSE_CACHE_PATH = os.path.join(CACHE_DIR, "reverse.db")
+
+# Normalized cache key of a reverse geocoded coordinate
+COORDINATE_KEY = re.compile(r"-?\d+\.\d{6} -?\d+\.\d{6}")
+
+# Custom marker style for the static map
+DEFAULT_MARKER = 'marker-md-3B5998-22407F'
+
+# Extra pixels fetched around a tile and cropped off again,
+# the static map API stamps its logo in the corners of every image
+TILE_MARGIN = 32
+
+# Map types offered by the static map API
+MAP_TYPES = ('map', 'hyb', 'sat', 'light', 'dark')
+
+# Directions endpoint for routes between locations
+DIRECTIONS_ENDPOINT = GEOCODE_ENDPOINT.split('/geocoding/')[0] \
+    + '/directions/v2/route'
+
+# Route matrix, travel distances from one origin to many places
+MATRIX_ENDPOINT = DIRECTIONS_ENDPOINT.rsplit('/', 1)[0] + '/routematrix'
+MAX_MATRIX_SIZE = 100
+
+# Route types offered by the directions API
+ROUTE_TYPES = ('fastest', 'shortest', 'pedestrian', 'bicycle')
+
+# Longest route shape parameter sent to the static map API, measured
+# URL encoded, longer routes are simplified further until they fit
+MAX_SHAPE_LENGTH = 4000
+
+# Markers sent in one multi-location map, more are clustered
+# so the request URL stays well under the server's length limit
+MAX_MARKERS = 50
+
+# Seconds after a failed connection during which requests fail at
+# once, so lookups go straight to the offline pack
+OFFLINE_COOLDOWN = 30
+
+
+class LocationNotFound(Exception):
+    """Raised when geocoding finds no match for a location."""
+
+    def __init__(self, message="Location not found"):
+        super().__init__(message)
+
+
+# ------------------------------ REBASE ---------------------------------- #
+def rebase(url, base_url):
+    """
+    Point an endpoint at another server, keeping its path.
+
+    Args:
+        url (str): Endpoint URL, such as MAP_ENDPOINT
+        base_url (str): Scheme and host to use instead,
+            such as "http://127.0.0.1:8000", None keeps url unchanged
+
+    Returns:
+        str: The endpoint on base_url
+    """
+    if base_url is None:
+        return url
+    return base_url.rstrip('/') + urlsplit(url).path
+
+
+# --------------------------- NEVER CONNECTED ---------------------------- #
+def never_connected(error):
+    """
+    Tell a dead network apart from a slow or failing server.
+
+    requests reports a read timeout that used up its retries as a
+    ConnectionError too, the urllib3 reason says what really happened.
+
+    Args:
+        error (requests.exceptions.RequestException): The request error
+
+    Returns:
+        bool: True if no connection to the server could be made,
+        a refused connection, a DNS failure or a connect timeout
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    # Retried requests wrap the last error in a MaxRetryError
+    reason = getattr(reason, 'reason', reason)
+    # NewConnectionError, and with it DNS failures, is a subclass
+    return isinstance(reason, ConnectTimeoutError)
+
+
+# --------------------------- PARSE LOCATION ----------------------------- #
+def parse_location(location_data):
+    """
+    Convert one location from a geocoding response into a result.
+
+    Args:
+        location_data (dict): An entry of results[n]['locations']
+
+    Returns:
+        GeocodeResult: Coordinates and address components
+    """
+    return GeocodeResult.from_api(location_data)
+
+
+# ----------------------------- MAP PARAMS ------------------------------- #
+def map_params(location_data, width, height, zoom, map_type):
+    """
+    Build the static map parameters for a geocoded location.
+
+    Args:
+        location_data (GeocodeResult): Result from geocode_location
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        zoom (str/int): Zoom level (1-20)
+        map_type (str): Type of map (map, sat, hyb, light, dark)
+
+    Returns:
+        dict: Static map query parameters, without the API key
+    """
+    # Create the center point string for the map
+    center = f"{location_data['latitude']},{location_data['longitude']}"
+
+    return {
+        'center': center,
+        'size': f"{width},{height}",
+        'zoom': zoom,
+        'locations': center,  # This adds a marker at the location
+        'type': map_type,
+        'defaultMarker': DEFAULT_MARKER
+    }
+
+
+# ------------------------------ WAYPOINT -------------------------------- #
+def waypoint(point):
+    """
+    Format a route end point for the directions API.
+
+    Args:
+        point: Location string, GeocodeResult or (lat, lng)
+
+    Returns:
+        str: The location string, or "lat,lng" for coordinates
+    """
+    if isinstance(point, (dict, GeocodeResult)):
+        point = (point['latitude'], point['longitude'])
+    if isinstance(point, (tuple, list)):
+        return f"{point[0]:.6f},{point[1]:.6f}"
+    return str(point)
 
 
 class MapService:
@@ -17,11 +193,298 @@ class MapService:
     This includes geocoding locations and retrieving static map images.
     """
 
-    def __init__(self):
+    def __init__(self, geocode_cache=None, image_cache=None,
+                 connect_timeout=3.05, read_timeout=10, retries=3,
+                 backoff_factor=0.5, pool_size=10, quota=None,
+                 rate_limiter=None, resize_mode=None, fetch_size=None,
+                 base_url=None, instrumentation=None, coalesce=True,
+                 route_cache=None, offline_pack=None, geocode_store=None,
+                 offline_cooldown=None, reverse_cache=None):
+        """
+        Initialize the MapService.
+
+        Args:
+            geocode_cache (GeocodeCache): Cache for geocode results,
+                None uses the default on-disk cache, False disables caching
+            image_cache (ImageCache): Cache for static map images,
+                None uses the default on-disk cache, False disables caching
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait between response bytes
+            retries (int): Retries on connection errors and 429/5xx responses
+            backoff_factor (float): Base delay for exponential retry backoff
+            pool_size (int): Keep-alive connections kept per host
+            quota (QuotaTracker): Monthly usage counter, None uses the
+                default persisted counter, False disables quota tracking
+            rate_limiter (TokenBucket): Limits requests per second,
+                None uses a default bucket, False disables rate limiting
+            resize_mode (str): None fetches every size from the API,
+                'crop' center crops smaller sizes out of one larger image,
+                'scale' downscales the larger image instead
+            fetch_size (tuple): (width, height) fetched in a resize mode,
+                normally the largest size the caller will ask for
+            base_url (str): Send requests to another server with the
+                same API, such as a local stand-in for testing
+            instrumentation (Instrumentation): Collects stage timings and
+                counters, None creates a new one
+            coalesce (bool): Threads asking for the same geocode or map
+                at the same time share one request
+            route_cache (RouteCache): Cache for route geometry,
+                None uses the default on-disk cache, False disables caching
+            offline_pack (OfflinePack): Pack served from when a request
+                fails, None opens the default pack if one was exported,
+                False disables it
+            geocode_store (GeocodeStore): Columnar store every geocode
+                result is added to, for spatial queries over large
+                batches, None keeps no store
+            offline_cooldown (float): Seconds after a failed connection
+                before the network is tried again, lookups fail at once
+                or come from the pack until then, None uses
+                OFFLINE_COOLDOWN when there is an offline pack and 0
+                without one, 0 tries the network every time
+            reverse_cache (GeocodeCache): Cache for reverse geocode
+                results by coordinate, kept apart from the geocode cache,
+                None uses the default on-disk cache, False disables caching
+        """
         # Default dimensions for the map image
         self.width = 800
         self.height = 600
 
+        # Per-stage spans, cache hit/miss counters, bytes and quota use
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation
+
+        # API endpoints
+        self.geocode_endpoint = rebase(GEOCODE_ENDPOINT, base_url)
+        self.batch_endpoint = rebase(BATCH_ENDPOINT, base_url)
+        self.reverse_endpoint = rebase(REVERSE_ENDPOINT, base_url)
+        self.map_endpoint = rebase(MAP_ENDPOINT, base_url)
+        self.directions_endpoint = rebase(DIRECTIONS_ENDPOINT, base_url)
+        self.matrix_endpoint = rebase(MATRIX_ENDPOINT, base_url)
+
+        # Geocode results are cached so changing zoom, map type or
+        # resolution does not repeat the geocoding round trip
+        if geocode_cache is None:
+            geocode_cache = GeocodeCache()
+        elif geocode_cache is False:
+            geocode_cache = None
+        self.geocode_cache = geocode_cache
+
+        # Static map images are cached by their full request parameters
+        # so returning to a previous view is a local lookup
+        if image_cache is None:
+            image_cache = ImageCache()
+        elif image_cache is False:
+            image_cache = None
+        self.image_cache = image_cache
+
+        # Route geometry is cached so a repeated route costs no request
+        if route_cache is None:
+            route_cache = RouteCache()
+        elif route_cache is False:
+            route_cache = None
+        self.route_cache = route_cache
+
+        # Reverse geocodes are keyed by coordinate, not by query, so
+        # they stay out of the geocode cache, the index and the store
+        if reverse_cache is None:
+            reverse_cache = GeocodeCache(path=REVERSE_CACHE_PATH)
+        elif reverse_cache is False:
+            reverse_cache = None
+        self.reverse_cache = reverse_cache
+
+        # Timeouts so a stalled socket cannot hang the GUI forever
+        self.timeout = (connect_timeout, read_timeout)
+
+        # One pooled session reuses the TCP+TLS connection between the
+        # geocode and static map calls instead of a handshake per call
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            # Batch geocoding is a POST but has no side effects
+            allowed_methods=frozenset(['GET', 'POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Timing of the most recent requests, newest last
+        self.timings = deque(maxlen=100)
+
+        # Every request is counted against the 15,000 per month quota
+        if quota is None:
+            quota = QuotaTracker()
+        elif quota is False:
+            quota = None
+        self.quota = quota
+
+        # Bursts are smoothed out so they cannot burn the quota in minutes
+        if rate_limiter is None:
+            rate_limiter = TokenBucket()
+        elif rate_limiter is False:
+            rate_limiter = None
+        self.rate_limiter = rate_limiter
+
+        # Smaller sizes can be cut out of one large image locally,
+        # so switching resolution costs no request
+        if resize_mode not in (None, 'crop', 'scale'):
+            raise ValueError("resize_mode must be None, 'crop' or 'scale'")
+        self.resize_mode = resize_mode
+        self.fetch_size = fetch_size
+
+        # Spatial index over geocode results for local reverse geocoding,
+        # seeded from the geocode cache on first use
+        self.spatial_index = GeohashIndex()
+        self._index_seeded = False
+
+        # Identical lookups in flight at once share one request
+        self.flights = SingleFlight() if coalesce else None
+
+        # Without a network, geocodes, maps and tiles come from the pack
+        if offline_pack is None:
+            offline_pack = OfflinePack() if os.path.exists(PACK_PATH) \
+                else None
+        elif offline_pack is False:
+            offline_pack = None
+        self.offline_pack = offline_pack
+
+        # A simple circuit breaker, open until this perf_counter time.
+        # Without a pack there is nothing to fall back to, so every
+        # lookup tries the network
+        if offline_cooldown is None:
+            offline_cooldown = OFFLINE_COOLDOWN if offline_pack is not None \
+                else 0
+        self.offline_cooldown = offline_cooldown
+        self._offline_until = 0.0
+
+        # Optional, it needs NumPy, see geocode_store.py
+        self.geocode_store = geocode_store
+
+    # ------------------------------- GET -------------------------------- #
+    def _get(self, url, params, kind, json=None, cost=1):
+        """
+        Make a GET request on the pooled session and record its timing.
+
+        Args:
+            url (str): Endpoint to call
+            params (dict): Query parameters, without the API key
+            kind (str): Request kind for timing and quota (geocode, map)
+            json (dict): Request body, makes the request a POST
+            cost (int): Quota transactions used by the request
+
+        Returns:
+            requests.Response: The response, already checked for errors
+
+        Raises:
+            QuotaExceeded: If the monthly quota has been used up
+            requests.exceptions.RequestException: If the request fails,
+                at once while offline after a failed connection
+        """
+        instrumentation = self.instrumentation
+
+        # After a failed connection, skip the network and its retries
+        # until the cool-down is over
+        if self.offline:
+            instrumentation.count('offline.skipped')
+            raise requests.exceptions.ConnectionError(
+                "Offline, the network is tried again in "
+                f"{self._offline_until - time.perf_counter():.0f} s")
+
+        # Counted before the request, so threads and processes sharing
+        # the quota cannot all take its last transactions
+        if self.quota is not None:
+            self.quota.reserve(kind, cost)
+        if self.rate_limiter is not None:
+            with instrumentation.span('rate_limit.wait'):
+                self.rate_limiter.acquire()
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                'GET' if json is None else 'POST',
+                url,
+                params={'key': API_KEY, **params},
+                json=json,
+                timeout=self.timeout
+            )
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            # Only a dead network opens the breaker, a slow server is
+            # tried again by the next lookup
+            if never_connected(e):
+                # A request that never connected used no transaction
+                if self.quota is not None:
+                    self.quota.record(kind, -cost)
+                if self.offline_cooldown:
+                    self._offline_until = \
+                        time.perf_counter() + self.offline_cooldown
+                    instrumentation.count('offline.opened')
+            raise
+        total = time.perf_counter() - start
+
+        # Retried attempts the server answered were transactions too
+        retries = response.raw.retries
+        attempts = 1 + sum(
+            1 for attempt in (retries.history if retries else ())
+            if attempt.status is not None)
+
+        if self.quota is not None:
+            if attempts > 1:
+                self.quota.record(kind, cost * (attempts - 1))
+            instrumentation.gauge('quota.used', self.quota.used)
+            instrumentation.gauge('quota.remaining', self.quota.remaining)
+
+        # requests does not expose DNS/TLS timing separately, the wait
+        # until the headers arrive includes connecting and server time
+        elapsed = response.elapsed.total_seconds()
+        instrumentation.observe(f'http.{kind}.wait', elapsed)
+        instrumentation.observe(
+            f'http.{kind}', total, status=response.status_code)
+        instrumentation.count(f'requests.{kind}')
+        instrumentation.count('bytes_received', len(response.content))
+
+        self.timings.append({
+            'kind': kind,
+            'status': response.status_code,
+            # Time until the response headers were parsed
+            'elapsed': elapsed,
+            # Wall time including retries and reading the body
+            'total': total,
+            'bytes': len(response.content),
+            'attempts': attempts
+        })
+
+        # Raise an exception for bad status codes
+        response.raise_for_status()
+        return response
+
+    @property
+    def last_timing(self):
+        """dict: Timing of the most recent request, None if no requests."""
+        return self.timings[-1] if self.timings else None
+
+    @property
+    def offline(self):
+        """bool: True during the cool-down after a failed connection."""
+        return time.perf_counter() < self._offline_until
+
+    @property
+    def soft_limit_reached(self):
+        """bool: True once quota usage passes the soft limit."""
+        return self.quota is not None and self.quota.soft_limit_reached
+
+    def close(self):
+        """Close the pooled HTTP session."""
+        self.session.close()
+
     # ----------------------- GEOCODE LOCATION --------------------------- #
     def geocode_location(self, location):
         """
@@ -33,100 +496,765 @@ class MapService:
             "1600 Pennsylvania Ave")
 
         Returns:
-            dict: Location data including coordinates and address components
+            GeocodeResult: Coordinates and address components
                  Returns None if location cannot be found
 
         Raises:
             Exception: If the API request fails or returns an error
         """
+        # Repeated and near-identical queries are served from the cache
+        if self.geocode_cache is not None:
+            cached = self.geocode_cache.get(location)
+            if cached is not None:
+                self.instrumentation.count('geocode_cache.hit')
+                self._index(location, cached)
+                return cached
+            self.instrumentation.count('geocode_cache.miss')
+
+        try:
+            return self._coalesce(
+                ('geocode', normalize_query(location)),
+                self._fetch_geocode, location)
+        except Exception:
+            # Offline, or out of quota, the pack may still know it
+            result = self._from_pack('geocode', location)
+            if result is None:
+                raise
+            return result
 
+    def _fetch_geocode(self, location):
+        """Geocode a location with the API, the cache miss path."""
         # Parameters for the geocoding request
         params = {
-            'key': API_KEY,
             'location': location,
             'maxResults': 1  # We only need the best match
         }
 
         try:
             # Make the API request
-            response = requests.get(
-                GEOCODE_ENDPOINT,
-                params=params
-            )
-
-            # Raise an exception for bad status codes
-            response.raise_for_status()
+            response = self._get(self.geocode_endpoint, params, 'geocode')
 
             # Parse the JSON response into a dictionary
             data = response.json()
 
             # Check if we got any results
             if data['results'] and data['results'][0]['locations']:
-                location_data = data['results'][0]['locations'][0]
-                lat_lng = location_data['latLng']
-
-                # Return structured location data
-                return {
-                    'latitude': lat_lng['lat'],
-                    'longitude': lat_lng['lng'],
-                    'street': location_data.get('street', 'N/A'),
-                    'city': location_data.get('adminArea5', 'N/A'),
-                    'state': location_data.get('adminArea3', 'N/A'),
-                    'postal_code': location_data.get('postalCode', 'N/A')
-                }
+                # Structured location data
+                result = parse_location(data['results'][0]['locations'][0])
+
+                if self.geocode_cache is not None:
+                    self.geocode_cache.put(location, result)
+                self._index(location, result)
+                return result
             return None
 
         except requests.exceptions.RequestException as e:
             raise Exception(f"Geocoding failed: {str(e)}")
 
+    # ------------------------------ INDEX ------------------------------- #
+    def _index(self, location, result):
+        """Add a geocode result to the spatial index and the store."""
+        self.spatial_index.add(
+            normalize_query(location),
+            result['latitude'],
+            result['longitude'],
+            result
+        )
+        if self.geocode_store is not None:
+            self.geocode_store.add(location, result)
+
+    # ------------------------- REVERSE GEOCODE -------------------------- #
+    def reverse_geocode(self, latitude, longitude, max_distance=50):
+        """
+        Convert a coordinate into address details.
+        A known location within max_distance meters is returned without
+        an API call, only a miss uses the reverse geocoding endpoint.
+        Its results are kept in the reverse cache, apart from the
+        geocodes of location strings.
+
+        Args:
+            latitude (float): Latitude in degrees
+            longitude (float): Longitude in degrees
+            max_distance (float): Meters a known location may be away
+
+        Returns:
+            GeocodeResult: Coordinates and address components
+                 Returns None if no address is found
+
+        Raises:
+            Exception: If the API request fails or returns an error
+        """
+        # Load everything geocoded in earlier sessions into the index
+        if not self._index_seeded:
+            self._index_seeded = True
+            if self.geocode_cache is not None:
+                for key, result in self.geocode_cache.items():
+                    # Older versions cached reverse geocodes here
+                    if result and not COORDINATE_KEY.fullmatch(key):
+                        self._index(key, result)
+
+        nearest = self.spatial_index.nearest(
+            latitude, longitude, max_distance)
+        if nearest is not None:
+            return nearest[0]
+
+        # Coordinates are cached under a fixed precision key
+        location = f"{latitude:.6f},{longitude:.6f}"
+        if self.reverse_cache is not None:
+            cached = self.reverse_cache.get(location)
+            if cached is not None:
+                return cached
+
+        params = {'location': location}
+
+        try:
+            response = self._get(self.reverse_endpoint, params, 'geocode')
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Reverse geocoding failed: {str(e)}")
+
+        if data['results'] and data['results'][0]['locations']:
+            result = parse_location(data['results'][0]['locations'][0])
+            if self.reverse_cache is not None:
+                self.reverse_cache.put(location, result)
+            return result
+        return None
+
+    # -------------------------- GEOCODE MANY ---------------------------- #
+    def geocode_many(self, locations, batch_size=MAX_BATCH_SIZE,
+                     max_workers=4):
+        """
+        Geocode a stream of locations using the batch endpoint.
+
+        Locations are read in pages of batch_size. Cached locations are
+        answered locally, the rest of each page is sent as one batch
+        request, and up to max_workers pages are in flight at once.
+        Results are yielded in input order as soon as their page is done,
+        so large inputs are never held in memory.
+
+        Args:
+            locations (iterable): Location strings
+            batch_size (int): Locations per batch request (1-100)
+            max_workers (int): Number of pages fetched concurrently
+
+        Yields:
+            tuple: (str, GeocodeResult) - The location and its result,
+            the result is None if the location cannot be found
+
+        Raises:
+            Exception: If a batch request fails or returns an error
+        """
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        locations = iter(locations)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Keep a bounded window of pages in flight, oldest first
+            pending = deque()
+            while True:
+                while len(pending) < max_workers * 2:
+                    page = list(islice(locations, batch_size))
+                    if not page:
+                        break
+                    pending.append(
+                        executor.submit(self._geocode_page, page))
+
+                if not pending:
+                    return
+
+                yield from pending.popleft().result()
+
+    def _geocode_page(self, page):
+        """
+        Geocode one page of locations with a single batch request.
+
+        Args:
+            page (list): Up to MAX_BATCH_SIZE location strings
+
+        Returns:
+            list: (location, GeocodeResult or None) tuples in page order
+        """
+        # One query and one commit for the whole page
+        found = {}
+        if self.geocode_cache is not None:
+            found = self.geocode_cache.get_many(page)
+
+        results = {}
+        misses = []
+        for location in page:
+            cached = found.get(location)
+            if cached is not None:
+                self._index(location, cached)
+                results[location] = cached
+            elif location not in misses:
+                misses.append(location)
+
+        if misses:
+            body = {
+                'locations': misses,
+                'options': {'maxResults': 1}
+            }
+
+            try:
+                # Each location in a batch counts as one transaction
+                response = self._get(
+                    self.batch_endpoint, {}, 'geocode', json=body,
+                    cost=len(misses))
+                data = response.json()
+            except requests.exceptions.RequestException as e:
+                raise Exception(f"Geocoding failed: {str(e)}")
+
+            # Batch results come back in request order
+            fresh = {}
+            for location, result in zip(misses, data['results']):
+                if result['locations']:
+                    result = parse_location(result['locations'][0])
+                    fresh[location] = result
+                    self._index(location, result)
+                    results[location] = result
+                else:
+                    results[location] = None
+            if fresh and self.geocode_cache is not None:
+                self.geocode_cache.put_many(fresh)
+
+        return [(location, results[location]) for location in page]
+
 # ------------------------- GET STATIC MAP ------------------------------- #
-    def get_static_map(self, location, zoom, map_type):
+    def get_static_map(self, location, zoom, map_type, decode=True):
         """
         Retrieve a static map image for a given location.
 
         Args:
-            location (str): Location string to map
+            location (str): Location string to map, or (lat, lng)
+                coordinates, which are mapped without geocoding
             zoom (str/int): Zoom level (1-20)
             map_type (str): Type of map (map, sat, hyb, light, dark)
+            decode (bool): False returns an EncodedImage holding the
+                response bytes, decoded only if and when it is needed
 
         Returns:
-            tuple: (PIL.Image, dict) - The map image and location data
+            tuple: (PIL.Image, GeocodeResult) - The map image and the
+            location, (EncodedImage, GeocodeResult) when decode is False
 
         Raises:
-            Exception: If the location cannot be found or 
-            the map cannot be retrieved
+            LocationNotFound: If the location cannot be found
+            Exception: If the map cannot be retrieved
         """
+        with self.instrumentation.span('get_static_map'):
+            return self._static_map(location, zoom, map_type, decode)
 
+    def _static_map(self, location, zoom, map_type, decode=True):
+        """Body of get_static_map, timed as one span."""
         # Get the coordinates for the location
-        location_data = self.geocode_location(location)
+        if isinstance(location, (tuple, list)):
+            location_data = GeocodeResult(location[0], location[1])
+        else:
+            location_data = self.geocode_location(location)
 
         # Check if location was found
         if not location_data:
-            raise Exception("Location not found")
-
-        # Create the center point string for the map
-        center = f"{location_data['latitude']},{location_data['longitude']}"
+            raise LocationNotFound()
 
         # Parameters for the static map request
+        params = self._source_params(location_data, zoom, map_type)
+
+        return self._map(params, decode), location_data
+
+    def _map(self, params, decode):
+        """
+        Return the static map for params from the image cache, or fetch
+        it once for every thread that wants it.
+
+        Args:
+            params (dict): Static map query parameters
+            decode (bool): False returns an EncodedImage
+
+        Returns:
+            PIL.Image: The map at the current size, or an EncodedImage
+        """
+        instrumentation = self.instrumentation
+
+        # A view we have already seen is served from the image cache
+        key = ImageCache.key(**params)
+        cache_key = None
+        if self.image_cache is not None:
+            cache_key = key
+            with instrumentation.span('image_cache.get'):
+                if decode:
+                    image = self.image_cache.get(cache_key)
+                else:
+                    image = self.image_cache.get_bytes(cache_key)
+            if image is not None:
+                instrumentation.count('image_cache.hit')
+                return self._finish(image, decode)
+            instrumentation.count('image_cache.miss')
+
+        try:
+            return self._coalesce(
+                ('map', key, self.width, self.height, decode),
+                self._fetch_map, params, cache_key, decode)
+        except Exception:
+            data = self._from_pack('image', key)
+            if data is None:
+                raise
+            return self._finish(decode_image(data) if decode else data, decode)
+
+    def _fetch_map(self, params, cache_key, decode):
+        """Download a static map, the cache miss path."""
+        instrumentation = self.instrumentation
+        try:
+            # Get the map image
+            response = self._get(self.map_endpoint, params, 'map')
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Failed to fetch map: {str(e)}")
+
+        if not decode:
+            # Keep the response bytes as they are, nothing is decoded
+            if cache_key is not None:
+                self.image_cache.put_bytes(cache_key, response.content)
+            return self._encoded(response.content)
+
+        with instrumentation.span('decode'):
+            # Store the raw bytes and return the decoded image
+            if cache_key is not None:
+                image = self.image_cache.put(cache_key, response.content)
+            else:
+                image = decode_image(response.content)
+
+        return self._fit(image)
+
+    # ----------------------------- COALESCE ----------------------------- #
+    def _coalesce(self, key, func, *args):
+        """
+        Run a lookup, sharing it with threads that want the same key.
+
+        Args:
+            key (tuple): Normalized request parameters
+            func (callable): Lookup that makes the request
+            *args: Arguments for func
+
+        Returns:
+            The result of func, possibly from another thread's call
+        """
+        if self.flights is None:
+            return func(*args)
+
+        result, shared = self.flights.do(key, func, *args)
+        if shared:
+            self.instrumentation.count('coalesced')
+        return result
+
+    # ----------------------------- FROM PACK ---------------------------- #
+    def _from_pack(self, lookup, *args):
+        """
+        Look something up in the offline pack after a request failed.
+
+        Args:
+            lookup (str): OfflinePack method, geocode, image or tile
+            *args: Arguments for the method
+
+        Returns:
+            The pack's answer, None if there is no pack or it is not in it
+        """
+        if self.offline_pack is None:
+            return None
+        result = getattr(self.offline_pack, lookup)(*args)
+        if result is not None:
+            self.instrumentation.count('offline_pack.hit')
+        return result
+
+    def _finish(self, image, decode):
+        """Fit a decoded image or wrap cached bytes, per decode."""
+        if decode:
+            return self._fit(image)
+        return self._encoded(image)
+
+    def _encoded(self, data):
+        """Wrap image bytes in an EncodedImage for the current size."""
+        return EncodedImage(
+            data, (self.width, self.height),
+            'scale' if self.resize_mode == 'scale' else 'crop')
+
+    # ------------------------- SOURCE PARAMS ---------------------------- #
+    def _source_params(self, location_data, zoom, map_type):
+        """
+        Build the static map parameters for the image to fetch.
+        In a resize mode this is at least fetch_size, so every smaller
+        size shares one cached source image.
+
+        Args:
+            location_data (GeocodeResult): Result from geocode_location
+            zoom (str/int): Zoom level (1-20)
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+
+        Returns:
+            dict: Static map query parameters, without the API key
+        """
+        width, height = self.width, self.height
+        if self.resize_mode is not None and self.fetch_size is not None:
+            width = max(width, self.fetch_size[0])
+            height = max(height, self.fetch_size[1])
+        return map_params(location_data, width, height, zoom, map_type)
+
+    def static_map_key(self, location_data, zoom, map_type):
+        """
+        Return the ImageCache key of the image fetched for a view.
+
+        Args:
+            location_data (GeocodeResult): Result from geocode_location
+            zoom (str/int): Zoom level (1-20)
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+
+        Returns:
+            str: Key of the source image in the image cache and packs
+        """
+        return ImageCache.key(
+            **self._source_params(location_data, zoom, map_type))
+
+    # ------------------------------- FIT -------------------------------- #
+    def _fit(self, image):
+        """
+        Cut or scale a source image down to the current width and height.
+
+        Args:
+            image (PIL.Image): Source image, at least width x height
+
+        Returns:
+            PIL.Image: Image of exactly width x height
+        """
+        size = (self.width, self.height)
+        if image.size == size:
+            return image
+
+        with self.instrumentation.span('resize'):
+            return self._resize(image, size)
+
+    def _resize(self, image, size):
+        """Crop or scale image to size, per resize_mode."""
+        if self.resize_mode == 'scale':
+            # Crop to the target aspect ratio, then downscale
+            return ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+
+        # Same zoom and center, a larger image just shows more
+        # area around the center, so a center crop is the exact view
+        width, height = size
+        left = (image.width - width) // 2
+        top = (image.height - height) // 2
+        return image.crop((left, top, left + width, top + height))
+
+# ------------------------ CACHED STATIC MAP ----------------------------- #
+    def cached_static_map(self, location, zoom, map_type, decode=True):
+        """
+        Look up a static map in the caches only, without any API call.
+        Callers can prefer this once soft_limit_reached is True.
+
+        Args:
+            location (str): Location string to map
+            zoom (str/int): Zoom level (1-20)
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+            decode (bool): False returns an EncodedImage, see
+                get_static_map
+
+        Returns:
+            tuple: (PIL.Image, GeocodeResult) - The map image and the
+            location, None if the location or the image is not cached
+        """
+        if self.geocode_cache is None or self.image_cache is None:
+            return None
+
+        location_data = self.geocode_cache.get(location)
+        if not location_data:
+            return None
+
+        cache_key = self.static_map_key(location_data, zoom, map_type)
+        if decode:
+            image = self.image_cache.get(cache_key)
+        else:
+            image = self.image_cache.get_bytes(cache_key)
+        if image is None:
+            return None
+        return self._finish(image, decode), location_data
+
+# ------------------------ GET STATIC MAP MULTI -------------------------- #
+    def get_static_map_multi(self, points, map_type='map',
+                             max_markers=MAX_MARKERS, decode=True):
+        """
+        Retrieve one static map that shows many locations.
+        The center and zoom are computed locally to fit every point,
+        and nearby points are merged into numbered cluster markers
+        when there are more than max_markers.
+
+        Args:
+            points (list): Location data dicts from geocode_location or
+                geocode_many, or (lat, lng) pairs
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+            max_markers (int): Most markers to draw before clustering
+            decode (bool): False returns an EncodedImage, see
+                get_static_map
+
+        Returns:
+            tuple: (PIL.Image, dict) - The map image and the view, with
+            latitude, longitude, zoom and markers, a list of
+            (lat, lng, count)
+
+        Raises:
+            Exception: If there are no points or
+            the map cannot be retrieved
+        """
+        coordinates = [
+            (point['latitude'], point['longitude'])
+            if isinstance(point, (dict, GeocodeResult)) else tuple(point)
+            for point in points if point
+        ]
+        if not coordinates:
+            raise Exception("No locations to map")
+
+        lat, lng, zoom = fit_bounds(coordinates, self.width, self.height)
+        markers = grid_clusters(coordinates, zoom, max_markers)
+
+        # Single points use the default marker, clusters show a count
+        locations = '||'.join(
+            f"{marker_lat:.6f},{marker_lng:.6f}"
+            + (f"|{DEFAULT_MARKER}-{count}" if count > 1 else '')
+            for marker_lat, marker_lng, count in markers
+        )
         params = {
-            'key': API_KEY,
-            'center': center,
+            'center': f"{lat:.6f},{lng:.6f}",
             'size': f"{self.width},{self.height}",
             'zoom': zoom,
-            'locations': center,  # This adds a marker at the location
+            'locations': locations,
             'type': map_type,
-            'defaultMarker': 'marker-md-3B5998-22407F'  # Custom marker style
+            'defaultMarker': DEFAULT_MARKER
+        }
+        view = {
+            'latitude': lat,
+            'longitude': lng,
+            'zoom': zoom,
+            'markers': markers
+        }
+
+        with self.instrumentation.span('get_static_map_multi'):
+            return self._map(params, decode), view
+
+# ------------------------------ GET ROUTE ------------------------------- #
+    def get_route(self, origin, destination, route_type='fastest',
+                  tolerance=10):
+        """
+        Retrieve a driving (or walking, cycling) route between two places.
+
+        Args:
+            origin: Location string, GeocodeResult or (lat, lng)
+            destination: Location string, GeocodeResult or (lat, lng)
+            route_type (str): fastest, shortest, pedestrian or bicycle
+            tolerance (float): Meters the simplified shape may stray
+                from the full route shape
+
+        Returns:
+            dict: distance in miles, time in seconds, formatted_time,
+            shape (the simplified shape, cmp6 compressed) and points,
+            the simplified shape as (lat, lng) pairs
+
+        Raises:
+            Exception: If no route is found or the request fails
+        """
+        if route_type not in ROUTE_TYPES:
+            raise ValueError(
+                f"route_type must be one of {', '.join(ROUTE_TYPES)}")
+
+        origin = waypoint(origin)
+        destination = waypoint(destination)
+        key = f"{route_type}|{tolerance}|{origin}|{destination}"
+
+        with self.instrumentation.span('get_route'):
+            route = None
+            if self.route_cache is not None:
+                route = self.route_cache.get(key)
+                self.instrumentation.count(
+                    'route_cache.miss' if route is None else 'route_cache.hit')
+            if route is None:
+                route = self._coalesce(
+                    ('route', normalize_query(key)), self._fetch_route,
+                    key, origin, destination, route_type, tolerance)
+
+            # Only the compressed shape is cached, it is a fraction of
+            # the size of the coordinate list
+            return {**route, 'points': decode_polyline(route['shape'])}
+
+    def _fetch_route(self, key, origin, destination, route_type, tolerance):
+        """Request a route from the API, the cache miss path."""
+        params = {
+            'from': origin,
+            'to': destination,
+            'routeType': route_type,
+            'fullShape': 'true',
+            'shapeFormat': 'cmp6',
+            'narrativeType': 'none',
+            'doReverseGeocode': 'false'
         }
 
         try:
-            # Get the map image
-            response = requests.get(MAP_ENDPOINT, params=params)
+            response = self._get(self.directions_endpoint, params, 'route')
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Routing failed: {str(e)}")
+
+        info = data.get('info', {})
+        if info.get('statuscode', 0) != 0 or 'shape' not in data['route']:
+            messages = '; '.join(info.get('messages', [])) or 'no route'
+            raise Exception(f"Routing failed: {messages}")
+
+        route = data['route']
+        with self.instrumentation.span('route_shape'):
+            points = decode_polyline(route['shape']['shapePoints'])
+            points = simplify(points, tolerance)
+
+        result = {
+            'distance': route['distance'],
+            'time': route['time'],
+            'formatted_time': route.get('formattedTime', ''),
+            'shape': encode_polyline(points)
+        }
+        if self.route_cache is not None:
+            self.route_cache.put(key, result)
+        return result
+
+# --------------------------- GET ROUTE MAP ------------------------------ #
+    def get_route_map(self, route, map_type='map', decode=True):
+        """
+        Retrieve a static map with a route drawn on it.
+
+        Args:
+            route (dict): Route from get_route
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+            decode (bool): False returns an EncodedImage, see
+                get_static_map
+
+        Returns:
+            tuple: (PIL.Image, dict) - The map image and the view, with
+            latitude, longitude and zoom
+        """
+        points = route['points']
+        lat, lng, zoom = fit_bounds(points, self.width, self.height)
 
-            # Raise an exception for bad status codes
-            response.raise_for_status()
+        # A long route must be thinned out to fit in the request URL.
+        # The static map API takes an encoded polyline as cmp6|enc:...,
+        # and most polyline characters are escaped in the URL.
+        shape = f"cmp6|enc:{route['shape']}"
+        tolerance = 10
+        while len(quote_plus(shape)) > MAX_SHAPE_LENGTH:
+            tolerance *= 2
+            shape = f"cmp6|enc:{encode_polyline(simplify(points, tolerance))}"
 
-            # Convert the response content to a PIL Image
-            return Image.open(BytesIO(response.content)), location_data
+        start, end = points[0], points[-1]
+        params = {
+            'center': f"{lat:.6f},{lng:.6f}",
+            'size': f"{self.width},{self.height}",
+            'zoom': zoom,
+            'shape': shape,
+            'locations': f"{start[0]:.6f},{start[1]:.6f}"
+                         f"||{end[0]:.6f},{end[1]:.6f}",
+            'type': map_type,
+            'defaultMarker': DEFAULT_MARKER
+        }
+        view = {'latitude': lat, 'longitude': lng, 'zoom': zoom}
+
+        with self.instrumentation.span('get_route_map'):
+            return self._map(params, decode), view
+
+# ---------------------------- ROUTE MATRIX ------------------------------ #
+    def route_matrix(self, origin, destinations, route_type='fastest'):
+        """
+        Retrieve road distances and travel times from one origin to
+        up to MAX_MATRIX_SIZE - 1 destinations in one request.
+        See distance_matrix.py for whole matrices with caching.
+
+        Args:
+            origin: Location string, GeocodeResult or (lat, lng)
+            destinations (list): Location strings, GeocodeResults
+                or (lat, lng) pairs
+            route_type (str): fastest, shortest, pedestrian or bicycle
 
+        Returns:
+            list: (float, float) - Distance in meters and time in
+            seconds to each destination, in order
+
+        Raises:
+            Exception: If the request fails
+        """
+        if len(destinations) > MAX_MATRIX_SIZE - 1:
+            raise ValueError(
+                f"At most {MAX_MATRIX_SIZE - 1} destinations per request")
+
+        body = {
+            'locations': [waypoint(origin)]
+            + [waypoint(destination) for destination in destinations],
+            'options': {
+                'allToAll': False,
+                'routeType': route_type,
+                'unit': 'k'
+            }
+        }
+
+        try:
+            response = self._get(
+                self.matrix_endpoint, {}, 'route', json=body)
+            data = response.json()
         except requests.exceptions.RequestException as e:
-            raise Exception(f"Failed to fetch map: {str(e)}")
+            raise Exception(f"Route matrix failed: {str(e)}")
+
+        info = data.get('info', {})
+        if info.get('statuscode', 0) != 0:
+            messages = '; '.join(info.get('messages', [])) or 'no routes'
+            raise Exception(f"Route matrix failed: {messages}")
+
+        # The first entry is the origin to itself
+        return [
+            (distance * 1000, seconds) for distance, seconds
+            in zip(data['distance'][1:], data['time'][1:])
+        ]
+
+# ------------------------------ GET TILE -------------------------------- #
+    def get_tile(self, x, y, zoom, map_type):
+        """
+        Retrieve one TILE_SIZE Web Mercator tile as PNG bytes.
+        The static map is requested a little larger than the tile and
+        cropped, which removes the logo from the corners.
+
+        Args:
+            x (int): Tile column
+            y (int): Tile row
+            zoom (int): Zoom level (1-20)
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+
+        Returns:
+            bytes: The tile encoded as PNG
+
+        Raises:
+            Exception: If the tile cannot be retrieved
+        """
+        lat, lng = tile_center(x, y, zoom)
+        size = TILE_SIZE + 2 * TILE_MARGIN
+        params = {
+            'center': f"{lat},{lng}",
+            'size': f"{size},{size}",
+            'zoom': zoom,
+            'type': map_type
+        }
+
+        try:
+            response = self._get(self.map_endpoint, params, 'map')
+        except Exception as e:
+            tile = self._from_pack('tile', x, y, zoom, map_type)
+            if tile is not None:
+                return tile
+            if isinstance(e, requests.exceptions.RequestException):
+                raise Exception(f"Failed to fetch tile: {str(e)}")
+            raise
+
+        image = Image.open(BytesIO(response.content))
+        tile = image.crop((
+            TILE_MARGIN, TILE_MARGIN,
+            TILE_MARGIN + TILE_SIZE, TILE_MARGIN + TILE_SIZE
+        ))
+        output = BytesIO()
+        tile.save(output, format='PNG')
+        return output.getvalue()
@@ -5,15 +5,29 @@
     Purpose: MapQuest GUI shows map of location
     15,000 requests per month
 """
+import time
+
+# Taken before any other import, startup stages are timed from here
+STARTED = time.perf_counter()
+
+import sys
 from base64 import b64decode
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import ImageTk
-# pip install tkinter-tooltip
-from tktooltip import ToolTip
-from map_service import MapService
+from map_worker import Debouncer, MapFetcher
+from startup import StartupTimer
 from telescope_ico import icon_16, icon_32
 
+# MapService (requests, PIL), the prefetcher, tooltips and the stats
+# window are imported after the window is on screen, see start_service
+
+# Set this to False to turn off prefetching of neighbouring views
+PREFETCH = True
+
+# Milliseconds the zoom, map type and resolution controls must be
+# still before a map is requested, 0 requests on every change
+DEBOUNCE_MS = 300
+
 
 class MapViewer:
     """
@@ -24,12 +38,14 @@ class MapViewer:
     search area, includes controls for map type and resolution selection.
     """
 
-    def __init__(self, root):
+    def __init__(self, root, timing=False):
         """
         Initialize the MapViewer application.
 
         Args:
             root: The root Tkinter window
+            timing (bool): Print the startup stages as JSON and exit
+                once the first map is shown
         """
         self.root = root
         self.root.title("MapQuest Map Viewer")
@@ -43,8 +59,36 @@ class MapViewer:
         # when the user clicks the close button of a window.
         self.root.protocol("WM_DELETE_WINDOW", self.quit)
 
-        # Initialize the MapService instance
-        self.map_service = MapService()
+        # Time to first frame, first map and the other startup stages
+        self.startup = StartupTimer(STARTED)
+        self.timing = timing
+
+        # The MapService is created by start_service once the window
+        # has been drawn, so the slow imports do not delay it
+        self.map_service = None
+
+        # Map requests run on a worker thread so the window stays responsive
+        self.fetcher = MapFetcher(self.root)
+
+        # Bursts of control changes request only the settled view
+        self.debouncer = Debouncer(self.root, DEBOUNCE_MS)
+
+        # Warms the cache for zoom +/- 1 and the other map types
+        # while the user looks at the current map, see start_service
+        self.prefetcher = None
+
+        # (widget, text) tooltips, attached once tktooltip is imported
+        self.tooltips = []
+
+        # Location, zoom and map type of the latest request
+        self.request = None
+
+        # When the latest request was made, for the update_map span
+        self.request_start = None
+
+        # Pannable tile map shown instead of the static map while the
+        # Tiles box is checked, created when first needed
+        self.tile_canvas = None
 
         # Default map settings
         # Default zoom level
@@ -61,6 +105,81 @@ class MapViewer:
 
         self.setup_ui()
 
+        # Draw the window first, then load the first map
+        self.root.bind("<Map>", self.on_first_frame, add="+")
+
+# ---------------------------- ON FIRST FRAME ---------------------------- #
+    def on_first_frame(self, event):
+        """
+        Start the map service once the window is on screen.
+
+        Args:
+            event: The <Map> event, child widgets send one too
+        """
+        if event.widget is not self.root or \
+                not self.startup.mark("first_frame"):
+            return
+        # Idle callbacks run in order, after the pending redraws
+        self.root.after_idle(self.start_service)
+
+# ---------------------------- START SERVICE ----------------------------- #
+    def start_service(self):
+        """
+        Import and create the MapService on the worker thread, then load
+        the first map. Deferred until after the first frame, importing
+        requests and PIL is most of the startup time, and the window
+        keeps responding while it runs.
+        """
+        self.fetcher.submit(
+            self.create_service,
+            on_success=self.service_ready,
+            on_error=self.show_error
+        )
+
+    def create_service(self):
+        """
+        Import and create the MapService, called on the worker thread.
+
+        Returns:
+            MapService: The service for the viewer
+        """
+        from map_service import MapService
+
+        # Maps are fetched once at the largest resolution offered and
+        # cropped locally, so changing resolution needs no new request
+        return MapService(resize_mode="crop", fetch_size=(1920, 1080))
+
+# ---------------------------- SERVICE READY ----------------------------- #
+    def service_ready(self, map_service):
+        """
+        Start using a created MapService, called on the UI thread.
+
+        Args:
+            map_service (MapService): Result of create_service
+        """
+        self.map_service = map_service
+        self.update_dimensions()
+
+        if PREFETCH:
+            from prefetch import Prefetcher
+            self.prefetcher = Prefetcher(
+                self.map_service, idle_check=lambda: not self.fetcher.busy)
+        self.startup.mark("service")
+
+        self.add_tooltips()
+
+        # Load the initial map
+        self.update_map()
+
+# ----------------------------- ADD TOOLTIPS ----------------------------- #
+    def add_tooltips(self):
+        """Attach the tooltips collected while building the window."""
+        # pip install tkinter-tooltip
+        from tktooltip import ToolTip
+        for widget, text in self.tooltips:
+            ToolTip(widget, msg=text, delay=1.0)
+        self.tooltips = []
+
 # ---------------------------- UPDATE DIMENSIONS ------------------------- #
     def update_dimensions(self):
         """
@@ -73,8 +192,9 @@ class MapViewer:
         self.height = int(height)
 
         # Update the MapService instance dimensions
-        self.map_service.width = self.width
-        self.map_service.height = self.height
+        if self.map_service is not None:
+            self.map_service.width = self.width
+            self.map_service.height = self.height
 
 # ----------------------------- SETUP UI --------------------------------- #
     def setup_ui(self):
@@ -99,12 +219,14 @@ class MapViewer:
         self.setup_input_frame(top_frame)
         self.setup_geo_frame(top_frame)
 
-        # Create the label that will display the map below both frames
-        self.map_label = ttk.Label(main_frame)
+        # Create the label that will display the map below both frames,
+        # with a placeholder until the first map arrives
+        self.map_label = ttk.Label(main_frame, text="Loading map...")
         self.map_label.grid(row=1, column=0, padx=10, pady=10)
 
-        # Load the initial map
-        self.update_map()
+        # Status label shows when a map is loading
+        self.status_label = ttk.Label(main_frame, text="")
+        self.status_label.grid(row=2, column=0, sticky=tk.W, padx=10)
 
 # ---------------------------- SETUP INPUT FRAME ------------------------- #
     def setup_input_frame(self, parent):
@@ -148,10 +270,27 @@ class MapViewer:
             from_=1,
             to=20,
             textvariable=self.zoom_var,
-            width=5
+            width=5,
+            command=self.schedule_update
         )
         zoom_spinbox.grid(row=1, column=1, sticky=tk.W, padx=5)
 
+        # Stats button opens the timing and cache statistics window
+        stats_button = ttk.Button(
+            input_frame, text="Stats", command=self.show_stats)
+        stats_button.grid(row=1, column=2, padx=(5, 0))
+        self.tooltips.append((stats_button, "Timing and cache statistics"))
+
+        # Tile mode swaps the static map for a pannable tile map
+        self.tiles = tk.BooleanVar(value=False)
+        tiles_check = ttk.Checkbutton(
+            input_frame, text="Tiles", variable=self.tiles,
+            command=self.update_map)
+        tiles_check.grid(row=1, column=3, padx=(5, 0))
+        self.tooltips.append(
+            (tiles_check, "Drag to pan, wheel to zoom, each tile "
+             "costs one request"))
+
         # Set up the map type and resolution selection frames
         self.setup_map_type_frame(input_frame)
         self.setup_resolution_frame(input_frame)
@@ -189,12 +328,12 @@ class MapViewer:
                 text=text,
                 value=value,
                 variable=self.map_type,
-                command=self.update_map
+                command=self.schedule_update
             )
             rb.grid(row=0, column=i, padx=3, pady=2)
 
-            # Apply ToolTip directly
-            ToolTip(rb, msg=desc, delay=1.0)
+            # Tooltip is attached after the first frame
+            self.tooltips.append((rb, desc))
 
 # ----------------------- SETUP RESOLUTION FRAME ------------------------- #
     def setup_resolution_frame(self, parent):
@@ -233,8 +372,8 @@ class MapViewer:
             )
             rb.grid(row=0, column=i, padx=3, pady=2)
 
-            # Apply resolution ToolTip directly
-            ToolTip(rb, msg=desc,  delay=1.0)
+            # Resolution tooltip is attached after the first frame
+            self.tooltips.append((rb, desc))
 
 # --------------------------- SETUP GEO FRAME ---------------------------- #
     def setup_geo_frame(self, parent):
@@ -281,7 +420,7 @@ class MapViewer:
         Updates the map dimensions and refreshes the display.
         """
         self.update_dimensions()
-        self.update_map()
+        self.schedule_update()
 
 # ------------------------ UPDATE LOCATION INFO -------------------------- #
     def update_location_info(self, location_data):
@@ -289,26 +428,44 @@ class MapViewer:
         Update the location information labels with new data.
 
         Args:
-            location_data (dict): Dictionary containing location information
+            location_data (GeocodeResult): The location shown on the map
         """
         # Update all location information labels with formatted data
         self.lat_label.config(
-            text=f"Latitude: {location_data['latitude']:.6f}")
+            text=f"Latitude: {location_data.latitude:.6f}")
         self.lon_label.config(
-            text=f"Longitude: {location_data['longitude']:.6f}")
-        self.street_label.config(text=f"Street: {location_data['street']}")
-        self.city_label.config(text=f"City: {location_data['city']}")
-        self.state_label.config(text=f"State: {location_data['state']}")
-        self.postal_label.config(text=f"Postal Code: {
-                                 location_data['postal_code']}")
+            text=f"Longitude: {location_data.longitude:.6f}")
+        self.street_label.config(
+            text=f"Street: {location_data.street or 'N/A'}")
+        self.city_label.config(text=f"City: {location_data.city or 'N/A'}")
+        self.state_label.config(
+            text=f"State: {location_data.state or 'N/A'}")
+        self.postal_label.config(
+            text=f"Postal Code: {location_data.postal_code or 'N/A'}")
+
+# -------------------------- SCHEDULE UPDATE ----------------------------- #
+    def schedule_update(self, *args):
+        """
+        Update the map once the controls have settled.
+        Called by the zoom spinbox and the radio buttons, so holding
+        an arrow or clicking through map types makes one request.
+        """
+        self.debouncer.call(self.update_map)
 
 # ---------------------------- UPDATE MAP -------------------------------- #
-    def update_map(self):
+    def update_map(self, *args):
         """
         Update the map display based on current settings.
-        Retrieves new map image and location data from the MapService.
-        Handles errors and displays appropriate messages to the user.
+        Requests a new map image and location data from the MapService
+        on a worker thread, the result is shown by show_map.
         """
+        # A direct search replaces any update still settling
+        self.debouncer.cancel()
+
+        # The first map is loaded by start_service
+        if self.map_service is None:
+            return
+
         # Get the location from the entry field
         location = self.location_entry.get()
 
@@ -317,35 +474,174 @@ class MapViewer:
             messagebox.showwarning("Warning", "Please enter a location")
             return
 
-        try:
-            # Get new map image and location data from the service
-            image, location_data = self.map_service.get_static_map(
+        self.set_loading(True)
+
+        self.request = (location, self.zoom_var.get(), self.map_type.get())
+        self.request_start = time.perf_counter()
+
+        # Tiles only need the coordinates, the canvas fetches the rest
+        if self.tiles.get():
+            self.fetcher.submit(
+                self.map_service.geocode_location,
                 location,
-                self.zoom_var.get(),
-                self.map_type.get()
+                on_success=self.show_tiles,
+                on_error=self.show_error
             )
+            return
 
-            # Update the map display
-            photo = ImageTk.PhotoImage(image)
-            self.map_label.configure(image=photo)
-            
-            # Keep a reference to prevent garbage collection
-            self.map_label.image = photo
+        # Past the soft limit a cached view is shown without a request
+        if self.map_service.soft_limit_reached:
+            cached = self.map_service.cached_static_map(
+                *self.request, decode=False)
+            if cached is not None:
+                self.fetcher.cancel()
+                self.show_map(cached)
+                return
+
+        # Fetch on the worker thread, superseding any earlier request
+        self.fetcher.submit(
+            self.map_service.get_static_map,
+            *self.request,
+            decode=False,
+            on_success=self.show_map,
+            on_error=self.show_error
+        )
 
-            # Update the location information display
-            self.update_location_info(location_data)
+# ----------------------------- SHOW MAP --------------------------------- #
+    def show_map(self, result):
+        """
+        Display a fetched map, called on the UI thread.
 
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        Args:
+            result (tuple): (EncodedImage, dict) from get_static_map
+        """
+        image, location_data = result
+        self.set_loading(False)
+
+        # Back from tile mode
+        if self.tile_canvas is not None:
+            self.tile_canvas.grid_remove()
+            self.map_label.grid()
+
+        instrumentation = self.map_service.instrumentation
+
+        # Update the map display
+        with instrumentation.span('photo'):
+            # PNG bytes go straight to Tk, without a PIL decode
+            photo = image.photo()
+        self.map_label.configure(image=photo, text="")
+
+        # Keep a reference to prevent garbage collection
+        self.map_label.image = photo
+
+        # Update the location information display
+        self.update_location_info(location_data)
+
+        # Time from the click to the map on screen
+        instrumentation.observe(
+            'update_map', time.perf_counter() - self.request_start)
+
+        # Time to the first map, the end of startup
+        if self.startup.mark("first_map"):
+            self.startup.report(
+                instrumentation, sys.stdout if self.timing else None)
+            if self.timing:
+                self.quit()
+                return
+
+        # The next view is most likely a neighbour of this one
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch(*self.request)
+
+        # Warn once most of the monthly quota has been used
+        if self.map_service.soft_limit_reached:
+            self.status_label.config(
+                text=f"{self.map_service.quota.remaining} "
+                "MapQuest requests left this month")
+
+# ----------------------------- SHOW TILES ------------------------------- #
+    def show_tiles(self, location_data):
+        """
+        Center the tile map on a geocoded location, on the UI thread.
+
+        Args:
+            location_data (GeocodeResult): Result of geocode_location
+        """
+        if not location_data:
+            self.show_error(Exception("Location not found"))
+            return
+        self.set_loading(False)
+
+        location, zoom, map_type = self.request
+        if self.tile_canvas is None:
+            from tile_engine import TileCanvas
+            self.tile_canvas = TileCanvas(
+                self.map_label.master, self.map_service,
+                location_data.latitude, location_data.longitude)
+            self.tile_canvas.grid(row=1, column=0, padx=10, pady=10)
+        self.map_label.grid_remove()
+        self.tile_canvas.grid()
+        self.tile_canvas.configure(width=self.width, height=self.height)
+        self.tile_canvas.set_view(
+            location_data.latitude, location_data.longitude,
+            int(zoom), map_type)
+
+        self.update_location_info(location_data)
+
+# ---------------------------- SHOW ERROR -------------------------------- #
+    def show_error(self, error):
+        """
+        Report a failed fetch, called on the UI thread.
+
+        Args:
+            error (Exception): The exception raised by the MapService
+        """
+        self.set_loading(False)
+
+        # A --timing run reports what it has instead of waiting
+        if self.timing:
+            # The service itself may be what failed to start
+            if self.map_service is not None:
+                self.startup.report(
+                    self.map_service.instrumentation, sys.stdout)
+            self.quit()
+            return
+        messagebox.showerror("Error", str(error))
+
+# ----------------------------- SHOW STATS ------------------------------- #
+    def show_stats(self):
+        """Open the timing and cache statistics window."""
+        if self.map_service is None:
+            return
+        from stats_panel import StatsWindow
+        StatsWindow(self.root, self.map_service.instrumentation)
+
+# ---------------------------- SET LOADING ------------------------------- #
+    def set_loading(self, loading):
+        """
+        Show or hide the loading state.
 
-    def quit(self):
+        Args:
+            loading (bool): True while a map is being fetched
+        """
+        self.status_label.config(text="Loading map..." if loading else "")
+        self.root.config(cursor="watch" if loading else "")
+
+    def quit(self, *args):
+        self.debouncer.cancel()
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        self.fetcher.shutdown()
         self.root.destroy()
 
 
 def main():
-    """Initialize and run the application."""
+    """
+    Initialize and run the application.
+    python map_viewer.py --timing prints the startup stages and exits.
+    """
     root = tk.Tk()
-    app = MapViewer(root)
+    app = MapViewer(root, timing="--timing" in sys.argv[1:])
     root.mainloop()
 
 
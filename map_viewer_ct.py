@@ -5,15 +5,31 @@
     Purpose: Modern MapQuest GUI shows map of location using CustomTkinter
     15,000 requests per month
 """
+import time
+
+# Taken before any other import, startup stages are timed from here
+STARTED = time.perf_counter()
+
+import sys
 from base64 import b64decode
+import tkinter as tk
 import customtkinter as ctk
 from tkinter import messagebox
-from PIL import ImageTk
-from tktooltip import ToolTip
-from map_service import MapService
+from map_worker import Debouncer, MapFetcher
+from startup import StartupTimer
 from telescope_ico import icon_16, icon_32
 from spin_box import Spinbox
 
+# MapService (requests, PIL), the prefetcher, tooltips and the stats
+# window are imported after the window is on screen, see start_service
+
+# Set this to False to turn off prefetching of neighbouring views
+PREFETCH = True
+
+# Milliseconds the zoom, map type and resolution controls must be
+# still before a map is requested, 0 requests on every change
+DEBOUNCE_MS = 300
+
 
 class MapViewer:
     """
@@ -21,8 +37,14 @@ class MapViewer:
     Built with CustomTkinter for a contemporary look and feel.
     """
 
-    def __init__(self):
-        """Initialize the MapViewer application."""
+    def __init__(self, timing=False):
+        """
+        Initialize the MapViewer application.
+
+        Args:
+            timing (bool): Print the startup stages as JSON and exit
+                once the first map is shown
+        """
         # Set the appearance mode and default color theme
         ctk.set_appearance_mode("system")
         ctk.set_default_color_theme("blue")
@@ -32,15 +54,35 @@ class MapViewer:
         self.root.title("MapQuest Map Viewer")
 
         # Set the window icon
-        small_icon = ImageTk.PhotoImage(data=b64decode(icon_16))
-        large_icon = ImageTk.PhotoImage(data=b64decode(icon_32))
+        small_icon = tk.PhotoImage(data=b64decode(icon_16))
+        large_icon = tk.PhotoImage(data=b64decode(icon_32))
         self.root.iconphoto(False, large_icon, small_icon)
 
         # Handle window closing
         self.root.protocol("WM_DELETE_WINDOW", self.quit)
 
-        # Initialize the MapService instance
-        self.map_service = MapService()
+        # Time to first frame, first map and the other startup stages
+        self.startup = StartupTimer(STARTED)
+        self.timing = timing
+
+        # Created by start_service once the window has been drawn
+        self.map_service = None
+
+        # Map requests run on a worker thread so the window stays responsive
+        self.fetcher = MapFetcher(self.root)
+
+        # Bursts of control changes request only the settled view
+        self.debouncer = Debouncer(self.root, DEBOUNCE_MS)
+
+        # Warm the cache for zoom +/- 1 and the other map types
+        self.prefetcher = None
+
+        # (widget, text) tooltips, attached once tktooltip is imported
+        self.tooltips = []
+
+        # Location, zoom and map type of the latest request
+        self.request = None
+        self.request_start = None
 
         # Default settings
         self.zoom = 14
@@ -53,13 +95,63 @@ class MapViewer:
         # Setup the UI
         self.setup_ui()
 
+        # Draw the window first, then load the first map
+        self.root.bind("<Map>", self.on_first_frame, add="+")
+
+    def on_first_frame(self, event):
+        """Start the map service once the window is on screen."""
+        if event.widget is not self.root or \
+                not self.startup.mark("first_frame"):
+            return
+        # Idle callbacks run in order, after the pending redraws
+        self.root.after_idle(self.start_service)
+
+    def start_service(self):
+        """Create the MapService on the worker thread, then load a map."""
+        self.fetcher.submit(
+            self.create_service,
+            on_success=self.service_ready,
+            on_error=self.show_error
+        )
+
+    def create_service(self):
+        """Import and create the MapService, on the worker thread."""
+        from map_service import MapService
+
+        # Maps are fetched once at the largest resolution offered and
+        # cropped locally, so changing resolution needs no new request
+        return MapService(resize_mode="crop", fetch_size=(1920, 1080))
+
+    def service_ready(self, map_service):
+        """Start using the created MapService, on the UI thread."""
+        self.map_service = map_service
+        self.update_dimensions()
+
+        if PREFETCH:
+            from prefetch import Prefetcher
+            self.prefetcher = Prefetcher(
+                self.map_service, idle_check=lambda: not self.fetcher.busy)
+        self.startup.mark("service")
+
+        self.add_tooltips()
+        self.update_map()
+
+    def add_tooltips(self):
+        """Attach the tooltips collected while building the window."""
+        # pip install tkinter-tooltip
+        from tktooltip import ToolTip
+        for widget, text in self.tooltips:
+            ToolTip(widget, msg=text, delay=1.0)
+        self.tooltips = []
+
     def update_dimensions(self):
         """Update the map dimensions based on selected resolution."""
         width, height = self.resolution.get().lower().split('x')
         self.width = int(width)
         self.height = int(height)
-        self.map_service.width = self.width
-        self.map_service.height = self.height
+        if self.map_service is not None:
+            self.map_service.width = self.width
+            self.map_service.height = self.height
 
     def setup_ui(self):
         """Set up the main user interface components."""
@@ -77,12 +169,13 @@ class MapViewer:
         self.setup_input_frame(top_frame)
         self.setup_geo_frame(top_frame)
 
-        # Map display label
-        self.map_label = ctk.CTkLabel(main_frame, text="")
+        # Map display label, with a placeholder until the first map
+        self.map_label = ctk.CTkLabel(main_frame, text="Loading map...")
         self.map_label.grid(row=1, column=0, padx=10, pady=10)
 
-        # Load initial map
-        self.update_map()
+        # Loading status
+        self.status_label = ctk.CTkLabel(main_frame, text="")
+        self.status_label.grid(row=2, column=0, sticky="w", padx=10)
 
     def setup_input_frame(self, parent):
         """Set up the search and control inputs frame."""
@@ -116,11 +209,17 @@ class MapViewer:
             width=150,
             step_size=1,
             from_=1,
-            to=20
+            to=20,
+            command=self.schedule_update
         )
         self.zoom_spinbox.set(self.zoom_var.get())
         self.zoom_spinbox.grid(row=2, column=1, sticky="w", padx=5)
 
+        # Timing and cache statistics
+        stats_button = ctk.CTkButton(
+            input_frame, text="Stats", command=self.show_stats)
+        stats_button.grid(row=2, column=2, padx=10)
+
         # Map type and resolution sections
         self.setup_map_type_frame(input_frame)
         self.setup_resolution_frame(input_frame)
@@ -153,10 +252,10 @@ class MapViewer:
                 text=text,
                 value=value,
                 variable=self.map_type,
-                command=self.update_map
+                command=self.schedule_update
             )
             rb.grid(row=1, column=i, padx=10, pady=5)
-            ToolTip(rb, msg=desc, delay=1.0)
+            self.tooltips.append((rb, desc))
 
     def setup_resolution_frame(self, parent):
         """Set up the resolution selection frame."""
@@ -184,7 +283,7 @@ class MapViewer:
                 command=self.on_resolution_change
             )
             rb.grid(row=1, column=i, padx=10, pady=5)
-            ToolTip(rb, msg=desc, delay=1.0)
+            self.tooltips.append((rb, desc))
 
     def setup_geo_frame(self, parent):
         """Set up the location information frame."""
@@ -219,52 +318,138 @@ class MapViewer:
     def on_resolution_change(self):
         """Handle resolution change events."""
         self.update_dimensions()
-        self.update_map()
+        self.schedule_update()
 
     def update_location_info(self, location_data):
         """Update the location information labels."""
         self.lat_label.configure(
-            text=f"Latitude: {location_data['latitude']:.6f}")
+            text=f"Latitude: {location_data.latitude:.6f}")
         self.lon_label.configure(
-            text=f"Longitude: {location_data['longitude']:.6f}")
-        self.street_label.configure(text=f"Street: {location_data['street']}")
-        self.city_label.configure(text=f"City: {location_data['city']}")
-        self.state_label.configure(text=f"State: {location_data['state']}")
+            text=f"Longitude: {location_data.longitude:.6f}")
+        self.street_label.configure(
+            text=f"Street: {location_data.street or 'N/A'}")
+        self.city_label.configure(
+            text=f"City: {location_data.city or 'N/A'}")
+        self.state_label.configure(
+            text=f"State: {location_data.state or 'N/A'}")
         self.postal_label.configure(
-            text=f"Postal Code: {location_data['postal_code']}")
+            text=f"Postal Code: {location_data.postal_code or 'N/A'}")
+
+    def schedule_update(self, *args):
+        """Update the map once the zoom and radio buttons settle."""
+        self.debouncer.call(self.update_map)
 
     def update_map(self, *args):
-        """Update the map display based on current settings."""
+        """Request a map for the current settings on the worker thread."""
+        # A direct search replaces any update still settling
+        self.debouncer.cancel()
+
+        # The first map is loaded by start_service
+        if self.map_service is None:
+            return
+
         location = self.location_entry.get()
 
         if not location:
             messagebox.showwarning("Warning", "Please enter a location")
             return
 
-        try:
-            image, location_data = self.map_service.get_static_map(
-                location,
-                int(self.zoom_spinbox.get()),
-                self.map_type.get()
-            )
+        self.set_loading(True)
+        self.request = (
+            location, int(self.zoom_spinbox.get()), self.map_type.get())
+        self.request_start = time.perf_counter()
+
+        # Past the soft limit a cached view is shown without a request
+        if self.map_service.soft_limit_reached:
+            cached = self.map_service.cached_static_map(
+                *self.request, decode=False)
+            if cached is not None:
+                self.fetcher.cancel()
+                self.show_map(cached)
+                return
+
+        self.fetcher.submit(
+            self.map_service.get_static_map,
+            *self.request,
+            decode=False,
+            on_success=self.show_map,
+            on_error=self.show_error
+        )
 
-            photo = ImageTk.PhotoImage(image)
-            self.map_label.configure(image=photo)
-            self.map_label.image = photo
+    def show_map(self, result):
+        """Display a fetched map, called on the UI thread."""
+        image, location_data = result
+        self.set_loading(False)
+
+        instrumentation = self.map_service.instrumentation
+        with instrumentation.span('photo'):
+            # PNG bytes go straight to Tk, without a PIL decode
+            photo = image.photo()
+        self.map_label.configure(image=photo, text="")
+        self.map_label.image = photo
+
+        self.update_location_info(location_data)
+        instrumentation.observe(
+            'update_map', time.perf_counter() - self.request_start)
+
+        # Time to the first map, the end of startup
+        if self.startup.mark("first_map"):
+            self.startup.report(
+                instrumentation, sys.stdout if self.timing else None)
+            if self.timing:
+                self.quit()
+                return
+
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch(*self.request)
+
+        # Warn once most of the monthly quota has been used
+        if self.map_service.soft_limit_reached:
+            self.status_label.configure(
+                text=f"{self.map_service.quota.remaining} "
+                "MapQuest requests left this month")
+
+    def show_error(self, error):
+        """Report a failed fetch, called on the UI thread."""
+        self.set_loading(False)
+
+        # A --timing run reports what it has instead of waiting
+        if self.timing:
+            # The service itself may be what failed to start
+            if self.map_service is not None:
+                self.startup.report(
+                    self.map_service.instrumentation, sys.stdout)
+            self.quit()
+            return
+        messagebox.showerror("Error", str(error))
 
-            self.update_location_info(location_data)
+    def show_stats(self):
+        """Open the timing and cache statistics window."""
+        if self.map_service is None:
+            return
+        from stats_panel import StatsWindow
+        StatsWindow(self.root, self.map_service.instrumentation)
 
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+    def set_loading(self, loading):
+        """Show or hide the loading state."""
+        self.status_label.configure(text="Loading map..." if loading else "")
+        self.root.configure(cursor="watch" if loading else "")
 
     def quit(self, *args):
         """Exit the application."""
+        self.debouncer.cancel()
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        self.fetcher.shutdown()
         self.root.destroy()
 
 
 def main():
-    """Initialize and run the application."""
-    app = MapViewer()
+    """
+    Initialize and run the application.
+    python map_viewer_ct.py --timing prints the startup stages and exits.
+    """
+    app = MapViewer(timing="--timing" in sys.argv[1:])
     app.root.mainloop()
 
 
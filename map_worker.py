@@ -0,0 +1,218 @@
+"""
+    Name: map_worker.py
+    Author:
+    Created:
+    Purpose: Run MapService calls off the Tk main thread
+    Results are handed back to the UI thread through a queue
+    polled with root.after, only the latest request is rendered
+    Rapid widget changes are debounced so only the settled view
+    is requested
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+# Quiet time in milliseconds before a widget change fetches a map
+DEBOUNCE_MS = 300
+
+
+class Debouncer:
+    """
+    Collapses a burst of calls into one, made once the calls stop.
+    Holding a spinbox button or clicking through the map types calls
+    in every few milliseconds, only the last state is worth a request.
+    """
+
+    def __init__(self, root, delay=DEBOUNCE_MS):
+        """
+        Initialize the debouncer.
+
+        Args:
+            root: The root Tkinter window, used to schedule the call
+            delay (int): Milliseconds without a new call before the
+                latest one runs, 0 runs every call immediately
+        """
+        self.root = root
+        self.delay = delay
+        self._after_id = None
+        self._call = None
+
+    @property
+    def pending(self):
+        """bool: True while a call is waiting for the quiet time."""
+        return self._after_id is not None
+
+    def call(self, func, *args):
+        """
+        Run func(*args) once delay ms pass without another call.
+        An earlier call that is still waiting is dropped.
+
+        Args:
+            func: Function to call on the UI thread
+            *args: Arguments for func
+        """
+        self.cancel()
+        if self.delay <= 0:
+            func(*args)
+            return
+        self._call = (func, args)
+        self._after_id = self.root.after(self.delay, self._fire)
+
+    def flush(self):
+        """Run the waiting call now instead of after the quiet time."""
+        if self.pending:
+            self.root.after_cancel(self._after_id)
+            self._fire()
+
+    def cancel(self):
+        """Drop the waiting call, if there is one."""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+            self._call = None
+
+    def _fire(self):
+        """Make the waiting call."""
+        self._after_id = None
+        func, args = self._call
+        self._call = None
+        func(*args)
+
+
+class MapFetcher:
+    """
+    Runs slow MapService calls on a worker thread so the window stays
+    responsive. Every submit supersedes the previous one: requests that
+    have not started yet are cancelled and results from older requests
+    are dropped, so only the latest view is rendered.
+    """
+
+    def __init__(self, root, max_workers=2, poll_interval=50):
+        """
+        Initialize the fetcher.
+
+        Args:
+            root: The root Tkinter window, used to schedule polling
+            max_workers (int): Number of worker threads
+            poll_interval (int): Milliseconds between result queue polls
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="map-fetch"
+        )
+
+        # Finished work waiting for the UI thread:
+        # (generation, result, error, on_success, on_error)
+        self._results = queue.Queue()
+
+        # Incremented by every submit, older generations are stale
+        self._generation = 0
+
+        self._pending = []
+        self._poll_id = None
+        self._closed = False
+
+    @property
+    def busy(self):
+        """bool: True while the latest request has not been delivered."""
+        return any(not future.done() for future in self._pending) \
+            or not self._results.empty()
+
+    # ------------------------------ SUBMIT ------------------------------ #
+    def submit(self, func, *args, on_success, on_error=None, **kwargs):
+        """
+        Run func(*args, **kwargs) on a worker thread.
+
+        Args:
+            func: The blocking function to call
+            *args: Positional arguments for func
+            on_success: Called on the UI thread with the result
+            on_error: Called on the UI thread with the exception
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            int: The generation number of this request
+        """
+        if self._closed:
+            return self._generation
+
+        self._generation += 1
+        generation = self._generation
+
+        # Requests that have not started yet are no longer needed
+        for future in self._pending:
+            future.cancel()
+        self._pending = [
+            future for future in self._pending if not future.done()]
+
+        self._pending.append(self._executor.submit(
+            self._run, generation, func, args, kwargs, on_success, on_error
+        ))
+
+        # Start polling for the result
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+        return generation
+
+    def cancel(self):
+        """
+        Drop every request in flight, such as when the view was shown
+        without one. Results that still arrive are not delivered.
+        """
+        self._generation += 1
+        for future in self._pending:
+            future.cancel()
+
+    # -------------------------------- RUN ------------------------------- #
+    def _run(self, generation, func, args, kwargs, on_success, on_error):
+        """Worker thread body, queues the outcome for the UI thread."""
+        # Skip work that was superseded while waiting for a thread
+        if generation != self._generation:
+            return
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._results.put((generation, None, e, on_success, on_error))
+        else:
+            self._results.put((generation, result, None, on_success, on_error))
+
+    # ------------------------------- POLL ------------------------------- #
+    def _poll(self):
+        """Deliver finished results on the UI thread."""
+        self._poll_id = None
+        if self._closed:
+            return
+
+        while True:
+            try:
+                generation, result, error, on_success, on_error = \
+                    self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            # Drop results from superseded requests
+            if generation != self._generation:
+                continue
+
+            if error is None:
+                on_success(result)
+            elif on_error is not None:
+                on_error(error)
+
+        # Keep polling while work is still in flight, unless a callback
+        # shut the fetcher down or its submit already scheduled a poll
+        if self.busy and not self._closed and self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    # ----------------------------- SHUTDOWN ----------------------------- #
+    def shutdown(self):
+        """Stop polling and cancel any work that has not started."""
+        self._closed = True
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
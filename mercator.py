@@ -0,0 +1,193 @@
+"""
+    Name: mercator.py
+    Author:
+    Created:
+    Purpose: Web Mercator math shared by the tile engine and MapService
+    Converts between coordinates, global pixels and slippy map tiles
+"""
+import math
+
+# Tile edge in pixels, the standard slippy map size
+TILE_SIZE = 256
+
+# Zoom levels supported by the static map API
+MIN_ZOOM = 1
+MAX_ZOOM = 20
+
+# Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.05112878
+
+
+# --------------------------- MERCATOR MATH ------------------------------ #
+def lat_lng_to_pixel(lat, lng, zoom):
+    """
+    Convert a coordinate to global pixel coordinates at a zoom level.
+
+    Args:
+        lat (float): Latitude in degrees
+        lng (float): Longitude in degrees
+        zoom (int): Zoom level
+
+    Returns:
+        tuple: (float, float) - x and y in pixels from the top left
+        of the world map, which is TILE_SIZE * 2 ** zoom wide
+    """
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    world = TILE_SIZE * 2 ** zoom
+    x = (lng + 180.0) / 360.0 * world
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) \
+        * world
+    return x, y
+
+
+def pixel_to_lat_lng(x, y, zoom):
+    """
+    Convert global pixel coordinates back to a coordinate.
+
+    Args:
+        x (float): Pixels from the left of the world map
+        y (float): Pixels from the top of the world map
+        zoom (int): Zoom level
+
+    Returns:
+        tuple: (float, float) - Latitude and longitude in degrees
+    """
+    world = TILE_SIZE * 2 ** zoom
+    lng = x / world * 360.0 - 180.0
+    n = math.pi - 2 * math.pi * y / world
+    lat = math.degrees(math.atan(math.sinh(n)))
+    return lat, lng
+
+
+def tile_center(x, y, zoom):
+    """
+    Return the coordinate at the center of a tile.
+
+    Args:
+        x (int): Tile column
+        y (int): Tile row
+        zoom (int): Zoom level
+
+    Returns:
+        tuple: (float, float) - Latitude and longitude in degrees
+    """
+    return pixel_to_lat_lng(
+        (x + 0.5) * TILE_SIZE, (y + 0.5) * TILE_SIZE, zoom)
+
+
+def visible_tiles(center_x, center_y, width, height, zoom):
+    """
+    List the tiles that cover a viewport.
+
+    Args:
+        center_x (float): Global pixel x of the viewport center
+        center_y (float): Global pixel y of the viewport center
+        width (int): Viewport width in pixels
+        height (int): Viewport height in pixels
+        zoom (int): Zoom level
+
+    Returns:
+        list: (x, y, left, top) for each tile, where x wraps around the
+        world and left/top is the tile position in viewport pixels.
+        Tiles nearest the center come first.
+    """
+    count = 2 ** zoom
+    left_px = center_x - width / 2
+    top_px = center_y - height / 2
+
+    first_x = math.floor(left_px / TILE_SIZE)
+    last_x = math.floor((left_px + width - 1) / TILE_SIZE)
+    first_y = max(0, math.floor(top_px / TILE_SIZE))
+    last_y = min(count - 1, math.floor((top_px + height - 1) / TILE_SIZE))
+
+    tiles = []
+    for ty in range(first_y, last_y + 1):
+        for tx in range(first_x, last_x + 1):
+            tiles.append((
+                tx % count,
+                ty,
+                round(tx * TILE_SIZE - left_px),
+                round(ty * TILE_SIZE - top_px)
+            ))
+
+    # Fetch the middle of the view first
+    tiles.sort(key=lambda tile: (
+        (tile[2] + TILE_SIZE / 2 - width / 2) ** 2
+        + (tile[3] + TILE_SIZE / 2 - height / 2) ** 2
+    ))
+    return tiles
+
+
+# ---------------------------- FIT BOUNDS -------------------------------- #
+def fit_bounds(points, width, height, padding=32, max_zoom=16):
+    """
+    Find the center and highest zoom that show every point.
+
+    Args:
+        points (list): (lat, lng) pairs in degrees
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        padding (int): Pixels kept free around the edge for markers
+        max_zoom (int): Highest zoom to use, so a single point or a
+            tight group is not shown at street level
+
+    Returns:
+        tuple: (float, float, int) - Center latitude, longitude and zoom
+    """
+    # Pixel positions at zoom 0, every zoom level doubles them
+    pixels = [lat_lng_to_pixel(lat, lng, 0) for lat, lng in points]
+    xs = [x for x, _ in pixels]
+    ys = [y for _, y in pixels]
+    span_x = max(xs) - min(xs)
+    span_y = max(ys) - min(ys)
+
+    zoom = max_zoom
+    while zoom > MIN_ZOOM and (
+            span_x * 2 ** zoom > width - 2 * padding
+            or span_y * 2 ** zoom > height - 2 * padding):
+        zoom -= 1
+
+    lat, lng = pixel_to_lat_lng(
+        (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2, 0)
+    return lat, lng, zoom
+
+
+# --------------------------- GRID CLUSTERS ------------------------------ #
+def grid_clusters(points, zoom, max_clusters, cell_size=32):
+    """
+    Merge nearby points until there are at most max_clusters.
+    Points are grouped by a pixel grid at the map zoom, the grid
+    doubles in size until few enough cells are occupied.
+
+    Args:
+        points (list): (lat, lng) pairs in degrees
+        zoom (int): Zoom level the points are shown at
+        max_clusters (int): Largest number of clusters to return
+        cell_size (int): Starting grid cell edge in pixels
+
+    Returns:
+        list: (lat, lng, count) for each cluster, at the mean position
+        of its points. Points are returned as they are, with a count of
+        one, when there are no more than max_clusters of them.
+    """
+    if len(points) <= max_clusters:
+        return [(lat, lng, 1) for lat, lng in points]
+
+    pixels = [lat_lng_to_pixel(lat, lng, zoom) for lat, lng in points]
+    cell = cell_size
+    while True:
+        # cell -> [count, latitude sum, longitude sum]
+        cells = {}
+        for (lat, lng), (x, y) in zip(points, pixels):
+            totals = cells.setdefault(
+                (int(x // cell), int(y // cell)), [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += lat
+            totals[2] += lng
+        if len(cells) <= max_clusters:
+            break
+        cell *= 2
+
+    return [(lat_sum / count, lng_sum / count, count)
+            for count, lat_sum, lng_sum in cells.values()]
@@ -0,0 +1,440 @@
+"""
+    Name: offline_pack.py
+    Author:
+    Created:
+    Purpose: Regional pack of geocode results, static maps and tiles
+    for field laptops without a network
+    One file holds the records followed by a hash table over their
+    keys. The file is memory-mapped, so opening it reads 24 bytes and
+    each lookup touches one or two table slots and the record itself
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from geocode_result import GeocodeResult
+from map_cache import CACHE_DIR, normalize_query
+from mercator import TILE_SIZE, lat_lng_to_pixel
+
+# Pack MapService opens on its own when the file exists
+PACK_PATH = os.path.join(CACHE_DIR, "offline.mqpack")
+
+# Signature, version, number of table slots and offset of the table
+PACK_MAGIC = b"MQPACK"
+PACK_VERSION = 1
+HEADER = struct.Struct("<6sHQQ")
+
+# Slot: key hash, key offset and length, value offset and length.
+# A key length of 0 marks an empty slot.
+SLOT = struct.Struct("<QQIQI")
+
+# Tiles per export, a bounding box grows 4x with every zoom level
+MAX_TILES = 10000
+
+
+# ------------------------------- KEYS ----------------------------------- #
+def geocode_key(location):
+    """Pack key for the geocode result of a location string."""
+    return "geocode:" + normalize_query(location)
+
+
+def map_key(cache_key):
+    """Pack key for a static map, by its ImageCache key."""
+    return "map:" + cache_key
+
+
+def tile_key(x, y, zoom, map_type):
+    """Pack key for one Web Mercator tile."""
+    return f"tile:{map_type}/{zoom}/{x}/{y}"
+
+
+def _hash(key):
+    """64 bit hash of an encoded key, the same on every platform."""
+    return int.from_bytes(
+        hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+# ---------------------------- OFFLINE PACK ------------------------------ #
+class OfflinePack:
+    """
+    Read-only, memory-mapped pack file.
+    Lookups are safe from any thread, nothing is loaded up front, the
+    OS pages in the parts of the file that are actually used.
+    """
+
+    def __init__(self, path=PACK_PATH):
+        """
+        Open a pack.
+
+        Args:
+            path (str): Pack file written by PackWriter or export_pack
+
+        Raises:
+            ValueError: If the file is not a pack of this version
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._mmap) < HEADER.size:
+                raise ValueError(f"{path} is not a map pack")
+            magic, version, slots, table = HEADER.unpack_from(self._mmap)
+        except BaseException:
+            self.close()
+            raise
+
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {PACK_VERSION} "
+                             f"map pack")
+        self._mask = slots - 1
+        self._table = table
+
+    def get(self, key):
+        """
+        Look up a record.
+
+        Args:
+            key (str): Pack key, see geocode_key, map_key and tile_key
+
+        Returns:
+            bytes: The record, None if the pack does not have it
+        """
+        key = key.encode("utf-8")
+        data = self._mmap
+        wanted = _hash(key)
+        slot = wanted & self._mask
+        while True:
+            found, key_offset, key_length, offset, length = SLOT.unpack_from(
+                data, self._table + slot * SLOT.size)
+            if not key_length:
+                return None
+            if found == wanted \
+                    and data[key_offset:key_offset + key_length] == key:
+                return data[offset:offset + length]
+            slot = (slot + 1) & self._mask
+
+    def geocode(self, location):
+        """
+        Look up the geocode result for a location string.
+
+        Args:
+            location (str): Location string, normalized like the cache
+
+        Returns:
+            GeocodeResult: The result, None if the pack does not have it
+        """
+        data = self.get(geocode_key(location))
+        if data is None:
+            return None
+        return GeocodeResult.convert(json.loads(data))
+
+    def image(self, cache_key):
+        """
+        Look up a static map by its ImageCache key.
+
+        Returns:
+            bytes: The encoded image, None if the pack does not have it
+        """
+        return self.get(map_key(cache_key))
+
+    def tile(self, x, y, zoom, map_type):
+        """
+        Look up one tile.
+
+        Returns:
+            bytes: The tile encoded as PNG, None if the pack does not
+            have it
+        """
+        return self.get(tile_key(x, y, zoom, map_type))
+
+    @property
+    def info(self):
+        """dict: What the pack covers and when it was exported."""
+        data = self.get("info")
+        return {} if data is None else json.loads(data)
+
+    def close(self):
+        """Unmap and close the file."""
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+# ---------------------------- PACK WRITER ------------------------------- #
+class PackWriter:
+    """
+    Writes a pack record by record.
+    Records go straight to a temporary file next to path, identical
+    values (such as empty ocean tiles) are stored once, and close
+    appends the hash table and moves the pack into place.
+    """
+
+    def __init__(self, path):
+        """
+        Start a new pack.
+
+        Args:
+            path (str): Pack file to write, replaced on close
+        """
+        self.path = path
+        self._temp_path = path + ".tmp"
+        self._file = open(self._temp_path, "wb")
+        self._file.write(bytes(HEADER.size))
+        # key -> (hash, key offset, key length, value offset, length)
+        self._entries = {}
+        # value digest -> (offset, length)
+        self._values = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _write(self, data):
+        """Append data and return its offset."""
+        offset = self._file.tell()
+        self._file.write(data)
+        return offset
+
+    def add(self, key, data):
+        """
+        Add a record, replacing an earlier one with the same key.
+
+        Args:
+            key (str): Pack key, see geocode_key, map_key and tile_key
+            data (bytes): The record
+        """
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        value = self._values.get(digest)
+        if value is None:
+            value = self._values[digest] = (self._write(data), len(data))
+
+        key = key.encode("utf-8")
+        self._entries[key] = (
+            _hash(key), self._write(key), len(key)) + value
+
+    def add_geocode(self, location, result):
+        """Add the GeocodeResult for a location string."""
+        self.add(geocode_key(location), json.dumps(
+            GeocodeResult.convert(result).to_list()).encode("utf-8"))
+
+    def add_image(self, cache_key, data):
+        """Add a static map under its ImageCache key."""
+        self.add(map_key(cache_key), data)
+
+    def add_tile(self, x, y, zoom, map_type, data):
+        """Add one tile encoded as PNG."""
+        self.add(tile_key(x, y, zoom, map_type), data)
+
+    def close(self, info=None):
+        """
+        Write the hash table and header and move the pack into place.
+
+        Args:
+            info (dict): What the pack covers, see OfflinePack.info
+        """
+        if info is not None:
+            self.add("info", json.dumps(info).encode("utf-8"))
+
+        # A power of two at most half full keeps probe runs short
+        slots = 1
+        while slots < 2 * len(self._entries):
+            slots *= 2
+        table = [SLOT.pack(0, 0, 0, 0, 0)] * slots
+        taken = [False] * slots
+        for entry in self._entries.values():
+            slot = entry[0] & (slots - 1)
+            while taken[slot]:
+                slot = (slot + 1) & (slots - 1)
+            taken[slot] = True
+            table[slot] = SLOT.pack(*entry)
+
+        table_offset = self._write(b"".join(table))
+        self._file.seek(0)
+        self._file.write(HEADER.pack(
+            PACK_MAGIC, PACK_VERSION, slots, table_offset))
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def discard(self):
+        """Stop writing and delete the unfinished pack."""
+        self._file.close()
+        os.remove(self._temp_path)
+
+
+# ---------------------------- TILE RANGE -------------------------------- #
+def tile_range(bbox, zoom):
+    """
+    List the tiles that cover a bounding box.
+
+    Args:
+        bbox (tuple): (south, west, north, east) in degrees
+        zoom (int): Zoom level
+
+    Returns:
+        list: (x, y) tile coordinates
+    """
+    south, west, north, east = bbox
+    left, top = lat_lng_to_pixel(north, west, zoom)
+    right, bottom = lat_lng_to_pixel(south, east, zoom)
+    last = 2 ** zoom - 1
+    return [
+        (x, y)
+        for x in range(max(0, int(left // TILE_SIZE)),
+                       min(last, int(right // TILE_SIZE)) + 1)
+        for y in range(max(0, int(top // TILE_SIZE)),
+                       min(last, int(bottom // TILE_SIZE)) + 1)
+    ]
+
+
+# ---------------------------- EXPORT PACK ------------------------------- #
+def export_pack(service, path=PACK_PATH, addresses=(), bbox=None,
+                zooms=(12, 13, 14), map_types=('map',),
+                max_tiles=MAX_TILES, max_workers=4):
+    """
+    Download a region and write it to one pack file.
+    Every address is geocoded and its static map is stored at each zoom
+    and map type, at the size the service fetches. The tiles that cover
+    bbox are stored at each zoom and map type as well.
+
+    Args:
+        service (MapService): Service used for the downloads, configured
+            like the one that will read the pack (resize_mode, fetch_size)
+        path (str): Pack file to write
+        addresses (iterable): Location strings
+        bbox (tuple): (south, west, north, east) in degrees, None for
+            no tiles
+        zooms (tuple): Zoom levels for static maps and tiles
+        map_types (tuple): Map types for static maps and tiles
+        max_tiles (int): Refuse a bounding box that needs more tiles
+        max_workers (int): Number of downloads in flight
+
+    Returns:
+        dict: Number of geocode results, maps and tiles in the pack
+
+    Raises:
+        ValueError: If the bounding box needs more than max_tiles tiles
+        Exception: If a download fails, no pack is written then
+    """
+    tiles = []
+    if bbox is not None:
+        tiles = [
+            (x, y, zoom, map_type)
+            for zoom in zooms
+            for x, y in tile_range(bbox, zoom)
+            for map_type in map_types
+        ]
+        if len(tiles) > max_tiles:
+            raise ValueError(f"The bounding box needs {len(tiles)} tiles, "
+                             f"more than max_tiles ({max_tiles})")
+
+    counts = {'geocode': 0, 'map': 0, 'tile': 0}
+    writer = PackWriter(path)
+    try:
+        located = []
+        for location, location_data in service.geocode_many(addresses):
+            if location_data is not None:
+                writer.add_geocode(location, location_data)
+                located.append((location, location_data))
+        counts['geocode'] = len(located)
+
+        views = [
+            (location, location_data, zoom, map_type)
+            for location, location_data in located
+            for zoom in zooms
+            for map_type in map_types
+        ]
+
+        def fetch_map(view):
+            location, location_data, zoom, map_type = view
+            image, _ = service.get_static_map(
+                location, zoom, map_type, decode=False)
+            return service.static_map_key(location_data, zoom, map_type), \
+                image
+
+        # Size of the images as fetched, larger than the service size
+        # in a resize mode
+        size = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for cache_key, image in executor.map(fetch_map, views):
+                writer.add_image(cache_key, image.data)
+                size = size or list(image.source_size)
+                counts['map'] += 1
+
+            for tile, data in zip(tiles, executor.map(
+                    lambda tile: service.get_tile(*tile), tiles)):
+                writer.add_tile(*tile, data)
+                counts['tile'] += 1
+
+        writer.close({
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'bbox': bbox,
+            'zooms': list(zooms),
+            'map_types': list(map_types),
+            'size': size,
+            **counts,
+        })
+    except BaseException:
+        writer.discard()
+        raise
+    return counts
+
+
+# -------------------------------- MAIN ---------------------------------- #
+def main():
+    """Export a region from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Export geocodes, maps and tiles for offline use")
+    parser.add_argument("--output", default=PACK_PATH,
+                        help="Pack file, the default is used by MapService")
+    parser.add_argument("--addresses",
+                        help="Text file with one address per line")
+    parser.add_argument("--bbox", type=float, nargs=4,
+                        metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+                        help="Area to store tiles for")
+    parser.add_argument("--zooms", default="12-14",
+                        help="Zoom levels, such as 12-14 or 10,12")
+    parser.add_argument("--types", default="map",
+                        help="Comma separated map types")
+    parser.add_argument("--max-tiles", type=int, default=MAX_TILES)
+    parser.add_argument("--base-url",
+                        help="Use another server with the same API")
+    args = parser.parse_args()
+
+    if "-" in args.zooms:
+        first, last = args.zooms.split("-")
+        zooms = tuple(range(int(first), int(last) + 1))
+    else:
+        zooms = tuple(int(zoom) for zoom in args.zooms.split(","))
+
+    addresses = []
+    if args.addresses:
+        with open(args.addresses, encoding="utf-8") as file:
+            addresses = [line.strip() for line in file if line.strip()]
+
+    from map_service import MapService
+
+    # Same map size as the viewers, so their views are in the pack.
+    # The old pack is not opened, it is about to be replaced.
+    service = MapService(
+        resize_mode="crop", fetch_size=(1920, 1080), base_url=args.base_url,
+        offline_pack=False)
+    try:
+        counts = export_pack(
+            service, args.output, addresses, args.bbox, zooms,
+            tuple(args.types.split(",")), args.max_tiles)
+    finally:
+        service.close()
+
+    print(f"Wrote {args.output}: {counts['geocode']} locations, "
+          f"{counts['map']} maps, {counts['tile']} tiles, "
+          f"{os.path.getsize(args.output) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+    Name: prefetch.py
+    Author:
+    Created:
+    Purpose: Warm the image cache for the views a user is likely to
+    open next: zoom +/- 1 and the other map types
+    Runs in the background with its own share of the monthly quota,
+    counted next to the main quota in the same file
+"""
+import queue
+import threading
+import time
+from map_service import MAP_TYPES
+from quota import QuotaTracker, QuotaExceeded
+
+
+class Prefetcher:
+    """
+    Background prefetcher for neighbouring map views.
+    Each call to prefetch replaces the queued work with the neighbours
+    of the new view. Zoom levels are fetched before other map types.
+    Work only runs while the foreground is idle, and never spends more
+    than quota_share of the monthly quota.
+    """
+
+    def __init__(self, map_service, quota_share=0.1, map_types=MAP_TYPES,
+                 idle_check=None, delay=0.5, path=None):
+        """
+        Initialize and start the prefetch thread.
+
+        Args:
+            map_service (MapService): Service whose caches are warmed
+            quota_share (float): Fraction of the monthly quota the
+                prefetcher may spend
+            map_types (tuple): Map types to prefetch
+            idle_check: Optional callable, prefetching waits while it
+                returns False so foreground requests go first
+            delay (float): Seconds to wait after a view is shown before
+                prefetching, so quick clicks are not prefetched for
+            path (str): SQLite file for the prefetch usage counter,
+                None uses the file of the service's quota
+        """
+        self.map_service = map_service
+        self.map_types = map_types
+        self.idle_check = idle_check
+        self.delay = delay
+
+        # Prefetch spending is tracked apart from foreground requests,
+        # as its own counter set in the quota file
+        monthly_limit = float('inf')
+        if map_service.quota is not None:
+            monthly_limit = int(map_service.quota.monthly_limit * quota_share)
+            if path is None:
+                path = map_service.quota.path
+        self.budget = QuotaTracker(
+            path=path, monthly_limit=monthly_limit, soft_limit=1.0,
+            name="prefetch")
+
+        # (priority, order, generation, location, zoom, map_type)
+        self._queue = queue.PriorityQueue()
+        self._generation = 0
+        self._order = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._thread = threading.Thread(
+            target=self._run, name="map-prefetch", daemon=True)
+        self._thread.start()
+
+    # ----------------------------- PREFETCH ----------------------------- #
+    def prefetch(self, location, zoom, map_type):
+        """
+        Queue the neighbours of the view the user is looking at.
+
+        Args:
+            location (str): Location string of the current view
+            zoom (str/int): Current zoom level (1-20)
+            map_type (str): Current map type
+        """
+        zoom = int(zoom)
+        with self._lock:
+            # Queued work for an older view is dropped by the worker
+            self._generation += 1
+            generation = self._generation
+
+            # Zoom in and out first, they are the most likely next step
+            neighbours = [
+                (0, location, z, map_type)
+                for z in (zoom + 1, zoom - 1) if 1 <= z <= 20
+            ]
+            neighbours += [
+                (1, location, zoom, other)
+                for other in self.map_types if other != map_type
+            ]
+
+            for priority, *view in neighbours:
+                self._order += 1
+                self._queue.put(
+                    (priority, self._order, generation, *view))
+
+    def stop(self):
+        """Stop the prefetch thread."""
+        self._stopped.set()
+        # Wake the thread if it is waiting for work
+        self._queue.put((-1, 0, -1, None, None, None))
+
+    # ------------------------------- RUN -------------------------------- #
+    def _run(self):
+        """Prefetch thread body."""
+        # Generation whose settle delay has already passed
+        settled = 0
+        while not self._stopped.is_set():
+            _, _, generation, location, zoom, map_type = self._queue.get()
+            if self._stopped.is_set():
+                return
+
+            # Views the user already left are dropped without waiting
+            if generation != self._generation:
+                continue
+
+            # Let the user settle on a view before spending quota on it
+            if generation != settled:
+                if self._stopped.wait(self.delay):
+                    return
+                settled = generation
+                if generation != self._generation:
+                    continue
+
+            # Foreground requests always go first
+            while self.idle_check is not None and not self.idle_check():
+                if self._stopped.wait(0.1):
+                    return
+
+            self._fetch(location, zoom, map_type)
+
+    def _fetch(self, location, zoom, map_type):
+        """Warm the cache for one view if it is not cached yet."""
+        service = self.map_service
+
+        # Already cached views cost nothing
+        if service.cached_static_map(
+                location, zoom, map_type, decode=False) is not None:
+            return
+
+        # Stay within the prefetch share and leave the rest for the user
+        if service.soft_limit_reached:
+            return
+        try:
+            self.budget.reserve('map')
+        except QuotaExceeded:
+            return
+
+        try:
+            # Only the cached bytes are wanted, skip decoding
+            service.get_static_map(location, zoom, map_type, decode=False)
+        except QuotaExceeded:
+            self.budget.record('map', -1)
+        except Exception:
+            # Prefetching is best effort, the foreground reports errors
+            time.sleep(1)
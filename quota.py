@@ -0,0 +1,277 @@
+"""
+    Name: quota.py
+    Author:
+    Created:
+    Purpose: Client side rate limiting and monthly quota tracking
+    Keeps bursts of concurrent fetches from burning through the
+    15,000 requests per month MapQuest allows
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from map_cache import CACHE_DIR
+
+# MapQuest free plan limit
+MONTHLY_LIMIT = 15000
+
+
+class QuotaExceeded(Exception):
+    """Raised when a request would go over the monthly quota."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Tokens refill at rate per second up to capacity, so short bursts
+    of up to capacity requests go straight through and longer bursts
+    are smoothed out to rate requests per second.
+    """
+
+    def __init__(self, rate=5.0, capacity=10):
+        """
+        Initialize the bucket full.
+
+        Args:
+            rate (float): Tokens added per second
+            capacity (int): Maximum number of stored tokens
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens earned since the last update."""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # --------------------------- TRY ACQUIRE ---------------------------- #
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if they are available without waiting.
+
+        Args:
+            tokens (int): Number of tokens to take
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of
+            seconds to wait before trying again
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    # ----------------------------- ACQUIRE ------------------------------ #
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Take tokens, waiting for them to refill if needed.
+
+        Args:
+            tokens (int): Number of tokens to take
+            timeout (float): Maximum seconds to wait, None waits forever
+
+        Returns:
+            bool: True if the tokens were taken, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class QuotaTracker:
+    """
+    Persisted monthly usage counter.
+    Geocode and static map requests are counted separately in a small
+    SQLite table, one row per tracker, month and request kind. Every
+    change is one atomic UPDATE, so the viewer, prefetcher, exporter and
+    batch scripts can share the file without losing each other's counts.
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "quota.db"),
+                 monthly_limit=MONTHLY_LIMIT, soft_limit=0.8, name="quota"):
+        """
+        Initialize the tracker.
+
+        Args:
+            path (str): SQLite file for the counters, None keeps them
+                in memory only
+            monthly_limit (int): Requests allowed per month
+            soft_limit (float): Fraction of the limit after which callers
+                should prefer cached or degraded results
+            name (str): Counter set in the file, trackers with another
+                name keep separate counts, such as the prefetch budget
+        """
+        self.path = path
+        self.monthly_limit = monthly_limit
+        self.soft_limit = soft_limit
+        self.name = name
+
+        # One connection, shared by the worker threads
+        self._lock = threading.Lock()
+
+        if path is not None:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit, transactions are opened explicitly
+        self._db = sqlite3.connect(
+            path or ":memory:", timeout=30, isolation_level=None,
+            check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS quota ("
+            "name TEXT NOT NULL, month TEXT NOT NULL, kind TEXT NOT NULL, "
+            "count INTEGER NOT NULL, PRIMARY KEY (name, month, kind))"
+        )
+
+        # Counts from the JSON file used before, once
+        legacy = None if path is None else os.path.splitext(path)[0] + ".json"
+        if legacy is not None and legacy != path:
+            self._import(legacy)
+
+    @staticmethod
+    def _current_month():
+        """Return the current month as YYYY-MM."""
+        return datetime.now().strftime("%Y-%m")
+
+    def _import(self, json_path):
+        """Add this month's counts from an old JSON counter file."""
+        try:
+            with open(json_path, encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        if saved.get("month") == self._current_month():
+            for kind, count in saved.get("counts", {}).items():
+                self.record(kind, count)
+        try:
+            os.remove(json_path)
+        except OSError:
+            # Another process imported it first
+            pass
+
+    def _add(self, kind, count):
+        """Add count to a counter, caller holds the lock."""
+        self._db.execute(
+            "INSERT INTO quota (name, month, kind, count) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (name, month, kind) "
+            "DO UPDATE SET count = count + excluded.count",
+            (self.name, self._current_month(), kind, count)
+        )
+
+    def _used(self):
+        """Return this month's total, caller holds the lock."""
+        (used,) = self._db.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM quota "
+            "WHERE name = ? AND month = ?",
+            (self.name, self._current_month())
+        ).fetchone()
+        return used
+
+    # ------------------------------ RECORD ------------------------------ #
+    def record(self, kind, count=1):
+        """
+        Count requests against this month's quota.
+
+        Args:
+            kind (str): Request kind, such as geocode or map
+            count (int): Number of transactions used, negative to give
+                back a reservation that was not spent
+        """
+        with self._lock:
+            self._add(kind, count)
+
+    # ------------------------------ RESERVE ----------------------------- #
+    def reserve(self, kind, count=1):
+        """
+        Check the quota and count the transactions in one step, before
+        the request is made, so two callers cannot both take the last
+        of the quota.
+
+        Args:
+            kind (str): Request kind, such as geocode or map
+            count (int): Number of transactions about to be used
+
+        Raises:
+            QuotaExceeded: If the monthly limit would be exceeded,
+                nothing is counted
+        """
+        with self._lock:
+            # IMMEDIATE takes the write lock before reading the total
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.monthly_limit - self._used() < count:
+                    raise QuotaExceeded(
+                        f"Monthly quota of {self.monthly_limit} "
+                        "requests reached")
+                self._add(kind, count)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # ------------------------------- CHECK ------------------------------ #
+    def check(self, count=1):
+        """
+        Make sure count more transactions fit in this month's quota.
+        Use reserve to check and count a request in one step.
+
+        Args:
+            count (int): Number of transactions about to be used
+
+        Raises:
+            QuotaExceeded: If the monthly limit would be exceeded
+        """
+        if self.remaining < count:
+            raise QuotaExceeded(
+                f"Monthly quota of {self.monthly_limit} requests reached")
+
+    # ------------------------------- USAGE ------------------------------ #
+    def usage(self):
+        """
+        Return this month's counts by request kind.
+
+        Returns:
+            dict: kind -> number of transactions used
+        """
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT kind, count FROM quota WHERE name = ? AND month = ?",
+                (self.name, self._current_month())
+            ).fetchall())
+
+    @property
+    def used(self):
+        """int: Transactions used this month."""
+        with self._lock:
+            return self._used()
+
+    @property
+    def remaining(self):
+        """int: Transactions left this month."""
+        return max(0, self.monthly_limit - self.used)
+
+    @property
+    def soft_limit_reached(self):
+        """bool: True once usage passes the soft limit."""
+        return self.used >= self.monthly_limit * self.soft_limit
+
+    def close(self):
+        """Close the counter file."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,151 @@
+"""
+    Name: route_shape.py
+    Author:
+    Created:
+    Purpose: Route geometry helpers for the directions API
+    Decodes and encodes MapQuest compressed shapes (the Google polyline
+    algorithm, cmp is 5 decimal places and cmp6 is 6) and simplifies
+    a route with Douglas-Peucker so it can be drawn on a static map
+"""
+import math
+from spatial_index import METERS_PER_DEGREE
+
+
+# ------------------------------ DECODE ---------------------------------- #
+def decode_polyline(encoded, precision=6):
+    """
+    Decode a compressed shape into coordinates.
+
+    Args:
+        encoded (str): Compressed shape from the directions API
+        precision (int): Decimal places, 6 for cmp6 and 5 for cmp
+
+    Returns:
+        list: (lat, lng) pairs in degrees
+    """
+    factor = 10 ** precision
+    points = []
+    append = points.append
+    index = 0
+    length = len(encoded)
+    lat = lng = 0
+
+    while index < length:
+        # Each value is a zigzag encoded delta in 5 bit chunks,
+        # lowest chunk first, 0x20 marks that another chunk follows
+        result = shift = 0
+        while True:
+            byte = ord(encoded[index]) - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        lat += ~(result >> 1) if result & 1 else result >> 1
+
+        result = shift = 0
+        while True:
+            byte = ord(encoded[index]) - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        lng += ~(result >> 1) if result & 1 else result >> 1
+
+        append((lat / factor, lng / factor))
+
+    return points
+
+
+# ------------------------------ ENCODE ---------------------------------- #
+def encode_polyline(points, precision=6):
+    """
+    Encode coordinates as a compressed shape.
+
+    Args:
+        points (list): (lat, lng) pairs in degrees
+        precision (int): Decimal places, 6 for cmp6 and 5 for cmp
+
+    Returns:
+        str: The compressed shape
+    """
+    factor = 10 ** precision
+    chunks = []
+    append = chunks.append
+    previous_lat = previous_lng = 0
+
+    for lat, lng in points:
+        lat = round(lat * factor)
+        lng = round(lng * factor)
+        for delta in (lat - previous_lat, lng - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            append(chr(value + 63))
+        previous_lat, previous_lng = lat, lng
+
+    return "".join(chunks)
+
+
+# ----------------------------- SIMPLIFY --------------------------------- #
+def simplify(points, tolerance=10):
+    """
+    Drop points that are within tolerance meters of the simplified line
+    (Douglas-Peucker). The first and last points are always kept.
+
+    Args:
+        points (list): (lat, lng) pairs in degrees
+        tolerance (float): Largest distance in meters a dropped point
+            may be from the line that replaces it
+
+    Returns:
+        list: The kept (lat, lng) pairs, in order
+    """
+    count = len(points)
+    if count < 3:
+        return list(points)
+
+    # A flat projection in meters is accurate enough at route scale
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(points[0][0]))
+    xy = [(lng * scale_x, lat * METERS_PER_DEGREE) for lat, lng in points]
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    limit = tolerance * tolerance
+
+    # An explicit stack instead of recursion, long routes have
+    # tens of thousands of points
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xy[first]
+        dx = xy[last][0] - ax
+        dy = xy[last][1] - ay
+        segment = dx * dx + dy * dy
+
+        farthest = None
+        farthest_distance = limit
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if segment:
+                # Squared distance to the closest point of the segment
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy)
+                                 / segment))
+                ex = ax + t * dx - px
+                ey = ay + t * dy - py
+            else:
+                ex = px - ax
+                ey = py - ay
+            distance = ex * ex + ey * ey
+            if distance > farthest_distance:
+                farthest = i
+                farthest_distance = distance
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
@@ -0,0 +1,124 @@
+"""
+    Name: single_flight.py
+    Author:
+    Created:
+    Purpose: Coalesce identical lookups that are in flight at once
+    The first caller for a key runs the lookup, every caller that
+    arrives before it finishes waits and shares its result
+    SingleFlight is for threads, AsyncSingleFlight for asyncio tasks
+"""
+import threading
+
+
+class _Call:
+    """One lookup in flight and the callers waiting on it."""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one lookup per key at a time across threads.
+    Nothing is kept once a lookup finishes, caching is left to the
+    caches, this only covers the window while the request is out.
+    """
+
+    def __init__(self):
+        """Initialize with nothing in flight."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key, func, *args):
+        """
+        Run func(*args), or wait for the same key already running.
+
+        Args:
+            key: Hashable key, equal keys are the same lookup
+            func (callable): The lookup
+            *args: Arguments for func
+
+        Returns:
+            tuple: (object, bool) - The result, and True if it was
+            shared from another caller's lookup
+
+        Raises:
+            Exception: Whatever the lookup raised, in every caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """
+    Runs at most one lookup per key at a time on one event loop.
+    The lookup runs as its own task, so a caller that is cancelled
+    does not cancel it for the others.
+    """
+
+    def __init__(self):
+        """Initialize with nothing in flight."""
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def do(self, key, func, *args):
+        """
+        Await func(*args), or the same key already running.
+
+        Args:
+            key: Hashable key, equal keys are the same lookup
+            func (callable): Coroutine function for the lookup
+            *args: Arguments for func
+
+        Returns:
+            tuple: (object, bool) - The result, and True if it was
+            shared from another caller's lookup
+
+        Raises:
+            Exception: Whatever the lookup raised, in every caller
+        """
+        # Imported here, MapService only needs the thread version and
+        # asyncio would add to the viewers' startup time
+        import asyncio
+
+        task = self._tasks.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(func(*args))
+            self._tasks[key] = task
+            task.add_done_callback(
+                lambda done: self._finished(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key, task):
+        """Forget a finished lookup."""
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
@@ -0,0 +1,53 @@
+"""
+    Name: spatial_arrays.py
+    Author:
+    Created:
+    Purpose: NumPy versions of the spatial_index distance helpers
+    Kept apart from spatial_index so MapService does not need NumPy,
+    and apart from distance_matrix so the geocode store does not
+    import the HTTP client
+"""
+# pip install numpy
+import numpy as np
+from geocode_result import GeocodeResult
+from spatial_index import EARTH_RADIUS
+
+
+# ---------------------------- COORDINATES ------------------------------- #
+def coordinates(points):
+    """
+    Turn GeocodeResults or (lat, lng) pairs into an array.
+
+    Args:
+        points (list): GeocodeResults or (lat, lng) pairs
+
+    Returns:
+        numpy.ndarray: n x 2 array of latitude and longitude in degrees
+    """
+    return np.array([
+        (point['latitude'], point['longitude'])
+        if isinstance(point, (dict, GeocodeResult)) else tuple(point)[:2]
+        for point in points
+    ], dtype=float).reshape(-1, 2)
+
+
+# ------------------------- HAVERSINE MATRIX ----------------------------- #
+def haversine_matrix(origins, destinations):
+    """
+    Great circle distance between every origin and destination.
+
+    Args:
+        origins (numpy.ndarray): n x 2 latitude and longitude in degrees
+        destinations (numpy.ndarray): m x 2 latitude and longitude
+
+    Returns:
+        numpy.ndarray: n x m distances in meters
+    """
+    lat1 = np.radians(origins[:, 0])[:, np.newaxis]
+    lng1 = np.radians(origins[:, 1])[:, np.newaxis]
+    lat2 = np.radians(destinations[:, 0])[np.newaxis, :]
+    lng2 = np.radians(destinations[:, 1])[np.newaxis, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 \
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
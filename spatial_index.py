@@ -0,0 +1,226 @@
+"""
+    Name: spatial_index.py
+    Author:
+    Created:
+    Purpose: Geohash keyed spatial index over geocoded locations
+    Answers "nearest known address within X meters" without an API call
+"""
+import math
+import threading
+
+# Geohash alphabet, a base 32 without a, i, l and o
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111320.0
+
+
+# -------------------------- GEOHASH ENCODE ------------------------------ #
+def geohash_encode(lat, lng, precision=7):
+    """
+    Encode a coordinate as a geohash string.
+
+    Args:
+        lat (float): Latitude in degrees
+        lng (float): Longitude in degrees
+        precision (int): Number of characters, 7 is a cell of
+            about 150 x 150 meters
+
+    Returns:
+        str: The geohash of the cell that contains the coordinate
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude
+        value, span = (lng, lng_range) if even else (lat, lat_range)
+        middle = (span[0] + span[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            span[0] = middle
+        else:
+            bits = bits * 2
+            span[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def geohash_cell_size(precision):
+    """
+    Return the size of a geohash cell in degrees.
+
+    Args:
+        precision (int): Number of geohash characters
+
+    Returns:
+        tuple: (float, float) - Cell height and width in degrees
+    """
+    bits = precision * 5
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+# ----------------------------- HAVERSINE -------------------------------- #
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance between two coordinates.
+
+    Args:
+        lat1 (float): Latitude of the first point in degrees
+        lng1 (float): Longitude of the first point in degrees
+        lat2 (float): Latitude of the second point in degrees
+        lng2 (float): Longitude of the second point in degrees
+
+    Returns:
+        float: Distance in meters
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 \
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class GeohashIndex:
+    """
+    A dict of geohash cells, each holding the locations inside it.
+    A nearest query only looks at the few cells that overlap the
+    search radius, so it stays sub-millisecond for any index size.
+    """
+
+    def __init__(self, precision=7):
+        """
+        Initialize an empty index.
+
+        Args:
+            precision (int): Geohash length of the cells, pick cells
+                about as large as the usual search radius
+        """
+        self.precision = precision
+        self.cell_height, self.cell_width = geohash_cell_size(precision)
+
+        # geohash -> {key: (lat, lng, item)}
+        self._cells = {}
+        # key -> geohash of the cell holding it
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    # -------------------------------- ADD ------------------------------- #
+    def add(self, key, lat, lng, item):
+        """
+        Add or replace a location.
+
+        Args:
+            key (str): Unique key, adding the same key again replaces it
+            lat (float): Latitude in degrees
+            lng (float): Longitude in degrees
+            item: Value returned by nearest, such as location data
+        """
+        cell = geohash_encode(lat, lng, self.precision)
+        with self._lock:
+            # A key that moved leaves its old cell
+            old_cell = self._keys.get(key)
+            if old_cell is not None and old_cell != cell:
+                self._discard(old_cell, key)
+            self._keys[key] = cell
+            self._cells.setdefault(cell, {})[key] = (lat, lng, item)
+
+    def remove(self, key):
+        """
+        Remove a location.
+
+        Args:
+            key (str): Key it was added under
+
+        Returns:
+            bool: False if the key was not in the index
+        """
+        with self._lock:
+            cell = self._keys.pop(key, None)
+            if cell is None:
+                return False
+            self._discard(cell, key)
+            return True
+
+    def _discard(self, cell, key):
+        """Drop a key from a cell, caller holds the lock."""
+        entries = self._cells[cell]
+        del entries[key]
+        if not entries:
+            del self._cells[cell]
+
+    # ------------------------------ NEAREST ----------------------------- #
+    def nearest(self, lat, lng, max_distance=50):
+        """
+        Find the nearest location within max_distance meters.
+
+        Args:
+            lat (float): Latitude in degrees
+            lng (float): Longitude in degrees
+            max_distance (float): Search radius in meters
+
+        Returns:
+            tuple: (item, float) - The nearest item and its distance
+            in meters, None if nothing is within max_distance
+        """
+        best = None
+        best_distance = max_distance
+
+        with self._lock:
+            for cell in self._covering_cells(lat, lng, max_distance):
+                for other_lat, other_lng, item in \
+                        self._cells.get(cell, {}).values():
+                    distance = haversine(lat, lng, other_lat, other_lng)
+                    if distance <= best_distance:
+                        best = item
+                        best_distance = distance
+
+        if best is None:
+            return None
+        return best, best_distance
+
+    def _covering_cells(self, lat, lng, radius):
+        """Return the geohashes of every cell the search circle touches."""
+        d_lat = radius / METERS_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        d_lng = min(180.0, radius / (METERS_PER_DEGREE * cos_lat))
+
+        south = max(-90.0, lat - d_lat)
+        north = min(90.0, lat + d_lat)
+        west = lng - d_lng
+        east = lng + d_lng
+
+        # Step through the bounding box one cell at a time
+        rows = int((north - south) / self.cell_height) + 2
+        columns = int((east - west) / self.cell_width) + 2
+
+        cells = set()
+        for row in range(rows):
+            cell_lat = min(north, south + row * self.cell_height)
+            for column in range(columns):
+                cell_lng = min(east, west + column * self.cell_width)
+                # Wrap around the antimeridian
+                cell_lng = (cell_lng + 180.0) % 360.0 - 180.0
+                cells.add(geohash_encode(cell_lat, cell_lng, self.precision))
+        return cells
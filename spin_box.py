@@ -22,7 +22,8 @@ class Spinbox(ct.CTkFrame):
             width: Width of the spinbox in pixels
             height: Height of the spinbox in pixels
             step_size: Amount to increment/decrement when buttons are pressed
-            command: Optional callback function to execute on value change
+            command: Optional callback function to execute after the
+                value changes
             from_: Minimum allowed value (inclusive)
             to: Maximum allowed value (inclusive)
         """
@@ -98,29 +99,31 @@ class Spinbox(ct.CTkFrame):
         Handler for the add (+) button click.
         Increments the current value by step_size if within bounds.
         """
-        if self.command is not None:
-            self.command()
-
         new_value = min(self._value + self.step_size, self.to)
         if new_value != self._value:
             self._value = new_value
             self.entry.configure(text=f"{self._value}")
             self._update_button_states()
 
+            # Called after the change, so get() returns the new value
+            if self.command is not None:
+                self.command()
+
     def subtract_button_callback(self):
         """
         Handler for the subtract (-) button click.
         Decrements the current value by step_size if within bounds.
         """
-        if self.command is not None:
-            self.command()
-
         new_value = max(self._value - self.step_size, self.from_)
         if new_value != self._value:
             self._value = new_value
             self.entry.configure(text=f"{self._value}")
             self._update_button_states()
 
+            # Called after the change, so get() returns the new value
+            if self.command is not None:
+                self.command()
+
     def get(self) -> float:
         """
         Get the current value of the spinbox.
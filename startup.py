@@ -0,0 +1,62 @@
+"""
+    Name: startup.py
+    Author:
+    Created:
+    Purpose: Time-to-first-frame measurement for the map viewers
+    Stages are timed from when the viewer module started loading,
+    the onefile unpacking of a Nuitka build is measured from outside,
+    see map_viewer_gcc.bat
+"""
+import json
+import time
+
+
+class StartupTimer:
+    """
+    Records how long after launch each startup stage was reached:
+    first_frame when the window is on screen, service once MapService
+    is imported and created, first_map when the first map is shown.
+    """
+
+    def __init__(self, started):
+        """
+        Initialize the timer.
+
+        Args:
+            started (float): time.perf_counter() taken as early as
+                possible in the viewer module
+        """
+        self.started = started
+        self.stages = {}
+
+    def mark(self, stage):
+        """
+        Record a stage the first time it is reached.
+
+        Args:
+            stage (str): Stage name
+
+        Returns:
+            bool: True if this is the first time
+        """
+        if stage in self.stages:
+            return False
+        self.stages[stage] = time.perf_counter() - self.started
+        return True
+
+    def report(self, instrumentation, stream=None):
+        """
+        Add the stages to the instrumentation as startup.* spans.
+
+        Args:
+            instrumentation (Instrumentation): Shown in the stats window
+            stream: Also print the stages in ms as one JSON line here,
+                such as sys.stdout for --timing runs
+        """
+        for stage, seconds in self.stages.items():
+            instrumentation.observe(f"startup.{stage}", seconds)
+        if stream is not None:
+            print(json.dumps({
+                f"{stage}_ms": round(seconds * 1000, 1)
+                for stage, seconds in self.stages.items()
+            }), file=stream, flush=True)
@@ -0,0 +1,51 @@
+"""
+    Name: stats_panel.py
+    Author:
+    Created:
+    Purpose: In-app window showing MapService timing spans,
+    cache counters and quota use, refreshed every second
+"""
+import tkinter as tk
+
+
+class StatsWindow(tk.Toplevel):
+    """
+    A small window that shows Instrumentation.format_text.
+    Works with both the ttk and the CustomTkinter viewer.
+    """
+
+    def __init__(self, parent, instrumentation, refresh=1000):
+        """
+        Open the window.
+
+        Args:
+            parent: The root window of the viewer
+            instrumentation (Instrumentation): Metrics to show
+            refresh (int): Milliseconds between updates
+        """
+        super().__init__(parent)
+        self.title("Map Stats")
+        self.instrumentation = instrumentation
+        self.refresh = refresh
+
+        self.text = tk.Text(
+            self, width=64, height=24, font=("Courier", 10), wrap="none")
+        self.text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        self._after_id = None
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.update_stats()
+
+    def update_stats(self):
+        """Redraw the metrics and schedule the next refresh."""
+        self.text.configure(state="normal")
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", self.instrumentation.format_text())
+        self.text.configure(state="disabled")
+        self._after_id = self.after(self.refresh, self.update_stats)
+
+    def close(self):
+        """Stop refreshing and close the window."""
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self.destroy()
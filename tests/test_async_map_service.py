@@ -0,0 +1,90 @@
+"""
+    Name: test_async_map_service.py
+    Author:
+    Created:
+    Purpose: Tests for AsyncMapService against the fake MapQuest server
+"""
+import asyncio
+import threading
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from async_map_service import AsyncMapService  # noqa: E402
+from map_cache import GeocodeCache, ImageCache  # noqa: E402
+from map_service import LocationNotFound  # noqa: E402
+
+LOCATION = "615 Mountain View Ave Scottsbluff NE"
+
+
+class ThreadRecordingCache(GeocodeCache):
+    """In-memory GeocodeCache that notes the threads it runs on."""
+
+    def __init__(self):
+        super().__init__(path=None)
+        self.threads = []
+
+    def get(self, query):
+        self.threads.append(threading.current_thread())
+        return super().get(query)
+
+    def put(self, query, value):
+        self.threads.append(threading.current_thread())
+        return super().put(query, value)
+
+
+def run(fake, func, **kwargs):
+    """Run func(service) on a fresh AsyncMapService."""
+    options = dict(
+        geocode_cache=False, image_cache=False, quota=False,
+        rate_limiter=False, base_url=fake.url, backoff_factor=0)
+    options.update(kwargs)
+
+    async def main():
+        async with AsyncMapService(**options) as service:
+            return await func(service)
+
+    return asyncio.run(main())
+
+
+def test_geocode_many(fake):
+    found, missing = run(
+        fake, lambda service: service.geocode_many([LOCATION, "nowhere"]))
+    assert found.latitude is not None
+    assert missing is None
+
+
+def test_static_map(fake):
+    image, location = run(
+        fake, lambda service: service.get_static_map(LOCATION, 14, "map"),
+        image_cache=ImageCache(path=None))
+    assert image.size == (800, 600)
+    assert location.latitude is not None
+
+    with pytest.raises(LocationNotFound):
+        run(fake, lambda service: service.get_static_map("nowhere", 14,
+                                                         "map"))
+
+
+def test_geocode_cache_runs_off_the_loop(fake):
+    cache = ThreadRecordingCache()
+
+    async def twice(service):
+        await service.geocode_location(LOCATION)
+        return await service.geocode_location(LOCATION)
+
+    fake.reset_stats()
+    assert run(fake, twice, geocode_cache=cache) is not None
+    assert fake.stats["requests"] == 1
+    # get, put, then get again, none on the event loop thread
+    assert len(cache.threads) == 3
+    assert threading.main_thread() not in cache.threads
+
+
+def test_error_status_is_not_retried(fake):
+    fake.reset_stats()
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(fake, lambda service: service._get(
+            f"{fake.url}/missing", {}, "geocode"))
+    assert fake.stats["requests"] == 1
@@ -0,0 +1,73 @@
+"""
+    Name: test_batch_geocode.py
+    Author:
+    Created:
+    Purpose: Tests for the batch geocoding CLI
+"""
+import csv
+import json
+import sys
+
+import batch_geocode
+from batch_geocode import RESULT_FIELDS, geocode_file
+
+
+def write_csv(path, addresses):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=["id", "address"])
+        writer.writeheader()
+        for number, address in enumerate(addresses):
+            writer.writerow({"id": number, "address": address})
+
+
+def addresses(count):
+    return [f"{number} Main St Scottsbluff NE" for number in range(count)]
+
+
+def test_csv_rows_keep_order_and_columns(tmp_path, service, fake):
+    source = addresses(25)
+    source[3] = "nowhere"
+    write_csv(tmp_path / "in.csv", source)
+
+    written, not_found = geocode_file(
+        service, str(tmp_path / "in.csv"), str(tmp_path / "out.csv"),
+        batch_size=10)
+    assert (written, not_found) == (25, 1)
+    # One batch request per page of ten
+    assert fake.stats["requests"] == 3
+
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["address"] for row in rows] == source
+    assert [row["id"] for row in rows] == [str(n) for n in range(25)]
+    assert list(rows[0]) == ["id", "address"] + RESULT_FIELDS
+    assert rows[3]["latitude"] == ""
+    assert float(rows[0]["latitude"]) == \
+        service.geocode_location(source[0]).latitude
+
+
+def test_jsonl_with_another_column(tmp_path, service):
+    with open(tmp_path / "in.jsonl", "w", encoding="utf-8") as file:
+        for address in addresses(3):
+            file.write(json.dumps({"where": address}) + "\n")
+        file.write("\n")
+
+    written, not_found = geocode_file(
+        service, str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"),
+        column="where")
+    assert (written, not_found) == (3, 0)
+    with open(tmp_path / "out.jsonl", encoding="utf-8") as file:
+        rows = [json.loads(line) for line in file]
+    assert [row["where"] for row in rows] == addresses(3)
+    assert all(row["latitude"] is not None for row in rows)
+
+
+def test_main(tmp_path, make_service, monkeypatch, capsys):
+    write_csv(tmp_path / "in.csv", addresses(5))
+    monkeypatch.setattr(batch_geocode, "MapService", lambda: make_service())
+    monkeypatch.setattr(sys, "argv", [
+        "batch_geocode.py", str(tmp_path / "in.csv"),
+        str(tmp_path / "out.csv"), "--batch-size", "2"])
+    batch_geocode.main()
+    assert capsys.readouterr().out.strip() == \
+        "Geocoded 5 rows, 0 not found"
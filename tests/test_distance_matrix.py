@@ -0,0 +1,98 @@
+"""
+    Name: test_distance_matrix.py
+    Author:
+    Created:
+    Purpose: Tests for the pruned, batched and cached distance matrix
+"""
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import distance_matrix as matrix_module  # noqa: E402
+from distance_matrix import default_cache, distance_matrix  # noqa: E402
+from geocode_result import GeocodeResult  # noqa: E402
+from map_cache import MatrixCache  # noqa: E402
+
+ORIGIN = (41.8666, -103.6672)
+
+
+def scattered(count, spread=1.0, seed=5):
+    rng = random.Random(seed)
+    return [(ORIGIN[0] + rng.uniform(-spread, spread),
+             ORIGIN[1] + rng.uniform(-spread, spread))
+            for _ in range(count)]
+
+
+def test_far_pairs_are_not_routed(service, fake):
+    destinations = scattered(60)
+    result = distance_matrix(service, [ORIGIN], destinations,
+                             max_distance=50000, cache=False)
+    straight = result["straight"]
+    near = straight <= 50000
+    assert 0 < near.sum() < near.size
+    assert np.isnan(result["distance"][~near]).all()
+    assert np.isnan(result["time"][~near]).all()
+    # The fake server answers 1.3 times the straight line
+    assert result["distance"][near] == pytest.approx(
+        straight[near] * 1.3, abs=1)
+    assert fake.stats["requests"] == 1
+    counters = service.instrumentation.snapshot()["counters"]
+    assert counters["matrix.pruned"] == int((~near).sum())
+
+
+def test_full_batches_per_origin(service, fake):
+    origins = [ORIGIN, GeocodeResult(41.0, -103.0)]
+    result = distance_matrix(service, origins, scattered(250),
+                             cache=False)
+    assert result["distance"].shape == (2, 250)
+    assert not np.isnan(result["distance"]).any()
+    # 99 destinations per request, three requests per origin
+    assert fake.stats["requests"] == 6
+
+
+def test_same_point_needs_no_request(service, fake):
+    result = distance_matrix(service, [ORIGIN], [ORIGIN], cache=False)
+    assert result["distance"][0, 0] == 0
+    assert result["time"][0, 0] == 0
+    assert fake.stats["requests"] == 0
+
+
+def test_pairs_are_cached(service, fake):
+    cache = MatrixCache(path=None)
+    destinations = scattered(30)
+    first = distance_matrix(service, [ORIGIN], destinations, cache=cache)
+    assert fake.stats["requests"] == 1
+
+    # Only the new destinations are requested
+    second = distance_matrix(service, [ORIGIN],
+                             destinations + scattered(5, seed=9),
+                             cache=cache)
+    assert fake.stats["requests"] == 2
+    assert np.array_equal(second["distance"][:, :30], first["distance"])
+
+    distance_matrix(service, [ORIGIN], destinations, cache=cache)
+    assert fake.stats["requests"] == 2
+
+    # Another route type is another pair
+    distance_matrix(service, [ORIGIN], destinations, cache=cache,
+                    route_type="shortest")
+    assert fake.stats["requests"] == 3
+
+
+def test_default_cache_is_opened_once(monkeypatch):
+    monkeypatch.setattr(matrix_module, "_default_cache", None)
+    cache = default_cache()
+    try:
+        assert isinstance(cache, MatrixCache)
+        assert default_cache() is cache
+    finally:
+        cache.close()
+
+
+def test_rejects_bad_input(service):
+    with pytest.raises(ValueError):
+        distance_matrix(service, [ORIGIN], [ORIGIN], route_type="flying")
+    with pytest.raises(ValueError):
+        service.route_matrix(ORIGIN, scattered(100))
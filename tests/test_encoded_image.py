@@ -0,0 +1,100 @@
+"""
+    Name: test_encoded_image.py
+    Author:
+    Created:
+    Purpose: Tests for EncodedImage, map bytes kept encoded until shown
+"""
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw, ImageOps
+
+from map_cache import EncodedImage
+
+
+def encode(image, image_format="PNG"):
+    output = BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+@pytest.fixture
+def source():
+    """A 100 x 60 image with a distinct color per quadrant."""
+    image = Image.new("RGB", (100, 60), (255, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((50, 0, 99, 29), fill=(0, 255, 0))
+    draw.rectangle((0, 30, 49, 59), fill=(0, 0, 255))
+    draw.rectangle((50, 30, 99, 59), fill=(255, 255, 0))
+    return image
+
+
+def test_sizes_without_decoding(source):
+    image = EncodedImage(encode(source), (40, 20))
+    assert image.is_png
+    assert image.source_size == (100, 60)
+    assert image.size == (40, 20)
+    assert image.box == (30, 20, 70, 40)
+    assert image._image is None
+
+    assert EncodedImage(encode(source)).box is None
+    assert EncodedImage(encode(source), (100, 60)).box is None
+
+
+def test_other_formats(source):
+    image = EncodedImage(encode(source, "JPEG"), (40, 20))
+    assert not image.is_png
+    assert image.source_size == (100, 60)
+    assert image.decode().size == (40, 20)
+
+
+def test_decode_crop(source):
+    image = EncodedImage(encode(source), (40, 20))
+    decoded = image.decode()
+    assert decoded.tobytes() == source.crop((30, 20, 70, 40)).tobytes()
+    # Decoded once, then kept
+    assert image.decode() is decoded
+
+
+def test_decode_scale(source):
+    image = EncodedImage(encode(source), (50, 30), mode="scale")
+    expected = ImageOps.fit(source, (50, 30), Image.Resampling.LANCZOS)
+    assert image.decode().tobytes() == expected.tobytes()
+
+
+def test_service_keeps_bytes_encoded(service, fake):
+    image, _ = service.get_static_map("Scottsbluff NE", 14, "map",
+                                      decode=False)
+    assert isinstance(image, EncodedImage)
+    assert image.is_png and image.box is None
+    assert image._image is None
+    assert image.size == (service.width, service.height)
+
+
+@pytest.fixture
+def root():
+    tk = pytest.importorskip("tkinter")
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    yield root
+    root.destroy()
+
+
+def test_photo_crop(root, source):
+    image = EncodedImage(encode(source), (40, 20))
+    photo = image.photo()
+    assert (photo.width(), photo.height()) == (40, 20)
+    # Each corner keeps the color of its quadrant
+    assert tuple(photo.get(0, 0)) == (255, 0, 0)
+    assert tuple(photo.get(39, 19)) == (255, 255, 0)
+    # A PNG crop goes straight to Tk, no PIL image is built
+    assert image._image is None
+
+
+def test_photo_scale(root, source):
+    image = EncodedImage(encode(source), (50, 30), mode="scale")
+    photo = image.photo()
+    assert (photo.width(), photo.height()) == (50, 30)
+    assert image._image is not None
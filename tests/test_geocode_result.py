@@ -0,0 +1,73 @@
+"""
+    Name: test_geocode_result.py
+    Author:
+    Created:
+    Purpose: Tests for GeocodeResult conversions
+"""
+import json
+
+import pytest
+
+from fake_mapquest import load_sample_location
+from geocode_result import FIELDS, GeocodeResult, to_columns
+
+
+@pytest.fixture
+def result():
+    return GeocodeResult.from_api(load_sample_location())
+
+
+def test_from_api(result):
+    sample = load_sample_location()
+    assert result.latitude == sample["latLng"]["lat"]
+    assert result.longitude == sample["latLng"]["lng"]
+    assert result.city == sample["adminArea5"]
+    assert result.quality_code == sample["geocodeQualityCode"]
+
+
+def test_list_round_trip_through_json(result):
+    stored = json.loads(json.dumps(result.to_list()))
+    assert GeocodeResult.from_list(stored) == result
+
+
+def test_to_list_trims_trailing_none():
+    assert GeocodeResult(40.0, -75.0).to_list() == [40.0, -75.0]
+
+
+def test_dict_round_trip(result):
+    data = result.to_dict()
+    assert list(data) == list(FIELDS)
+    assert GeocodeResult.from_dict(data) == result
+
+
+def test_convert_legacy_dict():
+    legacy = {
+        "latitude": 40.0, "longitude": -75.0, "street": "",
+        "city": "N/A", "state": "PA", "unknown": "ignored",
+    }
+    result = GeocodeResult.convert(legacy)
+    assert result.street is None
+    assert result.city is None
+    assert result.state == "PA"
+    assert GeocodeResult.convert(result) is result
+    assert GeocodeResult.convert([40.0, -75.0]) == GeocodeResult(40.0, -75.0)
+
+
+def test_dict_style_access(result):
+    assert result["latitude"] == result.latitude
+    assert result.get("city") == result.city
+    assert result.get("nope", "x") == "x"
+    with pytest.raises(KeyError):
+        result["nope"]
+
+
+def test_interned_fields_are_shared():
+    first = GeocodeResult(1.0, 2.0, state="".join(["N", "E"]))
+    second = GeocodeResult(3.0, 4.0, state="".join(["N", "E"]))
+    assert first.state is second.state
+
+
+def test_to_columns(result):
+    columns = to_columns([result, None])
+    assert columns["latitude"] == [result.latitude, None]
+    assert set(columns) == set(FIELDS)
@@ -0,0 +1,101 @@
+"""
+    Name: test_geocode_store.py
+    Author:
+    Created:
+    Purpose: Tests for GeocodeStore queries and save/load
+"""
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from geocode_result import GeocodeResult  # noqa: E402
+from geocode_store import GeocodeStore  # noqa: E402
+from spatial_index import haversine  # noqa: E402
+
+
+@pytest.fixture
+def store():
+    rng = random.Random(7)
+    store = GeocodeStore()
+    for i in range(2000):
+        store.add(f"{i} Main St", GeocodeResult(
+            rng.uniform(40, 42), rng.uniform(-105, -103),
+            city=rng.choice(["Scottsbluff", "Gering", None]),
+            state="NE"))
+    return store
+
+
+def points(store):
+    return list(zip(store.column("latitude").tolist(),
+                    store.column("longitude").tolist()))
+
+
+def test_add_and_get(store):
+    assert len(store) == 2000
+    assert not store.add("0 main st", GeocodeResult(0.0, 0.0))
+    result = store.get("0 MAIN ST")
+    assert result.state == "NE"
+    assert store.get("nowhere") is None
+
+
+def test_bbox_matches_brute_force(store):
+    rows = store.bbox(40.5, -104.5, 41.0, -104.0)
+    expected = [row for row, (lat, lng) in enumerate(points(store))
+                if 40.5 <= lat <= 41.0 and -104.5 <= lng <= -104.0]
+    assert rows.tolist() == expected
+
+
+def test_bbox_across_antimeridian():
+    store = GeocodeStore()
+    store.add("east", GeocodeResult(0.0, 179.5))
+    store.add("west", GeocodeResult(0.0, -179.5))
+    store.add("far", GeocodeResult(0.0, 0.0))
+    assert store.bbox(-1, 179, 1, -179).tolist() == [0, 1]
+
+
+def test_radius_matches_brute_force(store):
+    lat, lng = 41.0, -104.0
+    rows, distances = store.radius(lat, lng, 20000)
+    expected = sorted(
+        (haversine(lat, lng, *point), row)
+        for row, point in enumerate(points(store))
+        if haversine(lat, lng, *point) <= 20000)
+    assert rows.tolist() == [row for _, row in expected]
+    assert np.allclose(distances, [d for d, _ in expected])
+
+
+def test_nearest(store):
+    lat, lng = 41.0, -104.0
+    rows, distances = store.nearest(lat, lng, k=5)
+    all_distances = sorted(
+        haversine(lat, lng, *point) for point in points(store))
+    assert np.allclose(distances, all_distances[:5])
+    rows, _ = store.nearest(lat, lng, k=5, max_distance=1)
+    assert len(rows) == 0
+
+
+def test_centroid():
+    store = GeocodeStore()
+    store.add("a", GeocodeResult(10.0, 179.0))
+    store.add("b", GeocodeResult(10.0, -179.0))
+    lat, lng = store.centroid()
+    assert abs(abs(lng) - 180.0) < 1e-6
+    assert GeocodeStore().centroid() is None
+
+
+@pytest.mark.parametrize("name", ["store.npz", "store"])
+def test_save_and_load(tmp_path, store, name):
+    path = str(tmp_path / name)
+    store.save(path)
+    loaded = GeocodeStore.load(path)
+    assert len(loaded) == len(store)
+    assert loaded.results() == store.results()
+    assert loaded.bbox(40.5, -104.5, 41.0, -104.0).tolist() == \
+        store.bbox(40.5, -104.5, 41.0, -104.0).tolist()
+
+    # Still appendable, including after a memory-mapped load
+    assert loaded.add("new place", GeocodeResult(1.0, 2.0, city="New"))
+    assert loaded.get("new place").city == "New"
+    assert len(loaded) == len(store) + 1
@@ -0,0 +1,103 @@
+"""
+    Name: test_instrumentation.py
+    Author:
+    Created:
+    Purpose: Tests for the timing spans, counters and Prometheus output
+"""
+import json
+import logging
+import re
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from instrumentation import Instrumentation
+
+# One sample line of the Prometheus text format
+SAMPLE = re.compile(
+    r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-z]+="[^"]*"\})? -?[0-9.e+-]+$')
+
+
+def test_spans():
+    instrumentation = Instrumentation()
+    instrumentation.observe("decode", 0.1)
+    instrumentation.observe("decode", 0.3)
+    with pytest.raises(ValueError):
+        with instrumentation.span("http.map"):
+            raise ValueError
+    spans = instrumentation.snapshot()["spans"]
+    assert spans["decode"]["count"] == 2
+    assert spans["decode"]["avg"] == pytest.approx(0.2)
+    assert spans["decode"]["max"] == 0.3
+    assert spans["decode"]["last"] == 0.3
+    # A failed stage is timed too
+    assert spans["http.map"]["count"] == 1
+    assert [name for _, name, _ in instrumentation.recent] == \
+        ["decode", "decode", "http.map"]
+
+
+def test_counters_and_gauges():
+    instrumentation = Instrumentation()
+    instrumentation.count("image_cache.hit")
+    instrumentation.count("bytes_received", 1500)
+    instrumentation.count("bytes_received", 500)
+    instrumentation.gauge("quota.remaining", 10)
+    instrumentation.gauge("quota.remaining", 9)
+    snapshot = instrumentation.snapshot()
+    assert snapshot["counters"] == {"image_cache.hit": 1,
+                                    "bytes_received": 2000}
+    assert snapshot["gauges"] == {"quota.remaining": 9}
+    text = instrumentation.format_text()
+    assert "bytes_received" in text and "quota.remaining" in text
+
+
+def test_prometheus_text():
+    instrumentation = Instrumentation()
+    instrumentation.observe("http.map", 0.25)
+    instrumentation.count("image_cache.miss", 2)
+    instrumentation.gauge("quota.used", 7)
+    lines = instrumentation.prometheus().splitlines()
+
+    for line in lines:
+        assert line.startswith("# TYPE ") or SAMPLE.match(line), line
+    assert 'mapquest_span_seconds_count{stage="http.map"} 1' in lines
+    assert 'mapquest_span_seconds_sum{stage="http.map"} 0.250000' in lines
+    assert "# TYPE mapquest_image_cache_miss_total counter" in lines
+    assert "mapquest_image_cache_miss_total 2" in lines
+    assert "# TYPE mapquest_quota_used gauge" in lines
+    assert "mapquest_quota_used 7" in lines
+
+
+def test_debug_log_records(caplog):
+    instrumentation = Instrumentation()
+    with caplog.at_level(logging.DEBUG, logger="mapquest"):
+        instrumentation.observe("http.map", 0.0125, status=200)
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record == {"span": "http.map", "ms": 12.5, "status": 200}
+
+
+def test_serve_metrics():
+    instrumentation = Instrumentation()
+    instrumentation.count("requests.map")
+    server = instrumentation.serve_metrics(port=0)
+    try:
+        host, port = server.server_address[:2]
+        with urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            assert b"mapquest_requests_map_total 1" in response.read()
+        with pytest.raises(HTTPError):
+            urlopen(f"http://{host}:{port}/other", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_service_records_the_hot_path(service):
+    service.get_static_map("Scottsbluff NE", 14, "map")
+    service.get_static_map("Scottsbluff NE", 14, "map")
+    snapshot = service.instrumentation.snapshot()
+    assert snapshot["spans"]["get_static_map"]["count"] == 2
+    assert snapshot["spans"]["http.map"]["count"] == 1
+    assert snapshot["counters"]["requests.map"] == 1
+    assert snapshot["counters"]["image_cache.miss"] == 1
+    assert snapshot["counters"]["image_cache.hit"] == 1
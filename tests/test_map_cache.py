@@ -0,0 +1,214 @@
+"""
+    Name: test_map_cache.py
+    Author:
+    Created:
+    Purpose: Tests for the geocode, route and image caches
+"""
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import map_cache
+from geocode_result import GeocodeResult
+from map_cache import GeocodeCache, ImageCache, RouteCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A time.time for map_cache that only moves when told to."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        map_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def result(number):
+    return GeocodeResult(float(number), -float(number), city=f"City {number}")
+
+
+def png(color, size=(64, 48)):
+    output = BytesIO()
+    Image.new("RGB", size, color).save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_get_and_put(tmp_path, disk):
+    cache = GeocodeCache(path=str(tmp_path / "geo.db") if disk else None)
+    cache.put("Scottsbluff, NE", result(1))
+    assert cache.get("  scottsbluff ne ") == result(1)
+    assert cache.get("Gering NE") is None
+    assert len(cache) == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "geo.db")
+    cache = GeocodeCache(path=path)
+    cache.put("Scottsbluff NE", result(1))
+    cache.close()
+    assert GeocodeCache(path=path).get("Scottsbluff NE") == result(1)
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_entries_expire(tmp_path, clock, disk):
+    cache = GeocodeCache(path=str(tmp_path / "geo.db") if disk else None,
+                         ttl=60)
+    cache.put("Scottsbluff NE", result(1))
+    clock.now += 59
+    assert cache.get("Scottsbluff NE") == result(1)
+    clock.now += 2
+    assert cache.get("Scottsbluff NE") is None
+    assert len(cache) == 0
+
+
+def test_memory_tier_is_lru():
+    cache = GeocodeCache(path=None, max_memory_entries=2)
+    cache.put("a", result(1))
+    cache.put("b", result(2))
+    cache.get("a")
+    cache.put("c", result(3))
+    assert cache.get("a") == result(1)
+    assert cache.get("b") is None
+    assert cache.get("c") == result(3)
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path, clock):
+    cache = GeocodeCache(path=str(tmp_path / "geo.db"),
+                         max_memory_entries=1, max_disk_entries=100)
+    for number in range(100):
+        clock.now += 1
+        cache.put(f"place {number}", result(number))
+    # Reading the oldest entry makes it the most recent
+    clock.now += 1
+    assert cache.get("place 0") == result(0)
+    assert len(cache) == 100
+
+    # One row over the limit trims to 90 in one go
+    clock.now += 1
+    cache.put("place 100", result(100))
+    assert len(cache) == 90
+    assert cache.get("place 0") == result(0)
+    assert cache.get("place 1") is None
+    assert cache.get("place 100") == result(100)
+
+    # The next ten puts do not evict
+    for number in range(101, 111):
+        clock.now += 1
+        cache.put(f"place {number}", result(number))
+    assert len(cache) == 100
+
+
+def test_put_many_evicts_once(tmp_path):
+    cache = GeocodeCache(path=str(tmp_path / "geo.db"),
+                         max_disk_entries=100)
+    cache.put_many({f"place {number}": result(number)
+                    for number in range(150)})
+    assert len(cache) == 90
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_get_many(tmp_path, disk):
+    cache = GeocodeCache(path=str(tmp_path / "geo.db") if disk else None)
+    cache.put_many({"Scottsbluff NE": result(1), "Gering NE": result(2)})
+    found = cache.get_many(
+        ["Scottsbluff NE", "scottsbluff, ne", "Gering NE", "Omaha NE"])
+    # Every spelling of a cached key is answered
+    assert found == {"Scottsbluff NE": result(1),
+                     "scottsbluff, ne": result(1),
+                     "Gering NE": result(2)}
+
+
+def test_caches_share_a_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+    geocode = GeocodeCache(path=path)
+    routes = RouteCache(path=path)
+    geocode.put("key", result(1))
+    routes.put("key", {"points": [[1.0, 2.0]]})
+    assert geocode.get("key") == result(1)
+    assert routes.get("key") == {"points": [[1.0, 2.0]]}
+    assert len(geocode) == len(routes) == 1
+
+
+def stored_keys(cache):
+    rows = cache._db.execute("SELECT key FROM images").fetchall()
+    files = {name[:-4] for folder in os.listdir(cache.path)
+             if os.path.isdir(os.path.join(cache.path, folder))
+             for name in os.listdir(os.path.join(cache.path, folder))}
+    return {key for key, in rows}, files
+
+
+def test_image_eviction_with_equal_access_times(tmp_path, clock):
+    # Every image is written in the same clock tick
+    cache = ImageCache(path=str(tmp_path / "images"), max_disk_bytes=3000)
+    keys = [ImageCache.key(number=number) for number in range(10)]
+    for key in keys:
+        cache.put_bytes(key, os.urandom(1000))
+
+    rows, files = stored_keys(cache)
+    # The index and the files agree on what was evicted
+    assert rows == files
+    assert len(rows) == 3
+    for key in keys:
+        assert (cache.get_bytes(key) is not None) == (key in rows)
+
+
+def test_image_key_covers_every_parameter():
+    params = dict(center="41.8,-103.6", zoom=14, type="map",
+                  size="800,600")
+    key = ImageCache.key(**params)
+    assert key == ImageCache.key(**dict(reversed(list(params.items()))))
+    assert key == ImageCache.key(**dict(params, zoom="14"))
+    for name, value in (("zoom", 15), ("type", "sat"), ("size", "400,300"),
+                        ("center", "41.8,-103.7")):
+        assert ImageCache.key(**dict(params, **{name: value})) != key
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_image_get_and_put(tmp_path, disk):
+    cache = ImageCache(path=str(tmp_path / "images") if disk else None)
+    data = png("red")
+    image = cache.put("key", data)
+    assert image.size == (64, 48)
+    # Decoded images are kept in memory
+    assert cache.get("key") is image
+    assert cache.get_bytes("key") == data
+    assert cache.get("other") is None
+
+    cache.clear()
+    assert cache.get("key") is None
+    assert cache.get_bytes("key") is None
+
+
+def test_image_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "images")
+    cache = ImageCache(path=path)
+    cache.put_bytes("key", png("red"))
+    cache.close()
+    image = ImageCache(path=path).get("key")
+    assert image.getpixel((0, 0)) == (255, 0, 0)
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_image_size_cap_evicts_least_recently_used(tmp_path, clock, disk):
+    cache = ImageCache(path=str(tmp_path / "images") if disk else None,
+                       max_disk_bytes=3500, max_memory_images=0)
+    for key in "abc":
+        clock.now += 1
+        cache.put_bytes(key, os.urandom(1000))
+    # Reading a makes b the oldest
+    clock.now += 1
+    assert cache.get_bytes("a") is not None
+    clock.now += 1
+    cache.put_bytes("d", os.urandom(1000))
+    assert cache.get_bytes("b") is None
+    for key in "acd":
+        assert cache.get_bytes(key) is not None
+
+
+def test_image_cap_keeps_the_newest_image(tmp_path):
+    cache = ImageCache(path=str(tmp_path / "images"), max_disk_bytes=100)
+    cache.put_bytes("big", os.urandom(1000))
+    assert cache.get_bytes("big") is not None
@@ -0,0 +1,122 @@
+"""
+    Name: test_map_export.py
+    Author:
+    Created:
+    Purpose: Tests for exporting static maps to a folder or archive
+"""
+import json
+import sys
+import tarfile
+import zipfile
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import map_export
+from map_export import export_maps, read_locations
+from quota import QuotaTracker
+
+LOCATIONS = ["615 Mountain View Ave Scottsbluff NE", "nowhere",
+             (41.86, -103.66)]
+
+
+def read_manifest(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_read_locations(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("address,latitude,longitude\n"
+                    "1 Main St Gering NE,,\n"
+                    ",41.86,-103.66\n", encoding="utf-8")
+    assert list(read_locations(str(path))) == [
+        "1 Main St Gering NE", (41.86, -103.66)]
+
+
+def test_folder_and_manifest(tmp_path, service):
+    output = str(tmp_path / "maps")
+    counts = export_maps(service, LOCATIONS, output, processes=0)
+    assert counts == {"ok": 2, "not_found": 1, "error": 0, "skipped": 0,
+                      "stopped": None}
+
+    image = Image.open(tmp_path / "maps" / "000000.png")
+    assert image.size == (service.width, service.height)
+    assert (tmp_path / "maps" / "000002.png").exists()
+    assert not (tmp_path / "maps" / "000001.png").exists()
+
+    entries = read_manifest(output + ".manifest.jsonl")
+    assert [entry["status"] for entry in entries] == \
+        ["ok", "not_found", "ok"]
+    assert entries[2]["location"] == [41.86, -103.66]
+    assert entries[0]["file"] == "000000.png"
+
+
+def test_resume_skips_finished_rows(tmp_path, service, fake):
+    output = str(tmp_path / "maps.zip")
+    export_maps(service, LOCATIONS[:1], output, processes=0)
+    fake.reset_stats()
+
+    counts = export_maps(service, LOCATIONS, output, processes=0)
+    assert (counts["skipped"], counts["ok"], counts["not_found"]) == \
+        (1, 1, 1)
+    # Only the new rows were looked up
+    assert fake.stats["requests"] == 2
+    with zipfile.ZipFile(output) as archive:
+        assert sorted(archive.namelist()) == ["000000.png", "000002.png"]
+
+    counts = export_maps(service, LOCATIONS, output, processes=0,
+                         resume=False)
+    assert counts["skipped"] == 0
+
+
+def test_webp_into_tar(tmp_path, service):
+    output = str(tmp_path / "maps.tar.gz")
+    counts = export_maps(service, LOCATIONS[:1], output, extension="webp",
+                         processes=0)
+    assert counts["ok"] == 1
+    with tarfile.open(output) as archive:
+        data = archive.extractfile("000000.webp").read()
+    image = Image.open(BytesIO(data))
+    assert image.format == "WEBP"
+    assert image.size == (service.width, service.height)
+
+
+def test_rejects_unknown_format(tmp_path, service):
+    with pytest.raises(ValueError):
+        export_maps(service, LOCATIONS, str(tmp_path / "maps"),
+                    extension="gif")
+
+
+def test_stops_at_soft_limit(tmp_path, make_service, fake):
+    quota = QuotaTracker(path=None, monthly_limit=10, soft_limit=0.5)
+    quota.record("map", 5)
+    service = make_service(quota=quota)
+    output = str(tmp_path / "maps")
+
+    counts = export_maps(service, LOCATIONS, output, processes=0)
+    assert counts["stopped"] == "quota"
+    assert counts["ok"] == 0
+    assert fake.stats["requests"] == 0
+
+    # Past the soft limit the rest of the quota is spent
+    counts = export_maps(service, LOCATIONS, output, processes=0,
+                         stop_at_soft_limit=False)
+    assert counts["stopped"] is None
+    assert counts["ok"] == 2
+    assert quota.used <= 10
+
+
+def test_main(tmp_path, make_service, monkeypatch, capsys):
+    (tmp_path / "in.csv").write_text(
+        "address\n615 Mountain View Ave Scottsbluff NE\n", encoding="utf-8")
+    service = make_service()
+    monkeypatch.setattr(map_export, "MapService", lambda **kwargs: service)
+    monkeypatch.setattr(sys, "argv", [
+        "map_export.py", str(tmp_path / "in.csv"), str(tmp_path / "maps"),
+        "--size", "200x150", "--processes", "0"])
+    map_export.main()
+    assert "Exported 1 maps" in capsys.readouterr().err
+    image = Image.open(tmp_path / "maps" / "000000.png")
+    assert image.size == (200, 150)
@@ -0,0 +1,70 @@
+"""
+    Name: test_map_server.py
+    Author:
+    Created:
+    Purpose: Tests for the HTTP/JSON map server
+"""
+import json
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from map_server import MapServer
+
+
+@pytest.fixture
+def server(service):
+    with MapServer(service, port=0, workers=2) as server:
+        yield server
+
+
+def fetch(url):
+    with urlopen(url, timeout=10) as response:
+        return response.status, response.headers, response.read()
+
+
+def fetch_error(url):
+    with pytest.raises(HTTPError) as error:
+        fetch(url)
+    return error.value.code, json.loads(error.value.read())
+
+
+def test_geocode(server):
+    status, _, body = fetch(f"{server.url}/geocode?location=Scottsbluff")
+    assert status == 200
+    assert json.loads(body)["latitude"] is not None
+
+    status, body = fetch_error(f"{server.url}/geocode?location=nowhere")
+    assert status == 404
+
+
+def test_static_map(server):
+    status, headers, body = fetch(
+        f"{server.url}/staticmap?location=Scottsbluff&zoom=12&type=sat")
+    assert status == 200
+    assert headers["Content-Type"] == "image/png"
+    assert body.startswith(b"\x89PNG")
+    assert headers["X-Latitude"]
+
+    status, _ = fetch_error(
+        f"{server.url}/staticmap?location=nowhere&zoom=12")
+    assert status == 404
+    status, _ = fetch_error(
+        f"{server.url}/staticmap?location=Scottsbluff&zoom=99")
+    assert status == 400
+
+
+def test_upstream_errors_hide_the_request(make_service, fake):
+    service = make_service(retries=0)
+    with MapServer(service, port=0, workers=2) as server:
+        fake.error_rate = 1.0
+        status, body = fetch_error(f"{server.url}/geocode?location=Omaha")
+    assert status == 502
+    assert body == {"error": "Upstream lookup failed"}
+
+
+def test_health(server):
+    status, _, body = fetch(f"{server.url}/health")
+    assert status == 200
+    assert json.loads(body)["in_flight"] == 0
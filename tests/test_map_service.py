@@ -0,0 +1,98 @@
+"""
+    Name: test_map_service.py
+    Author:
+    Created:
+    Purpose: Tests for the service paths against the fake MapQuest server
+"""
+import pytest
+
+from map_cache import GeocodeCache
+from map_service import LocationNotFound
+from quota import QuotaTracker
+
+LOCATION = "615 Mountain View Ave Scottsbluff NE"
+
+
+def test_geocode_is_cached(service, fake):
+    first = service.geocode_location(LOCATION)
+    requests = fake.stats["requests"]
+    second = service.geocode_location(LOCATION)
+    assert second == first
+    assert fake.stats["requests"] == requests == 1
+
+
+def test_static_map(service):
+    image, location = service.get_static_map(LOCATION, 14, "map",
+                                             decode=False)
+    assert image.size == (service.width, service.height)
+    assert location.latitude is not None
+
+    with pytest.raises(LocationNotFound):
+        service.get_static_map("nowhere at all", 14, "map")
+
+
+def test_static_map_is_cached(service, fake):
+    first, _ = service.get_static_map(LOCATION, 14, "map", decode=False)
+    fake.reset_stats()
+    second, _ = service.get_static_map(LOCATION, 14, "map", decode=False)
+    assert second.data == first.data
+    assert fake.stats["requests"] == 0
+
+    # Another map type is another image
+    service.get_static_map(LOCATION, 14, "sat", decode=False)
+    assert fake.stats["requests"] == 1
+
+
+def test_geocode_many_keeps_order(service):
+    locations = [f"{number} Main St Scottsbluff NE" for number in range(30)]
+    locations[7] = "nowhere"
+    results = list(service.geocode_many(locations, batch_size=8))
+    assert [location for location, _ in results] == locations
+    assert results[7][1] is None
+    for location, result in results:
+        if result is not None:
+            assert result == service.geocode_location(location)
+
+
+def test_geocode_many_uses_the_cache(make_service, fake, tmp_path):
+    cache = GeocodeCache(path=str(tmp_path / "geo.db"))
+    service = make_service(geocode_cache=cache)
+    locations = [f"{number} Main St Scottsbluff NE" for number in range(20)]
+    first = list(service.geocode_many(locations, batch_size=10))
+    assert len(cache) == 20
+
+    fake.reset_stats()
+    assert list(service.geocode_many(locations, batch_size=10)) == first
+    assert fake.stats["requests"] == 0
+
+
+def test_route_map_shape_is_accepted(service, fake):
+    route = service.get_route(LOCATION, "1 Main St Gering NE")
+    fake.reset_stats()
+    image, view = service.get_route_map(route, decode=False)
+    assert 1 <= view["zoom"] <= 20
+    assert image.size == (service.width, service.height)
+    # The fake server answers a malformed shape with 400
+    assert fake.stats["errors"] == 0
+
+
+def test_retries_are_counted(make_service, fake):
+    quota = QuotaTracker(path=None)
+    service = make_service(quota=quota, retries=2)
+    fake.error_rate = 1.0
+    with pytest.raises(Exception):
+        service.geocode_location(LOCATION)
+    # Every attempt the server answered is a transaction
+    assert quota.used == fake.stats["requests"] == 3
+
+
+def test_reverse_geocode_uses_own_cache(make_service):
+    geocode_cache = GeocodeCache(path=None)
+    reverse_cache = GeocodeCache(path=None)
+    service = make_service(geocode_cache=geocode_cache,
+                           reverse_cache=reverse_cache)
+    result = service.reverse_geocode(41.86, -103.66)
+    assert result is not None
+    assert len(reverse_cache) == 1
+    assert len(geocode_cache) == 0
+
@@ -0,0 +1,111 @@
+"""
+    Name: test_map_worker.py
+    Author:
+    Created:
+    Purpose: Tests for Debouncer and MapFetcher without a display
+"""
+import threading
+
+from map_worker import Debouncer, MapFetcher
+
+
+class FakeRoot:
+    """The after/after_cancel part of a Tk root, run by hand."""
+
+    def __init__(self):
+        self.calls = {}
+        self.next_id = 0
+
+    def after(self, ms, func, *args):
+        self.next_id += 1
+        self.calls[self.next_id] = (func, args)
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.calls.pop(after_id, None)
+
+    def run(self):
+        """Run every scheduled call, including ones they schedule."""
+        while self.calls:
+            after_id = min(self.calls)
+            func, args = self.calls.pop(after_id)
+            func(*args)
+
+
+def test_debouncer_runs_last_call_once():
+    root = FakeRoot()
+    debouncer = Debouncer(root, delay=300)
+    seen = []
+    for value in range(5):
+        debouncer.call(seen.append, value)
+    assert debouncer.pending
+    root.run()
+    assert seen == [4]
+    assert not debouncer.pending
+
+
+def test_debouncer_cancel_and_flush():
+    root = FakeRoot()
+    debouncer = Debouncer(root, delay=300)
+    seen = []
+    debouncer.call(seen.append, 1)
+    debouncer.cancel()
+    root.run()
+    assert seen == []
+
+    debouncer.call(seen.append, 2)
+    debouncer.flush()
+    assert seen == [2]
+    assert not root.calls
+
+
+def test_debouncer_zero_delay_runs_at_once():
+    seen = []
+    Debouncer(FakeRoot(), delay=0).call(seen.append, 1)
+    assert seen == [1]
+
+
+def test_fetcher_delivers_only_latest():
+    root = FakeRoot()
+    fetcher = MapFetcher(root, max_workers=1)
+    release = threading.Event()
+    seen = []
+
+    fetcher.submit(release.wait, on_success=lambda _: seen.append("old"))
+    fetcher.submit(lambda: "new", on_success=seen.append)
+    release.set()
+    while fetcher.busy:
+        root.run()
+    root.run()
+    assert seen == ["new"]
+    fetcher.shutdown()
+
+
+def test_fetcher_reports_errors():
+    root = FakeRoot()
+    fetcher = MapFetcher(root)
+    errors = []
+
+    def fail():
+        raise ValueError("boom")
+
+    fetcher.submit(fail, on_success=errors.append, on_error=errors.append)
+    while fetcher.busy:
+        root.run()
+    assert isinstance(errors[0], ValueError)
+    fetcher.shutdown()
+
+
+def test_fetcher_cancel_drops_results():
+    root = FakeRoot()
+    fetcher = MapFetcher(root)
+    release = threading.Event()
+    seen = []
+    fetcher.submit(release.wait, on_success=seen.append)
+    fetcher.cancel()
+    release.set()
+    while fetcher.busy:
+        root.run()
+    root.run()
+    assert seen == []
+    fetcher.shutdown()
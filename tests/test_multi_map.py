@@ -0,0 +1,87 @@
+"""
+    Name: test_multi_map.py
+    Author:
+    Created:
+    Purpose: Tests for multi-location maps, fit_bounds and grid_clusters
+"""
+import random
+
+import pytest
+
+from mercator import fit_bounds, grid_clusters, lat_lng_to_pixel
+
+
+def scattered(count, seed=3):
+    rng = random.Random(seed)
+    return [(rng.uniform(41.0, 42.0), rng.uniform(-104.0, -103.0))
+            for _ in range(count)]
+
+
+def extent(points, lat, lng, zoom):
+    """Largest pixel offset of any point from the center."""
+    center_x, center_y = lat_lng_to_pixel(lat, lng, zoom)
+    pixels = [lat_lng_to_pixel(*point, zoom) for point in points]
+    return (max(abs(x - center_x) for x, _ in pixels),
+            max(abs(y - center_y) for _, y in pixels))
+
+
+def test_fit_bounds_shows_every_point():
+    points = scattered(50)
+    lat, lng, zoom = fit_bounds(points, 800, 600, padding=32)
+    dx, dy = extent(points, lat, lng, zoom)
+    assert dx <= 400 - 32 and dy <= 300 - 32
+    # One level closer would cut points off
+    dx, dy = extent(points, lat, lng, zoom + 1)
+    assert dx > 400 - 32 or dy > 300 - 32
+
+
+def test_fit_bounds_single_point():
+    assert fit_bounds([(41.8, -103.6)], 800, 600) == \
+        pytest.approx((41.8, -103.6, 16))
+    assert fit_bounds([(41.8, -103.6)], 800, 600, max_zoom=12)[2] == 12
+
+
+def test_few_points_are_not_clustered():
+    points = scattered(10)
+    assert grid_clusters(points, 10, 10) == [(lat, lng, 1)
+                                             for lat, lng in points]
+
+
+def test_clusters_cover_every_point():
+    points = scattered(500)
+    clusters = grid_clusters(points, 10, 50)
+    assert len(clusters) <= 50
+    assert sum(count for _, _, count in clusters) == 500
+    for lat, lng, _ in clusters:
+        assert 41.0 <= lat <= 42.0 and -104.0 <= lng <= -103.0
+
+
+def test_cluster_is_at_the_mean():
+    points = [(41.0, -103.0), (41.0002, -103.0002), (45.0, -100.0)]
+    clusters = sorted(grid_clusters(points, 10, 2))
+    assert clusters[0] == pytest.approx((41.0001, -103.0001, 2))
+    assert clusters[1] == (45.0, -100.0, 1)
+
+
+def test_service_multi_map(service, fake):
+    points = scattered(200)
+    points.insert(5, None)
+    image, view = service.get_static_map_multi(points, max_markers=50)
+    assert image.size == (service.width, service.height)
+    assert len(view["markers"]) <= 50
+    assert sum(count for _, _, count in view["markers"]) == 200
+    assert fake.stats["requests"] == 1
+
+    # The same view again comes from the image cache
+    service.get_static_map_multi(points, max_markers=50)
+    assert fake.stats["requests"] == 1
+
+
+def test_service_multi_map_takes_results(service):
+    results = [service.geocode_location(place)
+               for place in ("Scottsbluff NE", "Gering NE")]
+    _, view = service.get_static_map_multi(results, decode=False)
+    assert len(view["markers"]) == 2
+
+    with pytest.raises(Exception, match="No locations"):
+        service.get_static_map_multi([None])
@@ -0,0 +1,159 @@
+"""
+    Name: test_offline_pack.py
+    Author:
+    Created:
+    Purpose: Tests for the pack file format and the offline fallback
+"""
+import os
+import socket
+
+import pytest
+import requests
+
+from fake_mapquest import FakeMapQuest
+from geocode_result import GeocodeResult
+from map_service import never_connected
+from offline_pack import (
+    OfflinePack, PackWriter, export_pack, geocode_key, tile_range)
+
+
+def write_pack(path, records, info=None):
+    writer = PackWriter(path)
+    for key, data in records.items():
+        writer.add(key, data)
+    writer.close(info or {})
+    return OfflinePack(path)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "test.mqpack")
+    records = {f"key{i}": os.urandom(i % 50) for i in range(500)}
+    pack = write_pack(path, records, {"zooms": [14]})
+    try:
+        for key, data in records.items():
+            assert pack.get(key) == data
+        assert pack.get("missing") is None
+        assert pack.info == {"zooms": [14]}
+    finally:
+        pack.close()
+
+
+def test_typed_records(tmp_path):
+    path = str(tmp_path / "test.mqpack")
+    result = GeocodeResult(41.89, -103.67, city="Scottsbluff")
+    writer = PackWriter(path)
+    writer.add_geocode(" 615 Mountain View Ave, Scottsbluff ", result)
+    writer.add_image("abc", b"png")
+    writer.add_tile(1, 2, 14, "map", b"tile")
+    writer.close({})
+
+    pack = OfflinePack(path)
+    try:
+        assert pack.geocode("615 mountain view ave scottsbluff") == result
+        assert pack.image("abc") == b"png"
+        assert pack.tile(1, 2, 14, "map") == b"tile"
+        assert pack.tile(1, 2, 14, "sat") is None
+    finally:
+        pack.close()
+
+
+def test_duplicate_values_are_stored_once(tmp_path):
+    path = str(tmp_path / "test.mqpack")
+    data = os.urandom(10000)
+    pack = write_pack(path, {f"key{i}": data for i in range(20)})
+    pack.close()
+    assert os.path.getsize(path) < 2 * len(data)
+
+
+def test_discard_leaves_no_file(tmp_path):
+    path = str(tmp_path / "test.mqpack")
+    writer = PackWriter(path)
+    writer.add("key", b"data")
+    writer.discard()
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.mqpack"
+    path.write_bytes(b"not a pack at all, just some bytes here")
+    with pytest.raises(ValueError):
+        OfflinePack(str(path))
+
+
+def test_keys_are_normalized():
+    assert geocode_key("A, B") == geocode_key("a b")
+
+
+def test_tile_range_covers_bbox():
+    tiles = list(tile_range((41.8, -103.8, 41.9, -103.6), 12))
+    assert tiles
+    assert len(set(tiles)) == len(tiles)
+
+
+def dead_url():
+    """URL of a local port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def test_export_and_offline_fallback(tmp_path, make_service):
+    path = str(tmp_path / "offline.mqpack")
+    online = make_service(resize_mode="crop", fetch_size=(1024, 768))
+    counts = export_pack(
+        online, path, ["615 Mountain View Ave Scottsbluff NE"],
+        zooms=(14,))
+    assert counts["geocode"] == 1
+    assert counts["map"] == 1
+
+    pack = OfflinePack(path)
+    try:
+        # The size that was fetched, not the service size
+        assert pack.info["size"] == [1024, 768]
+
+        offline = make_service(
+            base_url=dead_url(), offline_pack=pack, retries=0,
+            resize_mode="crop", fetch_size=(1024, 768))
+        image, location = offline.get_static_map(
+            "615 Mountain View Ave Scottsbluff NE", 14, "map", decode=False)
+        assert image.size == (offline.width, offline.height)
+        assert location.latitude is not None
+
+        # Network failed once, lookups now go to the pack first
+        assert offline.offline
+        with pytest.raises(Exception):
+            offline.geocode_location("somewhere not in the pack")
+    finally:
+        pack.close()
+
+
+def test_breaker_needs_a_pack(make_service):
+    service = make_service(base_url=dead_url(), retries=0)
+    with pytest.raises(Exception):
+        service.geocode_location("Omaha")
+    # Nothing to fall back to, the next lookup tries the network again
+    assert service.offline_cooldown == 0
+    assert not service.offline
+
+
+def test_slow_server_does_not_open_breaker(make_service):
+    with FakeMapQuest(latency=0.5) as slow:
+        service = make_service(
+            base_url=slow.url, retries=0, read_timeout=0.1,
+            offline_cooldown=30)
+        with pytest.raises(requests.exceptions.ConnectionError) as error:
+            service._get(service.geocode_endpoint, {"location": "Omaha"},
+                         "geocode")
+    assert not never_connected(error.value)
+    assert not service.offline
+
+
+def test_dead_network_opens_breaker(make_service):
+    service = make_service(base_url=dead_url(), retries=0,
+                           offline_cooldown=30)
+    with pytest.raises(requests.exceptions.ConnectionError) as error:
+        service._get(service.geocode_endpoint, {"location": "Omaha"},
+                     "geocode")
+    assert never_connected(error.value)
+    assert service.offline
@@ -0,0 +1,111 @@
+"""
+    Name: test_prefetch.py
+    Author:
+    Created:
+    Purpose: Tests for the background Prefetcher
+"""
+import threading
+import time
+
+from map_service import MAP_TYPES
+from prefetch import Prefetcher
+from quota import QuotaTracker
+
+LOCATION = "615 Mountain View Ave Scottsbluff NE"
+
+
+class RecordingService:
+    """Stand-in MapService that records the views it is asked for."""
+
+    def __init__(self, expected):
+        self.quota = None
+        self.soft_limit_reached = False
+        self.fetched = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def cached_static_map(self, location, zoom, map_type, decode=True):
+        return None
+
+    def get_static_map(self, location, zoom, map_type, decode=True):
+        self.fetched.append((location, zoom, map_type))
+        if len(self.fetched) == self.expected:
+            self.done.set()
+
+
+def neighbours(location, zoom, map_type):
+    views = {(location, z, map_type) for z in (zoom - 1, zoom + 1)}
+    views |= {(location, zoom, other)
+              for other in MAP_TYPES if other != map_type}
+    return views
+
+
+def test_fetches_neighbours_zoom_first():
+    service = RecordingService(expected=len(MAP_TYPES) + 1)
+    prefetcher = Prefetcher(service, delay=0)
+    try:
+        prefetcher.prefetch(LOCATION, 14, "map")
+        assert service.done.wait(5)
+    finally:
+        prefetcher.stop()
+    assert set(service.fetched) == neighbours(LOCATION, 14, "map")
+    assert {zoom for _, zoom, _ in service.fetched[:2]} == {13, 15}
+
+
+def test_stale_views_are_dropped_without_waiting():
+    service = RecordingService(expected=len(MAP_TYPES) + 1)
+    prefetcher = Prefetcher(service, delay=0.2)
+    try:
+        start = time.perf_counter()
+        for zoom in range(5, 15):
+            prefetcher.prefetch(LOCATION, zoom, "map")
+        assert service.done.wait(5)
+        elapsed = time.perf_counter() - start
+    finally:
+        prefetcher.stop()
+    # Only the last view settles, the nine before it cost no delay
+    assert set(service.fetched) == neighbours(LOCATION, 14, "map")
+    assert elapsed < 1.0
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_cached_views_cost_nothing(make_service, fake):
+    quota = QuotaTracker(path=None, monthly_limit=1000)
+    service = make_service(quota=quota)
+    service.get_static_map(LOCATION, 14, "map", decode=False)
+    prefetcher = Prefetcher(service, delay=0, map_types=("map",))
+    try:
+        prefetcher.prefetch(LOCATION, 14, "map")
+        assert wait_for(lambda: prefetcher.budget.used == 2)
+
+        # Both neighbours are cached now, asking again spends nothing
+        fake.reset_stats()
+        prefetcher.prefetch(LOCATION, 14, "map")
+        time.sleep(0.2)
+    finally:
+        prefetcher.stop()
+    assert fake.stats["requests"] == 0
+    assert prefetcher.budget.used == 2
+    for zoom in (13, 15):
+        assert service.cached_static_map(
+            LOCATION, zoom, "map", decode=False) is not None
+
+
+def test_budget_limits_spending(make_service):
+    # A tenth of 20 leaves the prefetcher two maps
+    service = make_service(quota=QuotaTracker(path=None, monthly_limit=20))
+    prefetcher = Prefetcher(service, delay=0)
+    try:
+        prefetcher.prefetch(LOCATION, 14, "map")
+        assert wait_for(lambda: prefetcher.budget.used == 2)
+        time.sleep(0.2)
+    finally:
+        prefetcher.stop()
+    assert prefetcher.budget.monthly_limit == 2
+    assert prefetcher.budget.used == 2
@@ -0,0 +1,103 @@
+"""
+    Name: test_quota.py
+    Author:
+    Created:
+    Purpose: Tests for QuotaTracker and TokenBucket
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from quota import QuotaExceeded, QuotaTracker, TokenBucket
+
+
+def test_record_and_usage():
+    quota = QuotaTracker(path=None, monthly_limit=100)
+    quota.record("geocode")
+    quota.record("map", 3)
+    assert quota.usage() == {"geocode": 1, "map": 3}
+    assert quota.used == 4
+    assert quota.remaining == 96
+
+
+def test_reserve_refuses_past_limit():
+    quota = QuotaTracker(path=None, monthly_limit=5)
+    quota.reserve("map", 4)
+    with pytest.raises(QuotaExceeded):
+        quota.reserve("map", 2)
+    # A refused reservation counts nothing
+    assert quota.used == 4
+    quota.reserve("map")
+    assert quota.remaining == 0
+
+
+def test_soft_limit():
+    quota = QuotaTracker(path=None, monthly_limit=10, soft_limit=0.5)
+    quota.record("map", 4)
+    assert not quota.soft_limit_reached
+    quota.record("map")
+    assert quota.soft_limit_reached
+
+
+def test_trackers_share_a_file(tmp_path):
+    path = str(tmp_path / "quota.db")
+    first = QuotaTracker(path=path)
+    second = QuotaTracker(path=path)
+    first.record("geocode", 2)
+    second.record("map", 3)
+    assert first.used == second.used == 5
+    assert QuotaTracker(path=path).usage() == {"geocode": 2, "map": 3}
+
+
+def test_reserve_is_atomic_across_threads(tmp_path):
+    path = str(tmp_path / "quota.db")
+    trackers = [QuotaTracker(path=path, monthly_limit=50) for _ in range(4)]
+    taken = []
+
+    def take(quota):
+        for _ in range(40):
+            try:
+                quota.reserve("map")
+                taken.append(1)
+            except QuotaExceeded:
+                pass
+
+    threads = [threading.Thread(target=take, args=(quota,))
+               for quota in trackers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(taken) == 50
+    assert trackers[0].used == 50
+
+
+def test_names_keep_separate_counts(tmp_path):
+    path = str(tmp_path / "quota.db")
+    main = QuotaTracker(path=path)
+    prefetch = QuotaTracker(path=path, name="prefetch")
+    main.record("map", 5)
+    prefetch.record("map", 2)
+    assert main.used == 5
+    assert prefetch.used == 2
+
+
+def test_imports_json_counter(tmp_path):
+    legacy = tmp_path / "quota.json"
+    legacy.write_text(json.dumps({
+        "month": time.strftime("%Y-%m"), "counts": {"map": 7}}))
+    quota = QuotaTracker(path=str(tmp_path / "quota.db"))
+    assert quota.usage() == {"map": 7}
+    assert not legacy.exists()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 0.1
+    assert bucket.acquire(timeout=0.5)
+    assert not TokenBucket(rate=0.001, capacity=0).acquire(timeout=0.01)
@@ -0,0 +1,82 @@
+"""
+    Name: test_resize.py
+    Author:
+    Created:
+    Purpose: Tests for serving smaller map sizes from one source image
+"""
+import pytest
+from PIL import Image, ImageOps
+
+LOCATION = "615 Mountain View Ave Scottsbluff NE"
+
+# Marker the fake server draws at the center of every map
+MARKER = (59, 89, 152)
+
+
+def source_image(service):
+    location = service.geocode_location(LOCATION)
+    key = service.static_map_key(location, 14, "map")
+    return service.image_cache.get(key)
+
+
+def center(image):
+    return image.getpixel((image.width // 2, image.height // 2))
+
+
+@pytest.mark.parametrize("mode", ["crop", "scale"])
+def test_sizes_share_one_source(make_service, fake, mode):
+    service = make_service(resize_mode=mode, fetch_size=(1024, 768))
+    image, _ = service.get_static_map(LOCATION, 14, "map")
+    assert image.size == (800, 600)
+
+    fake.reset_stats()
+    for size in ((640, 480), (400, 400), (1024, 768)):
+        service.width, service.height = size
+        image, _ = service.get_static_map(LOCATION, 14, "map")
+        assert image.size == size
+        assert center(image) == MARKER
+    assert fake.stats["requests"] == 0
+    assert source_image(service).size == (1024, 768)
+
+
+def test_crop_is_the_center_of_the_source(make_service):
+    service = make_service(resize_mode="crop", fetch_size=(1024, 768))
+    service.width, service.height = 400, 300
+    image, _ = service.get_static_map(LOCATION, 14, "map")
+    source = source_image(service)
+    expected = source.crop((312, 234, 712, 534))
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_scale_fits_the_whole_source(make_service):
+    service = make_service(resize_mode="scale", fetch_size=(1024, 768))
+    service.width, service.height = 512, 384
+    image, _ = service.get_static_map(LOCATION, 14, "map")
+    expected = ImageOps.fit(source_image(service), (512, 384),
+                            Image.Resampling.LANCZOS)
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_larger_sizes_are_fetched(make_service, fake):
+    service = make_service(resize_mode="crop", fetch_size=(800, 600))
+    service.get_static_map(LOCATION, 14, "map")
+    fake.reset_stats()
+    service.width, service.height = 1280, 600
+    image, _ = service.get_static_map(LOCATION, 14, "map")
+    assert image.size == (1280, 600)
+    assert fake.stats["requests"] == 1
+
+
+def test_without_resize_mode_each_size_is_fetched(make_service, fake):
+    service = make_service()
+    service.get_static_map(LOCATION, 14, "map")
+    fake.reset_stats()
+    service.width, service.height = 640, 480
+    image, _ = service.get_static_map(LOCATION, 14, "map")
+    assert image.size == (640, 480)
+    assert fake.stats["requests"] == 1
+
+
+def test_rejects_unknown_mode(make_service):
+    with pytest.raises(ValueError):
+        make_service(resize_mode="stretch")
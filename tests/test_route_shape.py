@@ -0,0 +1,59 @@
+"""
+    Name: test_route_shape.py
+    Author:
+    Created:
+    Purpose: Tests for the compressed shape codec and simplify
+"""
+import math
+
+from route_shape import decode_polyline, encode_polyline, simplify
+from spatial_index import haversine
+
+# The worked example of the polyline algorithm, 5 decimal places
+EXAMPLE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+EXAMPLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+
+def test_decode_known_example():
+    assert decode_polyline(EXAMPLE, precision=5) == EXAMPLE_POINTS
+
+
+def test_encode_known_example():
+    assert encode_polyline(EXAMPLE_POINTS, precision=5) == EXAMPLE
+
+
+def test_round_trip_cmp6():
+    points = [(41.892762 + i * 0.000137, -103.671906 - i * 0.000291)
+              for i in range(200)]
+    decoded = decode_polyline(encode_polyline(points))
+    assert len(decoded) == len(points)
+    for (lat, lng), (other_lat, other_lng) in zip(points, decoded):
+        assert abs(lat - other_lat) < 1e-6
+        assert abs(lng - other_lng) < 1e-6
+
+
+def test_negative_and_empty():
+    assert decode_polyline("") == []
+    assert encode_polyline([]) == ""
+    points = [(-33.8688, 151.2093), (-33.87, 151.21)]
+    assert decode_polyline(encode_polyline(points, 5), 5) == points
+
+
+def test_simplify_keeps_ends_and_tolerance():
+    points = [(41 + i * 0.0005, -103 + 0.0002 * math.sin(i / 5))
+              for i in range(500)]
+    kept = simplify(points, tolerance=30)
+    assert kept[0] == points[0]
+    assert kept[-1] == points[-1]
+    assert len(kept) < len(points) / 5
+
+
+def test_simplify_straight_line():
+    points = [(40 + i * 0.001, -75.0) for i in range(100)]
+    assert simplify(points, tolerance=1) == [points[0], points[-1]]
+
+
+def test_simplify_short_routes_unchanged():
+    points = [(40.0, -75.0), (40.1, -75.1)]
+    assert simplify(points) == points
+    assert haversine(*points[0], *points[1]) > 0
@@ -0,0 +1,123 @@
+"""
+    Name: test_single_flight.py
+    Author:
+    Created:
+    Purpose: Tests for coalescing identical lookups in flight
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fake_mapquest import FakeMapQuest
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def run_together(flight, key, func, callers=8):
+    """Start one leader, then callers - 1 followers while it runs."""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return func()
+
+    def call():
+        try:
+            return flight.do(key, lookup)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(callers) as executor:
+        futures = [executor.submit(call)]
+        started.wait(5)
+        futures += [executor.submit(call) for _ in range(callers - 1)]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+    return calls, results
+
+
+def test_threads_share_one_lookup():
+    flight = SingleFlight()
+    calls, results = run_together(flight, "key", lambda: "value")
+    assert len(calls) == 1
+    assert results[0] == ("value", False)
+    assert results[1:] == [("value", True)] * 7
+    # Nothing is kept once the lookup is done
+    assert len(flight) == 0
+    assert flight.do("key", lambda: "again") == ("again", False)
+
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    calls, results = run_together(flight, "key", fail, callers=4)
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flight) == 0
+
+
+def test_different_keys_run_apart():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+
+
+def test_async_tasks_share_one_lookup():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        results = await asyncio.gather(
+            *(flight.do("key", lookup) for _ in range(5)))
+        return results, len(flight)
+
+    results, in_flight = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert {value for value, _ in results} == {"value"}
+    assert in_flight == 0
+
+
+def test_async_cancelled_caller_does_not_cancel_others():
+    flight = AsyncSingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", lookup))
+        second = asyncio.ensure_future(flight.do("key", lookup))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ("value", True)
+
+
+def test_service_geocodes_once_for_concurrent_callers(make_service):
+    with FakeMapQuest(latency=0.2) as slow:
+        service = make_service(base_url=slow.url)
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(
+                service.geocode_location, ["Scottsbluff NE"] * 8))
+        assert slow.stats["requests"] == 1
+    assert all(result == results[0] for result in results)
+    assert service.instrumentation.snapshot()["counters"]["coalesced"] == 7
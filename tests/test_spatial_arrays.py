@@ -0,0 +1,46 @@
+"""
+    Name: test_spatial_arrays.py
+    Author:
+    Created:
+    Purpose: Tests for the NumPy distance helpers
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from geocode_result import GeocodeResult  # noqa: E402
+from spatial_arrays import coordinates, haversine_matrix  # noqa: E402
+from spatial_index import haversine  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_coordinates():
+    points = coordinates([GeocodeResult(41.8, -103.6), (40.0, -75.0, 9)])
+    assert points.tolist() == [[41.8, -103.6], [40.0, -75.0]]
+    assert coordinates([]).shape == (0, 2)
+
+
+def test_haversine_matrix_matches_haversine():
+    origins = np.array([[41.8, -103.6], [0.0, 179.9]])
+    destinations = np.array([[41.9, -103.7], [0.0, -179.9], [-33.9, 151.2]])
+    distances = haversine_matrix(origins, destinations)
+    assert distances.shape == (2, 3)
+    for i, origin in enumerate(origins):
+        for j, destination in enumerate(destinations):
+            assert distances[i, j] == pytest.approx(
+                haversine(*origin, *destination))
+
+
+def test_geocode_store_does_not_load_the_http_client():
+    code = ("import sys, geocode_store; "
+            "print(sorted({'requests', 'map_service', 'distance_matrix'}"
+            " & set(sys.modules)))")
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+        text=True, check=True).stdout
+    assert output.strip() == "[]"
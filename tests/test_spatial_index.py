@@ -0,0 +1,73 @@
+"""
+    Name: test_spatial_index.py
+    Author:
+    Created:
+    Purpose: Tests for geohash encoding and GeohashIndex
+"""
+from spatial_index import (
+    GeohashIndex, geohash_cell_size, geohash_encode, haversine)
+
+
+def test_geohash_known_value():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_geohash_cell_size():
+    height, width = geohash_cell_size(7)
+    assert abs(height - 180 / 2 ** 17) < 1e-12
+    assert abs(width - 360 / 2 ** 18) < 1e-12
+
+
+def test_haversine_one_degree_of_latitude():
+    assert abs(haversine(0, 0, 1, 0) - 111195) < 10
+
+
+def test_nearest_within_radius():
+    index = GeohashIndex()
+    index.add("a", 41.8928, -103.6719, "a")
+    index.add("b", 41.8938, -103.6719, "b")
+    item, distance = index.nearest(41.8929, -103.6719, max_distance=50)
+    assert item == "a"
+    assert distance < 15
+    assert index.nearest(42.5, -103.6719, max_distance=50) is None
+
+
+def test_nearest_across_cell_edges():
+    index = GeohashIndex(precision=7)
+    height, _ = geohash_cell_size(7)
+    # Just across the southern edge of the cell holding the query
+    lat, lng = 40.0, -75.0
+    index.add("k", lat - height, lng, "k")
+    assert index.nearest(lat, lng, max_distance=300)[0] == "k"
+
+
+def test_nearest_across_antimeridian():
+    index = GeohashIndex()
+    index.add("east", 10.0, 179.9999, "east")
+    assert index.nearest(10.0, -179.9999, max_distance=100)[0] == "east"
+
+
+def test_readd_moves_key():
+    index = GeohashIndex()
+    index.add("k", 40, -75, "a")
+    index.add("k", 10, 10, "b")
+    assert len(index) == 1
+    assert index.nearest(40, -75) is None
+    assert index.nearest(10, 10)[0] == "b"
+
+
+def test_readd_same_cell_replaces():
+    index = GeohashIndex()
+    index.add("k", 40, -75, "a")
+    index.add("k", 40, -75, "b")
+    assert len(index) == 1
+    assert index.nearest(40, -75)[0] == "b"
+
+
+def test_remove():
+    index = GeohashIndex()
+    index.add("k", 40, -75, "a")
+    assert index.remove("k")
+    assert not index.remove("k")
+    assert len(index) == 0
+    assert index.nearest(40, -75) is None
@@ -0,0 +1,130 @@
+"""
+    Name: test_tile_engine.py
+    Author:
+    Created:
+    Purpose: Tests for the tile math, the tile store and TileCanvas
+"""
+import socket
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from mercator import (TILE_SIZE, lat_lng_to_pixel, pixel_to_lat_lng,
+                      tile_center, visible_tiles)
+
+tk = pytest.importorskip("tkinter")
+
+from tile_engine import RETRY_DELAY, TileCanvas, TileStore  # noqa: E402
+
+LAT, LNG = 41.8666, -103.6672
+
+
+def test_pixel_round_trip():
+    for zoom in (1, 10, 20):
+        x, y = lat_lng_to_pixel(LAT, LNG, zoom)
+        lat, lng = pixel_to_lat_lng(x, y, zoom)
+        assert lat == pytest.approx(LAT)
+        assert lng == pytest.approx(LNG)
+    assert lat_lng_to_pixel(0, -180, 0) == (0, pytest.approx(128))
+
+
+def test_tile_center():
+    lat, lng = tile_center(0, 0, 1)
+    assert lng == pytest.approx(-90)
+    assert lat > 0
+
+
+def test_visible_tiles_cover_the_viewport():
+    center_x, center_y = lat_lng_to_pixel(LAT, LNG, 14)
+    tiles = visible_tiles(center_x, center_y, 800, 600, 14)
+    for px in range(0, 800, 16):
+        for py in range(0, 600, 16):
+            assert any(left <= px < left + TILE_SIZE
+                       and top <= py < top + TILE_SIZE
+                       for _, _, left, top in tiles)
+    # No tile lies fully outside the view
+    for _, _, left, top in tiles:
+        assert -TILE_SIZE < left < 800 and -TILE_SIZE < top < 600
+
+    # The tile under the center comes first
+    _, _, left, top = tiles[0]
+    assert left <= 400 < left + TILE_SIZE
+    assert top <= 300 < top + TILE_SIZE
+
+
+def test_visible_tiles_wrap_and_clamp():
+    # Top left corner of the world at zoom 2, four tiles across
+    tiles = visible_tiles(0, 0, 512, 512, 2)
+    assert {x for x, _, _, _ in tiles} == {3, 0}
+    assert {y for _, y, _, _ in tiles} == {0}
+
+
+def test_tile_store(tmp_path):
+    store = TileStore(str(tmp_path))
+    assert store.get("map", 14, 1, 2) is None
+    store.put("map", 14, 1, 2, b"tile")
+    assert store.get("map", 14, 1, 2) == b"tile"
+    assert store.get("sat", 14, 1, 2) is None
+
+
+def test_get_tile(service, fake):
+    data = service.get_tile(3400, 6100, 14, "map")
+    assert Image.open(BytesIO(data)).size == (TILE_SIZE, TILE_SIZE)
+    assert fake.stats["requests"] == 1
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    yield root
+    root.destroy()
+
+
+def pump(root, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        root.update()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_canvas_fetches_missing_tiles_once(root, service, fake, tmp_path):
+    store = TileStore(str(tmp_path))
+    canvas = TileCanvas(root, service, LAT, LNG, zoom=5, store=store,
+                        width=512, height=512)
+    canvas.pack()
+    assert pump(root, lambda: len(canvas._photos) >= 4
+                and not canvas._in_flight)
+    fetched = fake.stats["requests"]
+    assert fetched == len(canvas._photos)
+
+    # Everything on screen is in memory and on disk now
+    canvas.redraw()
+    root.update()
+    assert not canvas._in_flight
+    assert fake.stats["requests"] == fetched
+    x, y = (int(value // TILE_SIZE) for value in
+            (canvas.center_x, canvas.center_y))
+    assert store.get("map", 5, x, y) is not None
+
+
+def test_canvas_backs_off_failed_tiles(root, make_service, tmp_path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    service = make_service(base_url=dead, retries=0)
+    canvas = TileCanvas(root, service, LAT, LNG, zoom=5,
+                        store=TileStore(str(tmp_path)), width=256,
+                        height=256)
+    canvas.pack()
+    assert pump(root, lambda: canvas._failed and not canvas._in_flight)
+    assert {delay for _, delay in canvas._failed.values()} == {RETRY_DELAY}
+
+    # A redraw inside the delay does not ask again
+    canvas.redraw()
+    assert not canvas._in_flight
@@ -0,0 +1,355 @@
+"""
+    Name: tile_engine.py
+    Author:
+    Created:
+    Purpose: Tile based map rendering with pan and zoom
+    Fixed size Web Mercator tiles are fetched once, kept on disk and
+    stitched together on a Tk canvas, so panning and zooming only
+    request the tiles that are missing
+"""
+import os
+import queue
+import threading
+import time
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageTk
+from map_cache import CACHE_DIR
+from mercator import (MIN_ZOOM, MAX_ZOOM, lat_lng_to_pixel,
+                      pixel_to_lat_lng, visible_tiles)
+
+# Seconds before a failed tile is requested again, doubled after
+# every further failure up to the maximum
+RETRY_DELAY = 2
+MAX_RETRY_DELAY = 60
+
+
+class TileStore:
+    """
+    On-disk tile store laid out as <root>/<map_type>/<zoom>/<x>/<y>.png.
+    Tiles never change for a given key, so there is no expiry.
+    """
+
+    def __init__(self, root=os.path.join(CACHE_DIR, "tiles")):
+        """
+        Initialize the store.
+
+        Args:
+            root (str): Folder that holds the tiles
+        """
+        self.root = root
+
+    def _path(self, map_type, zoom, x, y):
+        """Return the file path of a tile."""
+        return os.path.join(
+            self.root, map_type, str(zoom), str(x), f"{y}.png")
+
+    def get(self, map_type, zoom, x, y):
+        """
+        Read a tile.
+
+        Returns:
+            bytes: The encoded tile, None if it is not stored
+        """
+        try:
+            with open(self._path(map_type, zoom, x, y), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def put(self, map_type, zoom, x, y, data):
+        """Write a tile, replacing any stored copy."""
+        path = self._path(map_type, zoom, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+
+class TileCanvas(tk.Canvas):
+    """
+    A Tk canvas that shows a pannable, zoomable tile map.
+    Drag with the mouse to pan, use the mouse wheel or +/- to zoom.
+    Tiles on screen come from memory, then the TileStore, and only
+    missing tiles are fetched through MapService.get_tile on a
+    small thread pool. Every fetched tile is a static map transaction,
+    so past the quota soft limit only stored tiles are shown, and a
+    tile that failed waits before it is requested again.
+    """
+
+    def __init__(self, parent, map_service, lat, lng, zoom=14,
+                 map_type="map", store=None, max_workers=4,
+                 max_memory_tiles=256, **kwargs):
+        """
+        Initialize the canvas.
+
+        Args:
+            parent: Parent widget
+            map_service (MapService): Service used to fetch tiles
+            lat (float): Latitude of the initial view center
+            lng (float): Longitude of the initial view center
+            zoom (int): Initial zoom level (1-20)
+            map_type (str): Type of map (map, sat, hyb, light, dark)
+            store (TileStore): On-disk tile store, None uses the default
+            max_workers (int): Tiles fetched at the same time
+            max_memory_tiles (int): Tk images kept in memory
+        """
+        kwargs.setdefault("width", 800)
+        kwargs.setdefault("height", 600)
+        kwargs.setdefault("background", "#dddddd")
+        kwargs.setdefault("highlightthickness", 0)
+        super().__init__(parent, **kwargs)
+
+        self.map_service = map_service
+        self.store = store if store is not None else TileStore()
+        self.map_type = map_type
+        self.zoom = zoom
+        self.center_x, self.center_y = lat_lng_to_pixel(lat, lng, zoom)
+        self.max_memory_tiles = max_memory_tiles
+
+        # Tk images by (map_type, zoom, x, y), oldest first
+        self._photos = OrderedDict()
+
+        # Tiles being fetched and fetched tiles waiting for the UI thread
+        self._in_flight = set()
+        self._results = queue.Queue()
+
+        # Failed tiles: key -> (monotonic time to retry, delay)
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tile-fetch")
+        self._poll_id = None
+
+        self._drag_start = None
+
+        self.bind("<Configure>", lambda event: self.redraw())
+        self.bind("<ButtonPress-1>", self._on_press)
+        self.bind("<B1-Motion>", self._on_drag)
+        self.bind("<MouseWheel>", self._on_wheel)
+        # X11 reports the mouse wheel as buttons 4 and 5
+        self.bind("<Button-4>", lambda event: self.zoom_at(1, event))
+        self.bind("<Button-5>", lambda event: self.zoom_at(-1, event))
+        self.bind("<plus>", lambda event: self.zoom_at(1))
+        self.bind("<equal>", lambda event: self.zoom_at(1))
+        self.bind("<minus>", lambda event: self.zoom_at(-1))
+        self.bind("<Destroy>", lambda event: self._shutdown())
+
+    # ------------------------------ VIEW -------------------------------- #
+    @property
+    def center(self):
+        """tuple: (lat, lng) of the view center."""
+        return pixel_to_lat_lng(self.center_x, self.center_y, self.zoom)
+
+    def set_view(self, lat, lng, zoom=None, map_type=None):
+        """
+        Move the view.
+
+        Args:
+            lat (float): Latitude of the new center
+            lng (float): Longitude of the new center
+            zoom (int): New zoom level, None keeps the current one
+            map_type (str): New map type, None keeps the current one
+        """
+        if zoom is not None:
+            self.zoom = max(MIN_ZOOM, min(MAX_ZOOM, int(zoom)))
+        if map_type is not None:
+            self.map_type = map_type
+        self.center_x, self.center_y = lat_lng_to_pixel(lat, lng, self.zoom)
+        self.redraw()
+
+    def zoom_at(self, step, event=None):
+        """
+        Zoom in or out, keeping the point under the mouse fixed.
+
+        Args:
+            step (int): +1 to zoom in, -1 to zoom out
+            event: Mouse event, None zooms around the view center
+        """
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, self.zoom + step))
+        if zoom == self.zoom:
+            return
+
+        # Offset of the anchor point from the view center
+        dx = dy = 0
+        if event is not None:
+            dx = event.x - self.winfo_width() / 2
+            dy = event.y - self.winfo_height() / 2
+
+        scale = 2 ** (zoom - self.zoom)
+        self.center_x = (self.center_x + dx) * scale - dx
+        self.center_y = (self.center_y + dy) * scale - dy
+        self.zoom = zoom
+        self.redraw()
+
+    # ------------------------------ EVENTS ------------------------------ #
+    def _on_press(self, event):
+        """Start a drag and take keyboard focus for +/-."""
+        self.focus_set()
+        self._drag_start = (event.x, event.y)
+
+    def _on_drag(self, event):
+        """Pan the map with the mouse."""
+        if self._drag_start is None:
+            return
+        self.center_x -= event.x - self._drag_start[0]
+        self.center_y -= event.y - self._drag_start[1]
+        self._drag_start = (event.x, event.y)
+        self.redraw()
+
+    def _on_wheel(self, event):
+        """Zoom with the mouse wheel on Windows and macOS."""
+        self.zoom_at(1 if event.delta > 0 else -1, event)
+
+    # ------------------------------ REDRAW ------------------------------ #
+    def redraw(self):
+        """Draw the visible tiles, requesting any that are missing."""
+        width = self.winfo_width()
+        height = self.winfo_height()
+        if width <= 1 or height <= 1:
+            # Not mapped yet, <Configure> will redraw
+            return
+
+        self.delete("tile")
+        missing = []
+        for x, y, left, top in visible_tiles(
+                self.center_x, self.center_y, width, height, self.zoom):
+            key = (self.map_type, self.zoom, x, y)
+            photo = self._photo(key)
+            if photo is not None:
+                self.create_image(
+                    left, top, image=photo, anchor=tk.NW, tags="tile")
+            else:
+                missing.append(key)
+
+        # Each tile costs a transaction, past the soft limit the
+        # quota is left for the static maps
+        limited = bool(missing) and self.map_service.soft_limit_reached
+        if not limited:
+            now = time.monotonic()
+            for key in missing:
+                self._request(key, now)
+
+        # The static map API requires attribution
+        self.delete("attribution")
+        self.create_text(
+            width - 4, height - 4, text="© MapQuest",
+            anchor=tk.SE, tags="attribution")
+        if limited:
+            self.create_text(
+                4, height - 4, anchor=tk.SW, tags="attribution",
+                text="Quota soft limit reached, showing stored tiles only")
+
+    def _photo(self, key):
+        """Return the Tk image for a tile from memory or the store."""
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+            return photo
+
+        data = self.store.get(*key)
+        if data is None:
+            return None
+        return self._remember(key, data)
+
+    def _remember(self, key, data):
+        """Decode a tile into a Tk image and keep it in memory."""
+        photo = ImageTk.PhotoImage(Image.open(BytesIO(data)))
+        self._photos[key] = photo
+        while len(self._photos) > self.max_memory_tiles:
+            self._photos.popitem(last=False)
+        return photo
+
+    # ------------------------------ FETCH ------------------------------- #
+    def _request(self, key, now):
+        """Fetch a missing tile on the thread pool."""
+        # A tile that just failed is not requested on every redraw
+        failed = self._failed.get(key)
+        if failed is not None and now < failed[0]:
+            return
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+        self._executor.submit(self._fetch, key)
+        if self._poll_id is None:
+            self._poll_id = self.after(50, self._poll)
+
+    def _fetch(self, key):
+        """Worker thread body, downloads and stores one tile."""
+        map_type, zoom, x, y = key
+        failed = False
+        try:
+            # Skip tiles that scrolled away while waiting for a thread
+            if zoom != self.zoom or map_type != self.map_type:
+                data = None
+            else:
+                data = self.map_service.get_tile(x, y, zoom, map_type)
+                self.store.put(map_type, zoom, x, y, data)
+        except Exception:
+            data = None
+            failed = True
+        self._results.put((key, data, failed))
+
+    def _poll(self):
+        """Show fetched tiles on the UI thread."""
+        self._poll_id = None
+        changed = False
+        while True:
+            try:
+                key, data, failed = self._results.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._in_flight.discard(key)
+            if failed:
+                # Wait twice as long after every failure in a row
+                delay = RETRY_DELAY
+                if key in self._failed:
+                    delay = min(MAX_RETRY_DELAY, self._failed[key][1] * 2)
+                self._failed[key] = (time.monotonic() + delay, delay)
+            elif data is not None:
+                self._failed.pop(key, None)
+                self._remember(key, data)
+                changed = True
+
+        if changed:
+            self.redraw()
+        with self._lock:
+            busy = bool(self._in_flight)
+        if busy:
+            self._poll_id = self.after(50, self._poll)
+
+    def _shutdown(self):
+        """Stop fetching when the canvas is destroyed."""
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    """
+    Example usage of the TileCanvas.
+    Geocodes the default location and opens a pannable map around it.
+    """
+    from map_service import MapService
+
+    map_service = MapService()
+    location = map_service.geocode_location(
+        "615 Mountain View Ave Scottsbluff NE")
+
+    root = tk.Tk()
+    root.title("MapQuest Tile Viewer")
+    canvas = TileCanvas(
+        root, map_service, location['latitude'], location['longitude'])
+    canvas.pack(fill=tk.BOTH, expand=True)
+    canvas.focus_set()
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()